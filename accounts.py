@@ -0,0 +1,130 @@
+import threading, functools, copy, config, transport, simulator
+from binance.client import Client
+from contextlib import contextmanager
+
+# Every configured account by name, with its client and equity scale, in the configured order
+accounts = {}
+lock = threading.Lock()
+
+# The account the current thread trades for, and the copies of the clients the thread uses
+current = threading.local()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Make the client of an account, every client sends through the shared connection pools
+# Clients are made on first use, making one pings the exchange, so it's kept out of the import
+# With the simulator, the client trades on the in-memory stand-in instead
+def load(account):
+    with lock:
+        if account in accounts:
+            return
+        settings = [settings for settings in config.ACCOUNTS if settings['name'] == account][0]
+        if config.EXCHANGE == "simulator":
+            client = simulator.Client(account)
+        else:
+            # The client sends every call with a timeout of its own, so the configured one is passed to it
+            client = Client(settings['api_key'], settings['api_secret'],
+                            requests_params={"timeout": (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)})
+            transport.mount(client.session)
+        accounts[account] = {"name": account,
+                             "client": client,
+                             "equity_scale": float(settings.get('equity_scale', 1))}
+
+
+# Make the clients of every account ahead of the first signal
+def warm():
+    for account in names():
+        try:
+            load(account)
+
+        # The exchange can't be reached yet, the client is made on the first signal instead
+        except Exception as e:
+            print("client of " + account + " not made: " + str(e))
+
+
+# Get the names of the configured accounts
+def names():
+    return [settings['name'] for settings in config.ACCOUNTS]
+
+
+# Get the name of the account the current thread trades for, the first account by default
+def name():
+    return getattr(current, "name", None) or config.ACCOUNTS[0]['name']
+
+
+# Get the account the current thread trades for
+def active():
+    account = name()
+    if account not in accounts:
+        load(account)
+    return accounts[account]
+
+
+# Get the client of the account the current thread trades for, as a copy made for the thread
+# python-binance keeps the last response on the client, so threads sharing one could read each other's answers,
+# the copies share the connection pools and keys, and cost nothing to make
+def client():
+    account = active()
+    clients = getattr(current, "clients", None)
+    if clients is None:
+        clients = current.clients = {}
+
+    copied = clients.get(account['name'])
+    if copied is None or copied[0] is not account['client']:
+        copied = (account['client'], copy.copy(account['client']))
+        clients[account['name']] = copied
+    return copied[1]
+
+
+# Get a call of the client, made with the copy of the thread that calls it, not of the thread asking for it
+# For calls handed to other threads, like parallel cancels and hedged lookups, which would share a copy otherwise
+def method(attribute):
+    def call(*args, **kwargs):
+        return getattr(client(), attribute)(*args, **kwargs)
+    call.__name__ = attribute
+    return call
+
+
+# Trade for an account while running a block of code
+@contextmanager
+def use(account):
+    previous = getattr(current, "name", None)
+    current.name = account
+    try:
+        yield
+    finally:
+        current.name = previous
+
+
+# Make a function run for the account of the current thread, even when it's called in another thread
+def bound(function):
+    account = name()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with use(account):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# Scale the order equity of a signal for the account the current thread trades for
+# Signals without an order equity use 100%, the scaled equity is never more than 100%
+def scale(data):
+    equity_scale = active()['equity_scale']
+    if equity_scale == 1:
+        return data
+
+    strategy = dict(data['strategy'])
+    strategy['order_equity'] = min(float(strategy.get('order_equity', 100)) * equity_scale, 100)
+    return dict(data, strategy=strategy)
+
+
+# A client that sends every call with the client of the account the current thread trades for
+class ActiveClient:
+
+    def __getattr__(self, attribute):
+        return getattr(client(), attribute)
@@ -0,0 +1,91 @@
+import threading
+from collections import namedtuple, deque
+
+# One conversion step: trade on a symbol with a side, turning from_asset into to_asset
+Leg = namedtuple("Leg", ["symbol", "side", "from_asset", "to_asset"])
+
+# Asset -> list of (neighbour asset, symbol, side), one graph for all pairs and one for margin pairs
+edges = {}
+margin_edges = {}
+routes = {}
+lock = threading.Lock()
+
+# Longest route that will be searched for, ALT -> BTC -> USDT is 2 legs
+MAX_LEGS = 3
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Add a pair to the graph in both directions
+def add_symbol(graph, rules):
+    # Selling the base asset gives the quote asset
+    graph.setdefault(rules.base_asset, []).append((rules.quote_asset, rules.symbol, "SELL"))
+    # Buying the base asset spends the quote asset
+    graph.setdefault(rules.quote_asset, []).append((rules.base_asset, rules.symbol, "BUY"))
+
+
+# Build the asset graph from the SymbolRules table, assets are the nodes and tradable pairs are the edges
+def build(table):
+    global edges, margin_edges, routes
+
+    graph = {}
+    margin_graph = {}
+    for rules in table.values():
+
+        # Skip delisted or halted pairs
+        if rules.status != "TRADING":
+            continue
+
+        add_symbol(graph, rules)
+        if rules.margin_allowed:
+            add_symbol(margin_graph, rules)
+
+    # Swap the graphs, and forget the routes found on the old ones
+    with lock:
+        edges = graph
+        margin_edges = margin_graph
+        routes = {}
+
+
+# Find the route with the least legs between two assets, breadth first
+def search(graph, from_asset, to_asset):
+    previous = {from_asset: None}
+    queue = deque([(from_asset, 0)])
+
+    while queue:
+        asset, depth = queue.popleft()
+
+        # Found, walk back to the start
+        if asset == to_asset:
+            legs = []
+            while previous[asset] is not None:
+                last_asset, symbol, side = previous[asset]
+                legs.append(Leg(symbol, side, last_asset, asset))
+                asset = last_asset
+            return list(reversed(legs))
+
+        if depth == MAX_LEGS:
+            continue
+
+        for next_asset, symbol, side in graph.get(asset, []):
+            if next_asset not in previous:
+                previous[next_asset] = (asset, symbol, side)
+                queue.append((next_asset, depth + 1))
+
+    return None
+
+
+# Get the cheapest route for converting one asset into another
+# Returns a list of legs, an empty list if both assets are the same, or None if there is no route
+def find_route(from_asset, to_asset, margin=False):
+    if from_asset == to_asset:
+        return []
+
+    key = (from_asset, to_asset, margin)
+    if key not in routes:
+        routes[key] = search(margin_edges if margin else edges, from_asset, to_asset)
+
+    return routes[key]
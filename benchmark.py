@@ -0,0 +1,179 @@
+import argparse, json, os, tempfile, time
+import config
+from mock_binance import MockBinance, WEIGHTS
+
+# End-to-end benchmark of the /webhook address against a local stand-in for the Binance API
+# Usage: python benchmark.py --iterations 100 --latency 0.01 --endpoint-latency "POST /api/v3/order=0.03"
+# With --host-latency, more stand-in hosts are started and the calls are routed between them by their pings
+# With --gateway, Spot orders go over the WebSocket API of the stand-in
+
+
+# Make a webhook payload
+def signal(ticker, base, action, market, **strategy):
+    strategy.update({"order_action": action, "market": market})
+    return {"passphrase": config.WEBHOOK_PASSPHRASE, "ticker": ticker, "base_currency": base, "strategy": strategy}
+
+
+# Scenarios as (signal, last trade recorded before every run, or None)
+SCENARIOS = {
+    "spot buy": (signal("BTCUSDT", "USDT", "buy", "spot", order_equity=10), None),
+    "spot sell": (signal("BTCUSDT", "USDT", "sell", "spot"), None),
+    "cross long": (signal("ETHUSDT", "USDT", "buy", "cross", order_equity=10), None),
+    "cross long leverage": (signal("ETHUSDT", "USDT", "buy", "cross", order_equity=10, leverage=2), None),
+    "cross short leverage": (signal("ETHUSDT", "USDT", "sell", "cross", order_equity=10, leverage=2), None),
+    "isolated long leverage": (signal("BNBUSDT", "USDT", "buy", "isolated", order_equity=10, leverage=2), None),
+    "isolated short leverage": (signal("BNBUSDT", "USDT", "sell", "isolated", order_equity=10, leverage=2), None),
+    "overwrite change pairs": (signal("BTCUSDT", "USDT", "buy", "cross", order_equity=10, overwrite=True,
+                                      name="benchmark"),
+                               ("benchmark", "ETHUSDT", "USDT", "CROSS", "BUY")),
+}
+
+
+# Get a percentile of a list of numbers
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+# Point the bot at the stand-ins, this has to happen before main is imported
+def setup(server, hosts=(), gateway=False):
+    from binance.client import Client
+    Client.API_URL = server.url + "/api"
+    Client.MARGIN_API_URL = server.url + "/sapi"
+
+    # Route between the stand-in hosts, if there is more than one
+    config.API_HOSTS = [server.url] + [host.url for host in hosts] if hosts else []
+
+    # The stand-in streams the book tickers and the balances after fills
+    config.STREAM_URL = server.url.replace("http", "ws") + "/ws/"
+    config.REPORT = False
+    config.ASYNC_EXECUTION = False
+
+    config.ORDER_GATEWAY = gateway
+    config.ORDER_GATEWAY_URL = server.url.replace("http", "ws") + "/ws-api/v3"
+
+    # Every run starts from scratch, and leaves no files behind in the working directory
+    directory = tempfile.mkdtemp()
+    config.POSITIONS_DB = os.path.join(directory, "positions.db")
+    config.SNAPSHOT_FILE = os.path.join(directory, "exchange_info.snapshot")
+    config.SHARED_CACHE_FILE = os.path.join(directory, "shared_cache.bin")
+
+    import main
+
+    # Open the order gateway before the first signal
+    if gateway:
+        main.gateway.warm()
+        deadline = time.time() + 5
+        while main.gateway.connection() is None and time.time() < deadline:
+            time.sleep(0.01)
+    return main
+
+
+# Run one scenario, returns the latencies, calls and weight of every signal
+def run(main, server, name, iterations):
+    data, last = SCENARIOS[name]
+    app = main.app.test_client()
+    results = []
+
+    # The first signal loads the caches, it's not measured
+    for i in range(iterations + 1):
+        if last is not None:
+            main.positions.record(*last)
+
+        # The stand-in keeps no balances or debts, so every run starts from its wallets, not the loans booked before
+        main.ledger.reconcile(main.client)
+
+        # Every run is a new alert, not a duplicate
+        data['alert_id'] = name + " " + str(time.time()) + " " + str(i)
+
+        first_call = len(server.calls)
+        start = time.perf_counter()
+        response = app.post("/webhook", data=json.dumps(data))
+        latency = time.perf_counter() - start
+        calls = [endpoint for at, endpoint in server.calls[first_call:]]
+
+        if i > 0:
+            results.append({"latency": latency,
+                            "status": response.status_code,
+                            "code": (response.get_json(silent=True) or {}).get("code"),
+                            "calls": calls,
+                            "weight": sum(WEIGHTS.get(endpoint, 1) for endpoint in calls)})
+    return results
+
+
+# Summarize a scenario
+def summarize(name, results):
+    latencies = [result['latency'] * 1000 for result in results]
+    calls = {}
+    for result in results:
+        for endpoint in result['calls']:
+            calls[endpoint] = calls.get(endpoint, 0) + 1
+
+    return {"scenario": name,
+            "signals": len(results),
+            "errors": sum(1 for result in results if result['status'] != 200 or result['code'] != "success"),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "calls_per_signal": sum(len(result['calls']) for result in results) / len(results),
+            "weight_per_signal": sum(result['weight'] for result in results) / len(results),
+            "calls": {endpoint: count / len(results) for endpoint, count in sorted(calls.items())}}
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Benchmark /webhook against a local Binance stand-in")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every endpoint")
+    parser.add_argument("--endpoint-latency", action="append", default=[],
+                        help='latency of one endpoint, like "POST /api/v3/order=0.02"')
+    parser.add_argument("--host-latency", action="append", type=float, default=[],
+                        help="start another stand-in host with this latency added to every endpoint")
+    parser.add_argument("--gateway", action="store_true", help="send Spot orders over the WebSocket API")
+    parser.add_argument("--scenario", action="append", help="only run these scenarios")
+    parser.add_argument("--verbose", action="store_true", help="show the calls per signal of every endpoint")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    latency = {}
+    for item in args.endpoint_latency:
+        endpoint, seconds = item.rsplit("=", 1)
+        latency[endpoint] = float(seconds)
+
+    server = MockBinance(latency=latency, default_latency=args.latency).start()
+    hosts = [MockBinance(latency=latency, default_latency=host_latency, shared=server).start()
+             for host_latency in args.host_latency]
+    main = setup(server, hosts, args.gateway)
+
+    summaries = []
+    print("%-26s %7s %7s %9s %9s %9s %7s %8s" % ("scenario", "signals", "errors", "p50 ms", "p95 ms", "p99 ms",
+                                                 "calls", "weight"))
+    for name in args.scenario or SCENARIOS:
+        summary = summarize(name, run(main, server, name, args.iterations))
+        summaries.append(summary)
+        print("%-26s %7d %7d %9.2f %9.2f %9.2f %7.1f %8.1f" % (name, summary['signals'], summary['errors'],
+                                                               summary['p50_ms'], summary['p95_ms'],
+                                                               summary['p99_ms'], summary['calls_per_signal'],
+                                                               summary['weight_per_signal']))
+        if args.verbose:
+            for endpoint, count in summary['calls'].items():
+                print("    %-40s %5.1f" % (endpoint, count))
+
+    # Where the calls went
+    if hosts:
+        for netloc, host in main.endpoints.stats()['hosts'].items():
+            print("    %-24s rtt %8s ms  calls %6d  failovers %3d  %s" % (netloc, host['rtt_ms'], host['calls'],
+                                                                       host['failovers'],
+                                                                       "healthy" if host['healthy'] else "down"))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+    server.shutdown()
+    for host in hosts:
+        host.shutdown()
+
+
+if __name__ == "__main__":
+    main_benchmark()
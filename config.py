@@ -8,5 +8,162 @@ DISCORD_GROUP_ID = "INSERT GROUP ID HERE"
 DISCORD_LINK = f"https://discord.com/api/v9/channels/{DISCORD_GROUP_ID}/messages"
 DISCORD_HEADER = {"authorization": "INSERT AUTH KEY HERE"}
 
+# Exchange the signals trade on, "binance", or "simulator" for paper trading on the in-memory stand-in
+# of simulator.py, which never touches Binance, see replay.py for feeding it recorded signals and prices
+EXCHANGE = "binance"
+
+# Pairs of the simulator, as (symbol, base asset, quote asset, starting price, step size, tick size)
+SIMULATOR_PAIRS = [
+    ("BTCUSDT", "BTC", "USDT", 30000.0, "0.00001000", "0.01000000"),
+    ("ETHUSDT", "ETH", "USDT", 2000.0, "0.00010000", "0.01000000"),
+    ("ETHBTC", "ETH", "BTC", 0.066, "0.00010000", "0.00000100"),
+    ("BNBUSDT", "BNB", "USDT", 300.0, "0.00100000", "0.10000000"),
+]
+# Starting balances of every simulated wallet, Isolated pairs only get the assets of the pair
+SIMULATOR_BALANCES = {"USDT": 10000.0}
+# Commission of simulated fills, taken from the asset received
+SIMULATOR_COMMISSION = 0.001
+# Margin ratio reported for simulated Isolated pairs, and the lowest assets to debts ratio a loan may leave
+SIMULATOR_ISOLATED_MARGIN_RATIO = 5
+SIMULATOR_MIN_MARGIN_LEVEL = 1.1
+# Asset the simulated wallets are valued in
+SIMULATOR_VALUATION_ASSET = "USDT"
+
+# Accounts every signal is executed on, at the same time, the first one is the default account
+# equity_scale multiplies the order_equity of the signal for the account
+ACCOUNTS = [
+    {"name": "main", "api_key": API_KEY, "api_secret": API_SECRET, "equity_scale": 1.0},
+]
+# Threads for executing a signal on several accounts at the same time
+ACCOUNT_WORKERS = 16
+# Threads for fetching the wallet and price, and cancelling orders, before a signal trades
+PRETRADE_WORKERS = 16
+
 STOP_LIMIT_DIFFERENCE = 0.1
-STOP_LOSS = 0
\ No newline at end of file
+STOP_LOSS = 0
+# Seconds between background refreshes of the cached exchange info
+EXCHANGE_INFO_TTL = 3600
+
+# File the exchange info is saved to after every load, and restored from when a worker starts
+# Set it to a path that survives restarts, or to None to always load it from the exchange, only used for Binance
+SNAPSHOT_FILE = "exchange_info.snapshot"
+
+# Websocket address of the Binance streams, a listen key or stream name is added at the end
+STREAM_URL = "wss://stream.binance.com:9443/ws/"
+
+# Seconds between REST reloads of the balance ledger, the user data stream keeps it current in between
+LEDGER_RECONCILE_INTERVAL = 300
+# Seconds to wait for the user data stream to report a filled or cancelled order, before reloading over REST
+LEDGER_UPDATE_TIMEOUT = 1.0
+# Seconds a REST load of a wallet is used for while its user data stream is down, before loading it again
+LEDGER_REST_MAX_AGE = 3
+
+# Share the exchange info and prices between the gunicorn workers through a memory mapped file
+# One worker loads and streams them, the others read them from the file, needs fcntl, so not on Windows
+# Only used for Binance, the simulator keeps its pairs and prices to itself
+SHARED_CACHE = True
+SHARED_CACHE_FILE = "shared_cache.bin"
+SHARED_CACHE_SIZE = 16 * 1024 * 1024
+# Pairs the shared file has room for prices of
+SHARED_PRICE_SLOTS = 1024
+# Seconds between attempts of the other workers to take over, when the leading worker is gone
+SHARED_CACHE_LEAD_RETRY = 5
+
+# Seconds a streamed price stays usable for sizing orders, older prices are fetched over REST
+PRICE_MAX_AGE = 2.0
+
+# Answer webhooks right away with a job id, and execute the signals in the background
+ASYNC_EXECUTION = False
+# Worker threads executing queued signals
+JOB_WORKERS = 8
+# Most signals that can be queued or running at once, new ones are refused when it's full
+JOB_QUEUE_SIZE = 256
+# How many jobs are remembered for the /jobs/<id> address
+JOB_HISTORY = 1000
+
+# Payload field with the id of a signal, only signals with one are checked for duplicates
+INGEST_ID_FIELD = "alert_id"
+# Seconds an id is remembered for, in the positions database, a signal with an id seen again is dropped
+INGEST_DEDUPE_TTL = 60
+# Seconds signals for the same pair, market and strategy are collected for, only the latest of them is executed
+# Every signal waits this long before trading, 0 executes them right away
+COALESCE_WINDOW = 0
+# How many dropped signals are remembered for the /signals address
+INGEST_HISTORY = 200
+
+# Client order ids of the orders placed by the bot start with this tag
+ORDER_TAG = "mbot-"
+# Seconds to wait for the answer to an order or loan, before looking it up instead
+ORDER_TIMEOUT = 2
+# Times an order is sent again, with the same client order id, when no connection could be made to send it
+ORDER_RETRIES = 1
+# Seconds to look for an order that timed out, before giving up on it
+ORDER_LOOKUP_DEADLINE = 3
+# Seconds to wait for a lookup before sending the same lookup again, and the most lookups sent per order
+ORDER_LOOKUP_HEDGE_DELAY = 0.3
+ORDER_LOOKUP_HEDGES = 3
+# Threads for the lookups
+ORDER_LOOKUP_WORKERS = 8
+# Only cancel the bot's own tagged orders, instead of every open order on the pair
+CANCEL_OWN_ORDERS_ONLY = False
+# Threads for cancelling the bot's own orders in parallel
+CANCEL_WORKERS = 4
+
+# Seconds to wait for connecting to, and for an answer from, Binance and Discord
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 10
+# Hosts with their own connection pool, and kept-alive connections per host
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_SIZE = 16
+# Send the Discord reports over HTTP/2, needs httpx[http2] installed
+HTTP2 = False
+
+# Send Spot orders over the WebSocket API of the exchange, on a connection kept open per account
+# REST is used while the connection is down, Margin orders always use REST
+ORDER_GATEWAY = False
+ORDER_GATEWAY_URL = "wss://ws-api.binance.com:443/ws-api/v3"
+
+# Equivalent REST hosts of the exchange, calls go to the fastest healthy one, the first is used until they are pinged
+# Empty to always use the host of the client
+API_HOSTS = ["https://api.binance.com", "https://api-gcp.binance.com", "https://api1.binance.com",
+             "https://api2.binance.com", "https://api3.binance.com", "https://api4.binance.com"]
+# Paths of the calls routed between the hosts
+ENDPOINT_PATHS = ("/api/", "/sapi/")
+# Seconds between pings of every host, and to wait for a ping
+ENDPOINT_PROBE_INTERVAL = 10
+ENDPOINT_PROBE_TIMEOUT = 2
+# Weight of the newest ping and call in the smoothed round trip time and error rate
+ENDPOINT_SMOOTHING = 0.2
+# Failed calls in a row, or smoothed error rate, that take a host out until it answers pings again
+ENDPOINT_MAX_FAILURES = 3
+ENDPOINT_MAX_ERROR_RATE = 0.5
+# A faster host replaces the preferred one only if its round trip time is this part of it or less
+ENDPOINT_SWITCH_RATIO = 0.8
+
+# Seconds of reports collected into a single Discord message
+REPORT_WINDOW = 2.0
+# Most reports waiting to be sent, the rest are saved to the spill file, or dropped if it's empty
+REPORT_QUEUE_SIZE = 500
+REPORT_SPILL_FILE = "reports.jsonl"
+# Attempts at sending a Discord message, before it's dropped
+REPORT_RETRIES = 5
+
+# Let the exchange borrow and repay along with margin orders (MARGIN_BUY and AUTO_REPAY side effects),
+# instead of separate loan and repay calls, the separate calls are still used if the exchange refuses
+MARGIN_SIDE_EFFECTS = True
+# Error codes of the exchange refusing to borrow or repay along with an order, nothing was placed then,
+# so the order is sent again without the side effect, any other failure stops the signal instead
+MARGIN_SIDE_EFFECT_REFUSED = (-2010, -3006, -3041, -3045, -11008)
+
+# SQLite database with the last trade of every strategy and market
+POSITIONS_DB = "positions.db"
+
+# Exchange rate limits per interval, the bot slows down before reaching them
+RATE_LIMITS = {
+    "REQUEST_WEIGHT": {"1M": 6000},
+    "ORDERS": {"10S": 100, "1D": 200000},
+    "SAPI_IP_WEIGHT": {"1M": 12000},
+    "SAPI_UID_WEIGHT": {"1M": 180000},
+}
+# Part of every limit new entries may use, the rest is kept for cancels, exits, repays and stop-limits
+RATE_LIMIT_ENTRY_SHARE = 0.8
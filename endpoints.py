@@ -0,0 +1,178 @@
+import threading, time, config, requests, metrics
+
+# Equivalent REST hosts of the exchange, with their health
+# rtt is the smoothed round trip time of the pings, errors the smoothed share of failed calls
+hosts = {}
+
+# The host every call to the exchange goes to, until a faster or healthier one is found
+preferred = None
+prober = None
+
+lock = threading.Lock()
+
+# Pings go around the connection pools of the bot, so they never get rerouted
+probe_session = requests.Session()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the host part of an address
+def netloc_of(url):
+    return requests.utils.urlparse(url).netloc
+
+
+# Set up the configured hosts, the first one is preferred until the pings say otherwise
+def load():
+    global preferred
+
+    with lock:
+        if hosts:
+            return
+        for url in config.API_HOSTS:
+            hosts[netloc_of(url)] = {"url": url.rstrip("/"), "rtt": None, "errors": 0.0, "failures": 0,
+                                     "healthy": True, "calls": 0, "failovers": 0, "probed_at": None}
+        if hosts:
+            preferred = netloc_of(config.API_HOSTS[0])
+
+
+# Check if a call is routed between the configured hosts
+def managed(url):
+    if not config.API_HOSTS:
+        return False
+    load()
+    return url.netloc in hosts and url.path.startswith(config.ENDPOINT_PATHS)
+
+
+# Get the host for a call, the preferred one if it's healthy, else the fastest healthy one that wasn't tried
+# Returns None if every host was tried
+def choose(tried=()):
+    with lock:
+        if preferred not in tried and hosts[preferred]['healthy']:
+            return preferred
+        candidates = [netloc for netloc in hosts if netloc not in tried]
+        if not candidates:
+            return None
+
+        # Healthy first, then the fastest, hosts that were never pinged go last
+        return min(candidates, key=lambda netloc: (not hosts[netloc]['healthy'],
+                                                   hosts[netloc]['rtt'] is None,
+                                                   hosts[netloc]['rtt'] or 0))
+
+
+# Send a call to another host, keeping the path and the signed query
+def reroute(url, netloc):
+    parsed = requests.utils.urlparse(url)
+    return parsed._replace(scheme=requests.utils.urlparse(hosts[netloc]['url']).scheme, netloc=netloc).geturl()
+
+
+# Record how a call or ping to a host went, a host with too many errors is left until it answers pings again
+def record(netloc, ok, rtt=None):
+    with lock:
+        host = hosts[netloc]
+        host['calls'] += 1
+        host['errors'] += config.ENDPOINT_SMOOTHING * ((0.0 if ok else 1.0) - host['errors'])
+        host['failures'] = 0 if ok else host['failures'] + 1
+        if rtt is not None:
+            host['rtt'] = rtt if host['rtt'] is None else \
+                host['rtt'] + config.ENDPOINT_SMOOTHING * (rtt - host['rtt'])
+
+        if not ok and (host['failures'] >= config.ENDPOINT_MAX_FAILURES or
+                       host['errors'] > config.ENDPOINT_MAX_ERROR_RATE):
+            host['healthy'] = False
+        elif ok and rtt is not None and host['failures'] == 0 and host['errors'] <= config.ENDPOINT_MAX_ERROR_RATE:
+            host['healthy'] = True
+
+    if rtt is not None:
+        metrics.gauge("endpoint_rtt_seconds", hosts[netloc]['rtt'], host=netloc)
+    metrics.gauge("endpoint_healthy", 1 if hosts[netloc]['healthy'] else 0, host=netloc)
+
+
+# Move to another host right away when a host couldn't answer a call, it's left until it answers pings again
+# Returns the host to send the call to next, or None if every host was tried
+def fail_over(netloc, tried):
+    global preferred
+
+    record(netloc, False)
+    with lock:
+        hosts[netloc]['healthy'] = False
+        hosts[netloc]['failovers'] += 1
+    replacement = choose(tried)
+    with lock:
+        if replacement is not None and netloc == preferred:
+            preferred = replacement
+    metrics.count("endpoint_failovers_total", host=netloc)
+    return replacement
+
+
+# Ping a host and record its round trip time
+def probe(netloc):
+    start = time.perf_counter()
+    try:
+        response = probe_session.get(hosts[netloc]['url'] + "/api/v3/ping", timeout=config.ENDPOINT_PROBE_TIMEOUT)
+        ok = response.status_code == 200
+    except requests.exceptions.RequestException:
+        ok = False
+    rtt = time.perf_counter() - start
+
+    record(netloc, ok, rtt if ok else None)
+
+    # A host that doesn't answer pings is left right away
+    with lock:
+        hosts[netloc]['probed_at'] = time.time()
+        if not ok:
+            hosts[netloc]['healthy'] = False
+
+
+# Pick the fastest healthy host, the preferred one is only replaced by a clearly faster one, so it doesn't flap
+def reselect():
+    global preferred
+
+    with lock:
+        healthy = [netloc for netloc in hosts if hosts[netloc]['healthy'] and hosts[netloc]['rtt'] is not None]
+        if not healthy:
+            return
+        fastest = min(healthy, key=lambda netloc: hosts[netloc]['rtt'])
+        current = hosts[preferred]
+        if not current['healthy'] or current['rtt'] is None or \
+                hosts[fastest]['rtt'] < current['rtt'] * config.ENDPOINT_SWITCH_RATIO:
+            preferred = fastest
+
+
+# Ping every host regularly and move to the fastest healthy one
+def probe_loop():
+    while True:
+        for netloc in list(hosts):
+            probe(netloc)
+        reselect()
+        time.sleep(config.ENDPOINT_PROBE_INTERVAL)
+
+
+# Start pinging the hosts in the background, once
+def start():
+    global prober
+
+    if prober is not None or not config.API_HOSTS:
+        return
+    with lock:
+        if prober is not None:
+            return
+        prober = threading.Thread(target=probe_loop, name="endpoint probe", daemon=True)
+        prober.start()
+
+
+# Get the latency and health of every host
+def stats():
+    load()
+    with lock:
+        return {"preferred": preferred,
+                "hosts": {netloc: {"url": host['url'],
+                                   "rtt_ms": None if host['rtt'] is None else round(host['rtt'] * 1000, 3),
+                                   "error_rate": round(host['errors'], 4),
+                                   "healthy": host['healthy'],
+                                   "calls": host['calls'],
+                                   "failovers": host['failovers'],
+                                   "probed_at": host['probed_at']}
+                          for netloc, host in hosts.items()}}
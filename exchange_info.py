@@ -0,0 +1,177 @@
+import os, pickle, threading, time, config, asset_graph, metrics, quantizer, shared_cache
+from collections import namedtuple
+
+# Trading rules of a single pair, precomputed from the exchange filters
+# The quantizer has the exact filters, for rounding order quantities and prices
+SymbolRules = namedtuple("SymbolRules", ["symbol", "base_asset", "quote_asset", "status",
+                                         "step_size", "min_quantity", "tick_size", "min_notional",
+                                         "quantizer", "margin_allowed"])
+
+# In-memory rules table, replaced as a whole on every refresh
+# With several workers only the leading one loads it, the others read single pairs from the shared cache
+rules = {}
+loaded_at = 0.0
+lock = threading.Lock()
+refresher = None
+
+# Version of the shared rules the asset graph was last built from
+graph_version = None
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Turn a single symbol from the exchange info into a SymbolRules record
+def parse_symbol(symbol_info):
+    step_size = 0.0
+    min_quantity = 0.0
+    tick_size = 0.0
+    min_notional = 0.0
+
+    for rule in symbol_info['filters']:
+
+        # Quantity rules
+        if rule['filterType'] == "LOT_SIZE":
+            step_size = float(rule['stepSize'])
+            min_quantity = float(rule['minQty'])
+
+        # Price rules
+        elif rule['filterType'] == "PRICE_FILTER":
+            tick_size = float(rule['tickSize'])
+
+        # Minimum base currency amount requirements (NOTIONAL replaced MIN_NOTIONAL on newer pairs)
+        elif rule['filterType'] in ("MIN_NOTIONAL", "NOTIONAL"):
+            min_notional = float(rule['minNotional'])
+
+    return SymbolRules(symbol_info['symbol'], symbol_info['baseAsset'], symbol_info['quoteAsset'],
+                       symbol_info['status'], step_size, min_quantity, tick_size, min_notional,
+                       quantizer.build(symbol_info['filters']), bool(symbol_info.get('isMarginTradingAllowed', False)))
+
+
+# Load the rules of every pair with a single exchange info request
+def load(client):
+    global rules, loaded_at
+
+    exchange_info = client.get_exchange_info()
+    table = {}
+    for symbol_info in exchange_info['symbols']:
+        table[symbol_info['symbol']] = parse_symbol(symbol_info)
+
+    # Swap the whole table, so readers never see a half built one
+    with lock:
+        rules = table
+        loaded_at = time.time()
+
+    # Rebuild the asset conversion graph from the new table, and share the table with the other workers
+    asset_graph.build(table)
+    shared_cache.publish_rules(table, loaded_at)
+    save_snapshot(table, loaded_at)
+
+    return table
+
+
+# Save the rules table to a file, so a restarted worker can start trading with it right away
+# Only for Binance, the pairs of the simulator never end up in a snapshot of the real exchange, or the other way
+def save_snapshot(table, at):
+    if not config.SNAPSHOT_FILE or config.EXCHANGE != "binance":
+        return
+
+    # Written next to it first, so a worker never reads a half written snapshot
+    temporary = config.SNAPSHOT_FILE + "." + str(os.getpid())
+    try:
+        with open(temporary, "wb") as f:
+            pickle.dump({"loaded_at": at, "rules": table}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, config.SNAPSHOT_FILE)
+    except OSError as e:
+        print("exchange info snapshot failed: " + str(e))
+
+
+# Restore the rules table from the snapshot, if it's not too old, the refresher revalidates it in the background
+# Workers following the shared cache read from it instead
+def restore():
+    global rules, loaded_at
+
+    if not config.SNAPSHOT_FILE or config.EXCHANGE != "binance":
+        return False
+    if shared_cache.following() and shared_cache.rules_version() is not None:
+        return False
+
+    try:
+        with open(config.SNAPSHOT_FILE, "rb") as f:
+            snapshot = pickle.load(f)
+
+    # No snapshot yet, or one from an older version of the bot
+    except Exception as e:
+        print("exchange info snapshot not restored: " + str(e))
+        return False
+
+    if time.time() - snapshot['loaded_at'] > config.EXCHANGE_INFO_TTL * 2:
+        return False
+
+    with lock:
+        rules = snapshot['rules']
+        loaded_at = snapshot['loaded_at']
+    asset_graph.build(rules)
+    shared_cache.publish_rules(rules, loaded_at)
+    return True
+
+
+# Keep reloading the exchange info in the background, unless another worker does it
+# Revalidating loads it right away, for a table restored from the snapshot
+def refresh_loop(client, revalidate=False):
+    while True:
+        if not revalidate:
+            time.sleep(config.EXCHANGE_INFO_TTL)
+        revalidate = False
+        if shared_cache.following():
+            continue
+        try:
+            load(client)
+
+        # Keep the old table if the refresh fails, it will be retried on the next cycle
+        except Exception as e:
+            print("exchange info refresh failed: " + str(e))
+
+
+# Start the background refresher once
+def start(client, revalidate=False):
+    global refresher
+
+    with lock:
+        if refresher is not None:
+            return
+        refresher = threading.Thread(target=refresh_loop, args=(client, revalidate), daemon=True)
+    refresher.start()
+
+
+# Build the asset graph from the shared rules, if they changed since it was last built
+def follow_graph():
+    global graph_version
+
+    version = shared_cache.rules_version()
+    if version is not None and version != graph_version:
+        graph_version = version
+        asset_graph.build(dict(shared_cache.all_rules()))
+
+
+# Get the rules of a pair, loading the table if it's empty or expired
+# Workers following the shared cache read the pair from it, and only load the table if it has none
+@metrics.timed("symbol rules")
+def get_rules(client, symbol):
+    if shared_cache.following():
+        shared = shared_cache.get_rules(symbol)
+        if shared is not shared_cache.MISSING:
+            follow_graph()
+            return shared
+
+    if not rules or time.time() - loaded_at > config.EXCHANGE_INFO_TTL * 2:
+        load(client)
+        start(client)
+
+    # Restored from the snapshot, and not revalidated yet
+    elif refresher is None:
+        start(client, revalidate=True)
+
+    return rules.get(symbol)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+# What a filled order did to the account
+# base_delta and quote_delta are the balance changes of the pair assets, after commission
+Fill = namedtuple("Fill", ["side", "avg_price", "executed_qty", "quote_qty",
+                           "base_delta", "quote_delta", "commissions"])
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Work out a Fill from a FULL order response
+def summarize(order, base_asset, quote_asset):
+    executed_qty = float(order['executedQty'])
+    quote_qty = float(order['cummulativeQuoteQty'])
+
+    # Commission paid per asset, and the average price from the fills
+    commissions = {}
+    filled = 0.0
+    spent = 0.0
+    for fill in order.get('fills', []):
+        price = float(fill['price'])
+        quantity = float(fill['qty'])
+        filled += quantity
+        spent += price * quantity
+        asset = fill['commissionAsset']
+        commissions[asset] = commissions.get(asset, 0.0) + float(fill['commission'])
+
+    if filled > 0:
+        avg_price = spent / filled
+    elif executed_qty > 0:
+        avg_price = quote_qty / executed_qty
+    else:
+        avg_price = 0.0
+
+    # Buying adds the asset and spends the base currency, selling does the opposite
+    if order['side'] == "BUY":
+        base_delta = executed_qty
+        quote_delta = -quote_qty
+    else:
+        base_delta = -executed_qty
+        quote_delta = quote_qty
+
+    # Commission is taken from the asset received, unless it's paid in another asset like BNB
+    base_delta -= commissions.get(base_asset, 0.0)
+    quote_delta -= commissions.get(quote_asset, 0.0)
+
+    return Fill(order['side'], avg_price, executed_qty, quote_qty, base_delta, quote_delta, commissions)
+
+
+# Get the amount received from a filled order, the asset when buying, the base currency when selling
+def received(fill):
+    if fill.side == "BUY":
+        return fill.base_delta
+    return fill.quote_delta
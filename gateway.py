@@ -0,0 +1,172 @@
+import threading, time, json, hmac, hashlib, itertools, config, requests, metrics, governor, accounts, stream
+from urllib.parse import urlencode
+from binance.exceptions import BinanceAPIException
+
+# Spot orders over the WebSocket API of the exchange, on a connection kept open per account
+# Requests are pipelined on the connection and their answers matched by id, every request is signed,
+# and REST is used whenever the connection is down
+# The WebSocket API has no Margin orders, those always go over REST
+
+# Connection of every account
+connections = {}
+
+# Requests waiting for their answer, by id, as {"answer", "event", "connection"}
+pending = {}
+ids = itertools.count(1)
+
+lock = threading.Lock()
+
+# Rate limits reported in the answers, as the REST headers the governor reads
+LIMIT_HEADERS = {"REQUEST_WEIGHT": "x-mbx-used-weight-", "ORDERS": "x-mbx-order-count-"}
+INTERVAL_UNITS = {"SECOND": "s", "MINUTE": "m", "HOUR": "h", "DAY": "d"}
+
+# REST endpoint of every method, for the rate limits
+ENDPOINTS = {"order.place": "POST /api/v3/order",
+             "order.status": "GET /api/v3/order",
+             "order.cancel": "DELETE /api/v3/order",
+             "openOrders.cancelAll": "DELETE /api/v3/openOrders"}
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the connection of the account the current thread trades for, opening it on first use
+# Returns None if the gateway is off or the connection isn't open yet, the simulator is always traded on directly
+def connection():
+    if not config.ORDER_GATEWAY or config.EXCHANGE == "simulator":
+        return None
+
+    account = accounts.name()
+    with lock:
+        connected = connections.get(account)
+        if connected is None:
+            connected = stream.Stream(config.ORDER_GATEWAY_URL, received, name="order gateway " + account,
+                                      on_close=dropped).start()
+            connections[account] = connected
+
+    if not connected.connected:
+        return None
+    return connected
+
+
+# Open the connections of every account ahead of the first order
+def warm():
+    for account in accounts.names():
+        with accounts.use(account):
+            connection()
+
+
+# Match an answer to the request waiting for it
+def received(message):
+    with lock:
+        waiting = pending.pop(str(message.get('id')), None)
+    if waiting is None:
+        return
+    waiting['answer'] = message
+    waiting['event'].set()
+
+
+# Fail the requests waiting on a connection that dropped, so they don't wait for their timeout
+def dropped(connected):
+    with lock:
+        lost = [waiting for waiting in pending.values() if waiting['connection'] is connected]
+        for key in [key for key, waiting in pending.items() if waiting['connection'] is connected]:
+            del pending[key]
+    for waiting in lost:
+        waiting['event'].set()
+
+
+# Sign the parameters of a request with the keys of the account
+def sign(params):
+    client = accounts.client()
+    params = dict(params, apiKey=client.API_KEY,
+                  timestamp=int(time.time() * 1000 + getattr(client, "timestamp_offset", 0)))
+    params = dict(sorted(params.items()))
+    params['signature'] = hmac.new(client.API_SECRET.encode(), urlencode(params).encode(),
+                                   hashlib.sha256).hexdigest()
+    return params
+
+
+# Track the rate limits from an answer
+def update_limits(answer):
+    headers = {}
+    for limit in answer.get('rateLimits', []):
+        prefix = LIMIT_HEADERS.get(limit.get('rateLimitType'))
+        unit = INTERVAL_UNITS.get(limit.get('interval'))
+        if prefix and unit:
+            headers[prefix + str(limit['intervalNum']) + unit] = limit['count']
+    governor.update(answer.get('status', 200), headers)
+
+
+# Send a request over the connection of the account, and wait for its answer
+# Returns None if the connection is down and the request wasn't sent, it goes over REST instead then
+# Raises like the REST client does, a timeout or a dropped connection raise like requests, so orders can look it up
+def request(method, params, timeout):
+    connected = connection()
+    if connected is None:
+        return None
+
+    governor.acquire(ENDPOINTS[method])
+    key = str(next(ids))
+    waiting = {"answer": None, "event": threading.Event(), "connection": connected}
+    with lock:
+        pending[key] = waiting
+
+    endpoint = "WS " + method
+    metrics.count("exchange_calls_total", endpoint=endpoint)
+    start = time.perf_counter()
+    try:
+        if not connected.send({"id": key, "method": method, "params": sign(params)}):
+            with lock:
+                pending.pop(key, None)
+            return None
+
+        if not waiting['event'].wait(timeout):
+            with lock:
+                pending.pop(key, None)
+            raise requests.exceptions.ReadTimeout(method + " timed out on the order gateway")
+    finally:
+        metrics.observe("exchange_call_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+    answer = waiting['answer']
+    if answer is None:
+        raise requests.exceptions.ConnectionError(method + " lost with the order gateway connection")
+
+    update_limits(answer)
+    if answer.get('status') != 200:
+        raise BinanceAPIException(None, answer.get('status'), json.dumps(answer.get('error', {})))
+    return answer['result']
+
+
+# Send a call over the gateway, or over REST if the gateway is down
+def call(method, rest, params):
+    requests_params = params.pop('requests_params', None) or {}
+    timeout = requests_params.get('timeout', config.HTTP_READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        timeout = timeout[-1]
+
+    result = request(method, params, timeout)
+    if result is None:
+        if requests_params:
+            params['requests_params'] = requests_params
+        return rest(**params)
+    return result
+
+
+# The Spot order calls of the client, sent over the gateway
+def create_order(**params):
+    return call("order.place", accounts.client().create_order, params)
+
+
+def get_order(**params):
+    return call("order.status", accounts.client().get_order, params)
+
+
+def cancel_order(**params):
+    return call("order.cancel", accounts.client().cancel_order, params)
+
+
+def cancel_all_open_orders(**params):
+    return call("openOrders.cancelAll", accounts.client().cancel_all_open_orders, params)
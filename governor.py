@@ -0,0 +1,199 @@
+import threading, time, functools, config, metrics, accounts
+from contextlib import contextmanager
+
+# Request priorities, protective requests (cancels, exits, repays, stop-limits) go before new entries
+PROTECTIVE = "protective"
+ENTRY = "entry"
+
+# Rate limit headers, and the limit and interval they report
+HEADERS = {
+    "x-mbx-used-weight-1m": ("REQUEST_WEIGHT", "1M"),
+    "x-mbx-order-count-10s": ("ORDERS", "10S"),
+    "x-mbx-order-count-1d": ("ORDERS", "1D"),
+    "x-sapi-used-ip-weight-1m": ("SAPI_IP_WEIGHT", "1M"),
+    "x-sapi-used-uid-weight-1m": ("SAPI_UID_WEIGHT", "1M"),
+}
+
+# Interval lengths in seconds
+INTERVALS = {"1S": 1, "10S": 10, "1M": 60, "1H": 3600, "1D": 86400}
+
+# Estimated weight of the endpoints the bot uses, the rest count as 1
+WEIGHTS = {
+    "GET /api/v3/exchangeInfo": 20,
+    "GET /api/v3/account": 20,
+    "GET /api/v3/openOrders": 6,
+    "GET /api/v3/order": 4,
+    "GET /sapi/v1/margin/account": 10,
+    "GET /sapi/v1/margin/isolated/account": 10,
+    "GET /sapi/v1/margin/openOrders": 10,
+    "GET /sapi/v1/margin/order": 10,
+    "GET /sapi/v1/margin/priceIndex": 10,
+}
+
+# Endpoints that place orders
+ORDER_ENDPOINTS = ("POST /api/v3/order", "POST /sapi/v1/margin/order")
+
+# Limits every account has on its own, the rest are shared by everything sent from this address
+ACCOUNT_LIMITS = ("ORDERS", "SAPI_UID_WEIGHT")
+
+# Usage of every limit in its current window, as {(account or "ip", limit, interval): [window, used]}
+usage = {}
+banned_until = 0.0
+waiting_protective = 0
+
+lock = threading.Lock()
+changed = threading.Condition(lock)
+
+# The priority of the requests the current thread sends
+current = threading.local()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Send the requests of a block of code as protective, if enabled
+@contextmanager
+def protect(enabled=True):
+    previous = getattr(current, "priority", ENTRY)
+    if enabled:
+        current.priority = PROTECTIVE
+    try:
+        yield
+    finally:
+        current.priority = previous
+
+
+# Send the requests of a function as protective
+def protective(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with protect():
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# Get the current window of an interval
+def window(interval):
+    return int(time.time() // INTERVALS[interval])
+
+
+# Get who a limit is counted for, the account the current thread trades for, or the address
+def scope_of(limit):
+    if limit in ACCOUNT_LIMITS:
+        return accounts.name()
+    return "ip"
+
+
+# Get the usage of a limit in the current window
+def used(limit, interval, scope=None):
+    scope = scope or scope_of(limit)
+    current_window = window(interval)
+    entry = usage.get((scope, limit, interval))
+    if entry is None or entry[0] != current_window:
+        entry = [current_window, 0]
+        usage[(scope, limit, interval)] = entry
+    return entry
+
+
+# Get what a request costs, as {limit: amount}
+def cost_of(endpoint):
+    cost = {}
+    if " /sapi/" in endpoint:
+        cost["SAPI_IP_WEIGHT"] = WEIGHTS.get(endpoint, 1)
+    else:
+        cost["REQUEST_WEIGHT"] = WEIGHTS.get(endpoint, 1)
+    if endpoint in ORDER_ENDPOINTS:
+        cost["ORDERS"] = 1
+    return cost
+
+
+# Seconds until a request fits in every limit, 0 if it fits now
+# Entries may only use part of every limit, the rest is kept for protective requests
+def time_to_fit(cost, priority):
+    now = time.time()
+    if banned_until > now:
+        return banned_until - now
+
+    share = 1.0 if priority == PROTECTIVE else config.RATE_LIMIT_ENTRY_SHARE
+    wait = 0.0
+    for limit, intervals in config.RATE_LIMITS.items():
+        if limit not in cost:
+            continue
+        for interval, maximum in intervals.items():
+            if used(limit, interval)[1] + cost[limit] > maximum * share:
+                length = INTERVALS[interval]
+                wait = max(wait, (window(interval) + 1) * length - now)
+    return wait
+
+
+# Wait until a request fits in the rate limits, and reserve its cost
+def acquire(endpoint):
+    global waiting_protective
+
+    priority = getattr(current, "priority", ENTRY)
+    cost = cost_of(endpoint)
+    start = time.perf_counter()
+
+    with changed:
+        if priority == PROTECTIVE:
+            waiting_protective += 1
+        try:
+            while True:
+                wait = time_to_fit(cost, priority)
+
+                # Entries also wait while protective requests are queued
+                if wait == 0 and (priority == PROTECTIVE or waiting_protective == 0):
+                    break
+                changed.wait(wait or 0.05)
+
+            for limit, amount in cost.items():
+                for interval in config.RATE_LIMITS.get(limit, {}):
+                    used(limit, interval)[1] += amount
+        finally:
+            if priority == PROTECTIVE:
+                waiting_protective -= 1
+                changed.notify_all()
+
+    metrics.observe("rate_limit_wait_seconds", time.perf_counter() - start, priority=priority)
+
+
+# Update the usage from the rate limit headers of a response
+def update(status_code, headers):
+    global banned_until
+
+    with changed:
+        for header, value in headers.items():
+            key = HEADERS.get(header.lower())
+            if key is None:
+                continue
+            entry = used(*key)
+            entry[1] = int(value)
+
+            maximum = config.RATE_LIMITS.get(key[0], {}).get(key[1])
+            scope = scope_of(key[0])
+            metrics.gauge("rate_limit_used", entry[1], scope=scope, limit=key[0], interval=key[1])
+            if maximum:
+                metrics.gauge("rate_limit_headroom", maximum - entry[1], scope=scope, limit=key[0], interval=key[1])
+
+        # Rate limited or banned, stop everything until the exchange allows it again
+        if status_code in (418, 429):
+            banned_until = max(banned_until, time.time() + float(headers.get("Retry-After", 60)))
+
+        changed.notify_all()
+
+
+# Remaining part of every limit, the account limits for every account
+def headroom():
+    result = {}
+    with lock:
+        for limit, intervals in config.RATE_LIMITS.items():
+            scopes = accounts.names() if limit in ACCOUNT_LIMITS else ["ip"]
+            for scope in scopes:
+                for interval, maximum in intervals.items():
+                    name = limit + " " + interval
+                    if limit in ACCOUNT_LIMITS:
+                        name = scope + " " + name
+                    result[name] = maximum - used(limit, interval, scope)[1]
+    return result
@@ -0,0 +1,8 @@
+# Gunicorn settings, "gunicorn main:app" picks this file up by itself
+
+
+# Warm every worker up right after it's forked, the clients and the exchange info load in the background,
+# so the worker can take a signal right away
+def post_fork(server, worker):
+    import main
+    main.warm()
@@ -0,0 +1,111 @@
+import threading, time, uuid, config, metrics, positions
+from collections import deque
+
+# Open coalescing window of every pair, market and strategy, as {"sequence", "deadline"}
+windows = {}
+sequence = 0
+
+# Signals that were dropped, and why
+dropped = deque(maxlen=config.INGEST_HISTORY)
+
+lock = threading.Lock()
+changed = threading.Condition(lock)
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the idempotency key of a signal, from its id field, or None if it has none
+def key_of(data):
+    if data.get(config.INGEST_ID_FIELD):
+        return "id:" + str(data[config.INGEST_ID_FIELD])
+    return None
+
+
+# Get the coalescing window key of a signal, signals of different markets or strategies never supersede each other
+def window_of(data):
+    return data['ticker'], data['strategy']['market'].upper(), data['strategy'].get('name')
+
+
+# Remember a dropped signal
+def drop(data, reason):
+    dropped.append({"ticker": data.get('ticker'),
+                    "action": data['strategy'].get('order_action'),
+                    "market": data['strategy'].get('market'),
+                    "reason": reason,
+                    "time": time.time()})
+    metrics.count("signals_dropped_total", reason=reason.split(" ")[0])
+
+
+# Take in a signal when it's received
+# Returns a ticket for settling it before execution, or None if it's a duplicate
+# Only signals with an id are checked, the same content without one may be a real repeat of a trade,
+# those get a key of their own, so their orders never share client order ids with an earlier signal
+def admit(data):
+    global sequence
+
+    key = key_of(data)
+    if key is None:
+        key = "receipt:" + uuid.uuid4().hex
+
+    # Claimed in the positions database, so a signal sent to several gunicorn workers is only executed once
+    elif not positions.claim(key, config.INGEST_DEDUPE_TTL):
+        with lock:
+            drop(data, "duplicate of " + key)
+        return None
+
+    # Without a window every signal is executed, none supersedes another
+    if config.COALESCE_WINDOW <= 0:
+        return {"window": None, "symbol": data['ticker'], "sequence": None, "key": key}
+
+    window_key = window_of(data)
+    now = time.time()
+
+    with changed:
+
+        # Open a window for the pair, or join the open one, every newer signal supersedes the older ones
+        sequence += 1
+        window = windows.get(window_key)
+        if window is None or window['deadline'] <= now:
+            window = {"deadline": now + config.COALESCE_WINDOW}
+            windows[window_key] = window
+        window['sequence'] = sequence
+        changed.notify_all()
+
+    return {"window": window_key, "symbol": data['ticker'], "sequence": sequence, "key": key}
+
+
+# Wait for the coalescing window of a signal to close
+# Returns True if it's still the latest signal of its pair and should be executed
+def settle(ticket, data):
+    window_key = ticket['window']
+    if window_key is None:
+        return True
+
+    with changed:
+        while True:
+            window = windows.get(window_key)
+            if window is None:
+                return True
+
+            # A newer signal for the same pair came in
+            if window['sequence'] != ticket['sequence']:
+                break
+
+            remaining = window['deadline'] - time.time()
+            if remaining <= 0:
+                del windows[window_key]
+                return True
+            changed.wait(remaining)
+
+        drop(data, "superseded by a newer signal for " + ticket['symbol'])
+        return False
+
+
+# Get the signals dropped lately
+def stats():
+    with lock:
+        return {"dropped": list(dropped),
+                "open_windows": len(windows)}
@@ -0,0 +1,102 @@
+import threading, time, uuid, config, accounts
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Every job by id, the oldest finished ones are forgotten after JOB_HISTORY jobs
+history = OrderedDict()
+
+# Jobs waiting for their pair, and the pairs that have a job running
+waiting = {}
+running = set()
+
+lock = threading.Lock()
+executor = ThreadPoolExecutor(max_workers=config.JOB_WORKERS, thread_name_prefix="job")
+
+# The job of the current thread, so the trading functions can record their stages
+current = threading.local()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Record the result of a stage of the current job, does nothing outside of a job
+def stage(name, result):
+    job = getattr(current, "job", None)
+    if job is not None:
+        job['stages'].append({"stage": name, "account": accounts.name(), "result": result, "time": time.time()})
+
+
+# Count the jobs that are queued or running
+def pending():
+    return sum(len(queue) for queue in waiting.values()) + len(running)
+
+
+# Queue a job for a pair
+# Jobs of the same pair run one after another in the order they came in, different pairs run in parallel
+# Returns the job, or None if the queue is full
+def submit(symbol, function, *args):
+    job = {"id": uuid.uuid4().hex,
+           "symbol": symbol,
+           "status": "queued",
+           "received": time.time(),
+           "started": None,
+           "finished": None,
+           "stages": [],
+           "result": None}
+
+    with lock:
+        if pending() >= config.JOB_QUEUE_SIZE:
+            return None
+
+        history[job['id']] = job
+        while len(history) > config.JOB_HISTORY:
+            history.popitem(last=False)
+
+        waiting.setdefault(symbol, deque()).append((job, function, args))
+
+        # Start working on the pair, unless a worker is already on it
+        if symbol not in running:
+            running.add(symbol)
+            executor.submit(drain, symbol)
+
+    return job
+
+
+# Run the jobs of a pair until none are left
+def drain(symbol):
+    while True:
+        with lock:
+            if not waiting.get(symbol):
+                waiting.pop(symbol, None)
+                running.discard(symbol)
+                return
+            job, function, args = waiting[symbol].popleft()
+
+        run(job, function, args)
+
+
+# Run a single job
+def run(job, function, args):
+    job['status'] = "running"
+    job['started'] = time.time()
+    current.job = job
+
+    try:
+        job['result'] = function(*args)
+        job['status'] = "done"
+
+    # Keep the worker alive, and keep the error on the job
+    except Exception as e:
+        job['result'] = {"code": "error", "message": str(e)}
+        job['status'] = "failed"
+
+    finally:
+        current.job = None
+        job['finished'] = time.time()
+
+
+# Get a job by id
+def get(job_id):
+    return history.get(job_id)
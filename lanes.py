@@ -0,0 +1,80 @@
+import threading, time
+from contextlib import contextmanager
+
+# Every lane by name, with its lock and statistics
+lanes = {}
+lock = threading.Lock()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the lanes a signal has to hold while it trades on an account, in the order they are taken
+# Every pair it trades on is its own lane, Cross margin also shares loans and balances between pairs,
+# so the assets of the pairs it borrows or repays on, as (symbol, base), are lanes as well, accounts never share lanes
+def signal_lanes(account, market, pairs, borrowing=()):
+    keys = [account + ":" + symbol for symbol in pairs]
+    if market == "CROSS":
+        for symbol, base in borrowing:
+            keys.append(account + ":CROSS:" + symbol[:-len(base)])
+            keys.append(account + ":CROSS:" + base)
+    return sorted(set(keys))
+
+
+# Get a lane, creating it if it doesn't exist yet
+def get(key):
+    with lock:
+        if key not in lanes:
+            # The lock is reentrant, so a holder can take its own lane again
+            lanes[key] = {"lock": threading.RLock(),
+                          "waiting": 0,
+                          "held": False,
+                          "count": 0,
+                          "wait_total": 0.0,
+                          "wait_max": 0.0}
+        return lanes[key]
+
+
+# Hold some lanes while running a block of code
+# Lanes are always taken in the same order, so two signals can never wait for each other
+@contextmanager
+def hold(keys):
+    taken = []
+    try:
+        for key in sorted(set(keys)):
+            lane = get(key)
+            start = time.time()
+
+            with lock:
+                lane['waiting'] += 1
+            lane['lock'].acquire()
+            taken.append(lane)
+
+            wait = time.time() - start
+            with lock:
+                lane['waiting'] -= 1
+                lane['held'] = True
+                lane['count'] += 1
+                lane['wait_total'] += wait
+                lane['wait_max'] = max(lane['wait_max'], wait)
+
+        yield
+
+    finally:
+        for lane in reversed(taken):
+            lane['held'] = False
+            lane['lock'].release()
+
+
+# Get the queue depth and wait times of every lane
+def stats():
+    result = {}
+    for key, lane in list(lanes.items()):
+        result[key] = {"depth": lane['waiting'] + lane['held'],
+                       "waiting": lane['waiting'],
+                       "count": lane['count'],
+                       "wait_average": lane['wait_total'] / lane['count'] if lane['count'] else 0.0,
+                       "wait_max": lane['wait_max']}
+    return result
@@ -0,0 +1,284 @@
+import threading, time, config, metrics, accounts
+from stream import Stream
+
+# Every account has its own wallets, the functions take the wallet key, "SPOT", "CROSS" or an Isolated pair,
+# and keep the state by (account, key) for the account the current thread trades for
+
+# Balances indexed by asset for the Spot and Cross margin wallets, and by pair for Isolated margin
+# Every asset is a {"free", "locked", "borrowed"} dictionary of floats
+balances = {}
+isolated = {}
+
+# When the REST request of the last load of every wallet was sent, and when the user data stream last updated it
+synced_at = {}
+updated_at = {}
+
+# Open user data streams and their listen keys
+streams = {}
+listen_keys = {}
+
+lock = threading.Lock()
+changed = threading.Condition(lock)
+reconciler = None
+
+# Listen keys expire after an hour without a keepalive
+KEEPALIVE_INTERVAL = 30 * 60
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the state key of a wallet of the current account
+def wallet_of(key):
+    return accounts.name(), key
+
+
+# Check if a wallet was loaded
+def loaded(wallet):
+    return wallet in balances or wallet in isolated
+
+
+# Make an empty asset record
+def empty():
+    return {"free": 0.0, "locked": 0.0, "borrowed": 0.0}
+
+
+# Turn an asset from a REST response into an asset record
+def parse_asset(asset):
+    return {"free": float(asset['free']),
+            "locked": float(asset['locked']),
+            "borrowed": float(asset.get('borrowed', 0))}
+
+
+# Load a wallet over REST, the key is "SPOT", "CROSS" or an Isolated pair
+# The answer is dropped if a later load or a stream event already updated the wallet while it was on its way,
+# it would undo changes like the cancelled orders of a signal loading the wallet at the same time
+def load(client, key):
+    started = time.time()
+
+    # Spot wallet
+    if key == "SPOT":
+        wallet = {}
+        for asset in client.get_account()['balances']:
+            wallet[asset['asset']] = parse_asset(asset)
+
+    # Cross margin wallet
+    elif key == "CROSS":
+        wallet = {}
+        for asset in client.get_margin_account()['userAssets']:
+            wallet[asset['asset']] = parse_asset(asset)
+
+    # Isolated margin pair
+    else:
+        pair = client.get_isolated_margin_account(symbols=key)['assets'][0]
+        wallet = {"base_asset": pair['baseAsset']['asset'],
+                  "quote_asset": pair['quoteAsset']['asset'],
+                  "base": parse_asset(pair['baseAsset']),
+                  "quote": parse_asset(pair['quoteAsset']),
+                  "margin_ratio": float(pair['marginRatio'])}
+
+    with changed:
+        if synced_at.get(wallet_of(key), 0) > started or updated_at.get(wallet_of(key), 0) > started:
+            return
+        if key in ("SPOT", "CROSS"):
+            balances[wallet_of(key)] = wallet
+        else:
+            isolated[wallet_of(key)] = wallet
+        synced_at[wallet_of(key)] = started
+        changed.notify_all()
+
+
+# Find the record of an asset in a loaded wallet, creating it if it doesn't exist yet
+def find(wallet, asset):
+    if wallet in balances:
+        return balances[wallet].setdefault(asset, empty())
+
+    pair = isolated[wallet]
+    if asset == pair['base_asset']:
+        return pair['base']
+    if asset == pair['quote_asset']:
+        return pair['quote']
+    return None
+
+
+# Apply a user data stream event to a wallet
+def apply(wallet, event):
+    with changed:
+
+        # The wallet was never loaded, the next lookup will load it over REST
+        if not loaded(wallet):
+            return
+
+        # New free and locked amounts after an order, transfer or loan
+        if event['e'] == "outboundAccountPosition":
+            for position in event['B']:
+                record = find(wallet, position['a'])
+                if record is not None:
+                    record['free'] = float(position['f'])
+                    record['locked'] = float(position['l'])
+
+        # Change of the free amount after a deposit, withdrawal or transfer
+        elif event['e'] == "balanceUpdate":
+            record = find(wallet, event['a'])
+            if record is not None:
+                record['free'] += float(event['d'])
+
+        else:
+            return
+
+        updated_at[wallet] = time.time()
+        changed.notify_all()
+
+
+# Get a listen key, the key is "SPOT", "CROSS" or an Isolated pair
+def get_listen_key(client, key):
+    if key == "SPOT":
+        return client.stream_get_listen_key()
+    if key == "CROSS":
+        return client.margin_stream_get_listen_key()
+    return client.isolated_margin_stream_get_listen_key(key)
+
+
+# Keep a listen key alive, for the account that opened the stream
+def keepalive(client, wallet):
+    account, key = wallet
+    with accounts.use(account):
+        while wallet in streams:
+            time.sleep(KEEPALIVE_INTERVAL)
+            try:
+                if key == "SPOT":
+                    client.stream_keepalive(listen_keys[wallet])
+                elif key == "CROSS":
+                    client.margin_stream_keepalive(listen_keys[wallet])
+                else:
+                    client.isolated_margin_stream_keepalive(key, listen_keys[wallet])
+
+            # The listen key expired, get a new one and reconnect
+            except Exception as e:
+                print("listen key keepalive failed: " + str(e))
+                streams.pop(wallet).close()
+                start_stream(client, key)
+                return
+
+
+# Open the user data stream of a wallet
+def start_stream(client, key):
+    wallet = wallet_of(key)
+    listen_keys[wallet] = get_listen_key(client, key)
+    streams[wallet] = Stream(config.STREAM_URL + listen_keys[wallet],
+                             lambda event: apply(wallet, event),
+                             name="user data " + wallet[0] + " " + key).start()
+    threading.Thread(target=keepalive, args=(client, wallet), daemon=True).start()
+
+
+# Reload every wallet of every account over REST, in case the stream missed something
+def reconcile(client):
+    for account, key in list(synced_at):
+        try:
+            with accounts.use(account):
+                load(client, key)
+        except Exception as e:
+            print("ledger reconcile failed: " + str(e))
+
+
+# Reconcile the wallets now and then
+def reconcile_loop(client):
+    while True:
+        time.sleep(config.LEDGER_RECONCILE_INTERVAL)
+        reconcile(client)
+
+
+# Make sure a wallet is loaded and kept up to date by the stream
+# The simulator has no streams, its wallets are read on every lookup, which costs nothing
+def ensure(client, key):
+    global reconciler
+    wallet = wallet_of(key)
+
+    if config.EXCHANGE == "simulator":
+        load(client, key)
+        return
+
+    # Load the wallet if it was never loaded, or the stream is down and the last load could be stale,
+    # fills of the bot's own orders are booked locally, so a recent load is still good
+    streaming = streams.get(wallet) and streams[wallet].connected
+    if wallet not in synced_at or (not streaming and time.time() - synced_at[wallet] > config.LEDGER_REST_MAX_AGE):
+        load(client, key)
+
+    if wallet not in streams:
+        start_stream(client, key)
+
+    if reconciler is None:
+        reconciler = threading.Thread(target=reconcile_loop, args=(client,), daemon=True)
+        reconciler.start()
+
+
+# Wait until a wallet is updated after a point in time, for example after an order fills
+# Falls back to a REST reload, if the stream doesn't deliver in time
+def wait_for_update(client, key, since, timeout=config.LEDGER_UPDATE_TIMEOUT):
+
+    wallet = wallet_of(key)
+
+    # Nothing to wait for, if the stream isn't running
+    if wallet not in streams or not streams[wallet].connected:
+        load(client, key)
+        return
+
+    with changed:
+        if changed.wait_for(lambda: updated_at.get(wallet, 0) >= since, timeout):
+            return
+    load(client, key)
+
+
+# Get a Spot wallet asset
+@metrics.timed("balances")
+def spot_asset(client, asset):
+    ensure(client, "SPOT")
+    with lock:
+        return dict(find(wallet_of("SPOT"), asset))
+
+
+# Get a Cross margin wallet asset
+@metrics.timed("balances")
+def cross_asset(client, asset):
+    ensure(client, "CROSS")
+    with lock:
+        return dict(find(wallet_of("CROSS"), asset))
+
+
+# Get an Isolated margin pair, with "base" and "quote" asset records and the "margin_ratio"
+@metrics.timed("balances")
+def isolated_pair(client, symbol):
+    ensure(client, symbol)
+    with lock:
+        pair = isolated[wallet_of(symbol)]
+        return {"base": dict(pair['base']), "quote": dict(pair['quote']), "margin_ratio": pair['margin_ratio']}
+
+
+# Record a loan or a repayment locally, the stream doesn't report borrowed amounts
+def add_loan(key, asset, amount):
+    wallet = wallet_of(key)
+    with changed:
+        if not loaded(wallet):
+            return
+        record = find(wallet, asset)
+        if record is not None:
+            record['borrowed'] = max(record['borrowed'] + amount, 0.0)
+        changed.notify_all()
+
+
+# Book the balance changes of a filled order locally, so they don't have to be read back
+# Skipped if the stream or a reload already reported the wallet after the order was sent
+def add_fill(key, base_asset, quote_asset, fill, sent):
+    wallet = wallet_of(key)
+    with changed:
+        if not loaded(wallet):
+            return
+        if updated_at.get(wallet, 0) >= sent or synced_at.get(wallet, 0) >= sent:
+            return
+        for asset, delta in ((base_asset, fill.base_delta), (quote_asset, fill.quote_delta)):
+            record = find(wallet, asset)
+            if record is not None:
+                record['free'] = max(record['free'] + delta, 0.0)
+        changed.notify_all()
@@ -1,70 +1,207 @@
-import json, config, requests
+import json, threading, time, config, transport, endpoints, reporter, exchange_info, asset_graph, ledger, prices, jobs, lanes, positions, metrics, governor, fills, quantizer, ingest, accounts, pretrade, orders, gateway
 from flask import Flask, request
-from binance.client import Client
 from binance.enums import *
 from binance.exceptions import *
+from concurrent.futures import ThreadPoolExecutor
+from decimal import ROUND_DOWN, ROUND_UP
+
+# Side effects of margin orders, python-binance has no names for them
+SIDE_EFFECT_TYPE_NO_SIDE_EFFECT = "NO_SIDE_EFFECT"
+SIDE_EFFECT_TYPE_MARGIN_BUY = "MARGIN_BUY"
+SIDE_EFFECT_TYPE_AUTO_REPAY = "AUTO_REPAY"
+
+
+# Raised by margin_order when the exchange refused the side effect of the order, and placed nothing
+# Only then can the order be sent again another way, an order that may have been placed is never sent twice
+class SideEffectRefused(Exception):
+    pass
+
 
 app = Flask(__name__)
 
-# Binance Client
-client = Client(config.API_KEY, config.API_SECRET)
+# Binance Clients of the accounts, sharing the pooled keep-alive connections
+# Every call goes to the client of the account the current thread trades for, the clients are made on first use
+client = accounts.ActiveClient()
+
+# Start with the exchange info of the last run, it's revalidated in the background
+exchange_info.restore()
+
+# Threads for cancelling orders one by one in parallel
+cancel_pool = ThreadPoolExecutor(max_workers=config.CANCEL_WORKERS, thread_name_prefix="cancel")
+
+# Threads for executing a signal on every account at the same time
+account_pool = ThreadPoolExecutor(max_workers=config.ACCOUNT_WORKERS, thread_name_prefix="account")
 
 # *********************************************************************************************
 # FUNCTIONS
 # *********************************************************************************************
 
 
+# Get a worker ready to trade in the background, so the first signal doesn't wait for it
+# Gunicorn calls it right after forking a worker, see gunicorn.conf.py
+def warm():
+    exchange_info.start(client, revalidate=True)
+    threading.Thread(target=accounts.warm, name="warm up", daemon=True).start()
+    gateway.warm()
+
+
 # Send an error report to the specified Discord Group
+# Reports are queued and sent in the background, so they never slow down a trade
+@metrics.timed("report")
 def send_report(report):
     if config.REPORT:
-        message = "@everyone " + report
-        requests.post(config.DISCORD_LINK,
-                      data={"content": message},
-                      headers=config.DISCORD_HEADER)
+
+        # Say which account it's about, if there's more than one
+        if len(config.ACCOUNTS) > 1:
+            report = "[" + accounts.name() + "] " + report
+        reporter.report(report)
+
+
+# Get the ledger wallet of a market, Isolated margin wallets are kept per pair
+def wallet_key(market, symbol):
+    if market == "ISOLATED":
+        return symbol
+    if market == "SPOT":
+        return "SPOT"
+    return "CROSS"
+
+
+# Cancel the open orders of a pair, to get rid of the last stop-loss
+# Returns the cancelled orders
+@metrics.timed("cancel orders")
+@governor.protective
+def cancel_orders(symbol, market):
+    isolated = market == "ISOLATED"
+    cancelled = []
+    cancel_time = time.time()
+
+    # Cancel everything on the pair with a single request
+    if not config.CANCEL_OWN_ORDERS_ONLY:
+        try:
+            if market == "SPOT":
+                cancelled = gateway.cancel_all_open_orders(symbol=symbol)
+            else:
+                cancelled = client.cancel_all_open_margin_orders(symbol=symbol, isIsolated=isolated)
+
+        # Error, unless there was simply nothing to cancel
+        except BinanceAPIException as e:
+            if e.code != -2011:
+                send_report(str(e) + "During " + market + " Cancel All Orders")
+
+    # Or only cancel the orders placed by the bot, all at the same time
+    else:
+        if market == "SPOT":
+            orders = client.get_open_orders(symbol=symbol)
+        else:
+            orders = client.get_open_margin_orders(symbol=symbol, isIsolated=isolated)
+
+        futures = []
+        for order in orders:
+            if not order['clientOrderId'].startswith(config.ORDER_TAG):
+                continue
+            # The cancels go out for the same account, and as protective, like the rest of the function
+            if market == "SPOT":
+                cancel = governor.protective(accounts.bound(gateway.cancel_order))
+                futures.append(cancel_pool.submit(cancel, symbol=symbol, orderId=order['orderId']))
+            else:
+                cancel = governor.protective(accounts.bound(accounts.method("cancel_margin_order")))
+                futures.append(cancel_pool.submit(cancel, symbol=symbol, orderId=order['orderId'],
+                                                  isIsolated=isolated))
+
+        for future in futures:
+            try:
+                cancelled.append(future.result())
+
+            # Error
+            except BinanceAPIException as e:
+                send_report(str(e) + "During " + market + " Stop Loss Cancel")
+
+    jobs.stage("cancel orders", cancelled)
+
+    # Wait for the ledger to see the cancelled stop-loss funds
+    if cancelled:
+        ledger.wait_for_update(client, wallet_key(market, symbol), cancel_time)
+
+    return cancelled
 
 
 # Repay Loan
+@metrics.timed("repay loan")
+@governor.protective
 def repay_loan(asset, amount, symbol, isolated):
     try:
         # Isolated margin function
         if isolated:
-            transaction = client.repay_margin_loan(asset=asset, amount=amount, isIsolated=isolated, symbol=symbol)
+            transaction = orders.transact(client.repay_margin_loan, accounts.method("get_margin_repay_details"),
+                                          asset=asset, amount=amount, isIsolated=isolated, symbol=symbol)
+            ledger.add_loan(symbol, asset, -amount)
         # Cross margin function
         else:
-            transaction = client.repay_margin_loan(asset=asset, amount=amount)
+            transaction = orders.transact(client.repay_margin_loan, accounts.method("get_margin_repay_details"),
+                                          asset=asset, amount=amount)
+            ledger.add_loan("CROSS", asset, -amount)
+        jobs.stage("repay loan", transaction)
         return transaction
 
     # Error
     except BinanceAPIException as e:
+        jobs.stage("repay loan", str(e))
         send_report(str(e) + "During Repay Loan")
         return False
 
 
 # Get a loan
+@metrics.timed("take loan")
 def take_loan(asset, amount, symbol, isolated):
     try:
         # Isolated margin function
         if isolated:
-            transaction = client.create_margin_loan(asset=asset, amount=amount, isIsolated=isolated, symbol=symbol)
+            transaction = orders.transact(client.create_margin_loan, accounts.method("get_margin_loan_details"),
+                                          asset=asset, amount=amount, isIsolated=isolated, symbol=symbol)
+            ledger.add_loan(symbol, asset, amount)
 
         # Cross margin function
         else:
-            transaction = client.create_margin_loan(asset=asset, amount=amount)
+            transaction = orders.transact(client.create_margin_loan, accounts.method("get_margin_loan_details"),
+                                          asset=asset, amount=amount)
+            ledger.add_loan("CROSS", asset, amount)
+        jobs.stage("take loan", transaction)
         return transaction
 
     # Error
     except BinanceAPIException as e:
+        jobs.stage("take loan", str(e))
         send_report(str(e) + "During Take Loan")
         return False
 
 
+# Work out what an executed Market order did from its fills, and book it in the ledger right away
+def book_fill(order, symbol, market, sent):
+    rules = exchange_info.get_rules(client, symbol)
+    order['fill'] = fills.summarize(order, rules.base_asset, rules.quote_asset)
+    ledger.add_fill(wallet_key(market, symbol), rules.base_asset, rules.quote_asset, order['fill'], sent)
+    return order['fill']
+
+
 # Set Stop-Limit Order
-def set_stop_limit(side, order, symbol, precision, stop, stop_diff, step, market, loan=0.0):
-    order = False
+@metrics.timed("stop limit")
+@governor.protective
+def set_stop_limit(side, order, symbol, stop, stop_diff, market, loan=0.0):
+
+    # Get the filters of the pair
+    rules = exchange_info.get_rules(client, symbol)
+    step = rules.tick_size
 
-    # Get the price and amount of the executed Market order
-    price = order["price"]
-    quantity = order["executedQty"]
+    # Get the average price and amount of the executed Market order from its fills
+    fill = order['fill']
+    price = fill.avg_price
+
+    # A long protects what was bought after commission, a short what was sold
+    if side == "BUY":
+        quantity = fill.base_delta
+    else:
+        quantity = fill.executed_qty
+    order = False
 
     # If there's a loan that has to be repaid, it will not be added to the stop limit order, but repaid later instead
     if loan > 0:
@@ -83,8 +220,9 @@ def set_stop_limit(side, order, symbol, precision, stop, stop_diff, step, market
         if limit_price <= stop_price:
             stop_price = limit_price - step
 
-        # After the market long, the stop-loss should be a sell order
+        # After the market long, the stop-loss should be a sell order, with the prices rounded down
         side = "SELL"
+        rounding = ROUND_DOWN
 
     # If the market order was a short long, then the stop loss will be higher
     elif side == "SELL":
@@ -99,462 +237,358 @@ def set_stop_limit(side, order, symbol, precision, stop, stop_diff, step, market
         if limit_price >= stop_price:
             stop_price = limit_price + step
 
-        # After the market short, the stop-loss should be a buy order
+        # After the market short, the stop-loss should be a buy order, with the prices rounded up
         side = "BUY"
+        rounding = ROUND_UP
+
+    # Snap the prices to the tick size, away from the market, and the quantity to the step size
+    limit_price = quantizer.price(rules.quantizer, limit_price, side, price, rounding)
+    stop_price = quantizer.price(rules.quantizer, stop_price, side, price, rounding)
+    quantity = quantizer.quantity(rules.quantizer, quantity, market=False)
+
+    # Check the filters locally, so the order doesn't have to be retried
+    failure = quantizer.check(rules.quantizer, quantity, limit_price, market=False)
+    if failure:
+        jobs.stage("stop limit", failure)
+        send_report(failure + " During Stop Limit " + symbol)
+        return False
 
     # For Spot market
     if market == "SPOT":
         try:
             # Try placing a stop limit order
-            order = client.create_order(symbol=symbol, side=side,
-                                        type=ORDER_TYPE_STOP_LOSS_LIMIT, quantity=quantity,
-                                        price=limit_price, stopPrice=stop_price,
-                                        timeInForce=TIME_IN_FORCE_GTC)
-        except BinanceAPIException as e:
+            order = orders.place(gateway.create_order, gateway.get_order, symbol=symbol, side=side,
+                                 type=ORDER_TYPE_STOP_LOSS_LIMIT, quantity=quantizer.text(quantity),
+                                 price=quantizer.text(limit_price), stopPrice=quantizer.text(stop_price),
+                                 timeInForce=TIME_IN_FORCE_GTC, newClientOrderId=orders.client_order_id("s"))
 
-            # If encounter a LOT_SIZE error, try again, but round the quantity to fit the min decimal amount
-            if str(e) == "Filter failure: LOT_SIZE":
-                order = client.create_order(symbol=symbol, side=side,
-                                            type=ORDER_TYPE_STOP_LOSS_LIMIT, quantity=round(quantity, precision),
-                                            price=limit_price, stopPrice=stop_price,
-                                            timeInForce=TIME_IN_FORCE_GTC)
-            # If that doesn't work, output an error
-            else:
-                send_report(str(e) + "During Spot Stop Limit")
+        # Output the error
+        except BinanceAPIException as e:
+            send_report(str(e) + "During Spot Stop Limit")
 
     # For Margin
     else:
         try:
             # Try placing a stop limit order
-            order = client.create_margin_order(symbol=symbol, side=side,
-                                               type=ORDER_TYPE_STOP_LOSS_LIMIT, quantity=quantity,
-                                               price=limit_price, stopPrice=stop_price,
-                                               timeInForce=TIME_IN_FORCE_GTC)
+            order = orders.place(client.create_margin_order, accounts.method("get_margin_order"),
+                                 symbol=symbol, side=side, type=ORDER_TYPE_STOP_LOSS_LIMIT,
+                                 quantity=quantizer.text(quantity),
+                                 price=quantizer.text(limit_price), stopPrice=quantizer.text(stop_price),
+                                 timeInForce=TIME_IN_FORCE_GTC, isIsolated=market == "ISOLATED",
+                                 newClientOrderId=orders.client_order_id("s"))
+
+        # Output the error
         except BinanceAPIException as e:
-
-            # If encounter a LOT_SIZE error, try again, but round the quantity to fit the min decimal amount
-            if str(e) == "Filter failure: LOT_SIZE":
-                order = client.create_margin_order(symbol=symbol, side=side,
-                                                   type=ORDER_TYPE_STOP_LOSS_LIMIT, quantity=round(quantity, precision),
-                                                   price=limit_price, stopPrice=stop_price,
-                                                   timeInForce=TIME_IN_FORCE_GTC)
-            # If that doesn't work, output an error
-            else:
-                send_report(str(e) + "During Margin Stop Limit")
+            send_report(str(e) + "During Margin Stop Limit")
 
     # Output
+    jobs.stage("stop limit", order)
     return order
 
 
+# Round a Market order quantity to the filters of the pair, and check it locally
+# Returns the quantity, or None if the order would be refused
+def market_quantity(symbol, side, quantity, price=None):
+    rules = exchange_info.get_rules(client, symbol)
+    quantity = quantizer.quantity(rules.quantizer, quantity)
+
+    # The notional is checked against the streamed price, if there's a fresh one
+    if price is None:
+        price = prices.latest(symbol, side)
+
+    failure = quantizer.check(rules.quantizer, quantity, price)
+    if failure:
+        send_report(failure + " During " + side.capitalize() + " Order " + symbol)
+        return None
+    return quantity
+
+
 # Send a Spot Market order
-def spot_order(side, quantity, base, symbol, precision, equity, step, market,
-               stop=config.STOP_LOSS, stop_diff=config.STOP_LIMIT_DIFFERENCE):
+@metrics.timed("spot order")
+def spot_order(side, quantity, base, symbol, equity, market,
+               stop=config.STOP_LOSS, stop_diff=config.STOP_LIMIT_DIFFERENCE, price=None):
     order = False
 
     # If selling
     if side == "SELL":
-        try:
-            # Try to execute the order
-            order = client.create_order(symbol=symbol, side=side, type=ORDER_TYPE_MARKET, quantity=quantity)
-        except BinanceAPIException as e:
 
-            # If encounter a LOT_SIZE error
-            if str(e) == "Filter failure: LOT_SIZE":
-                try:
-                    # Round the numbers to required decimal places
-                    if precision >= 0:
-                        quantity = round(quantity, precision)
+        # Round the quantity to the filters of the pair
+        quantity = market_quantity(symbol, side, quantity)
+        if quantity is None:
+            jobs.stage("spot order", False)
+            return False
 
-                    # Or round up the integer
-                    elif precision < 0:
-                        quantity = quantity // (10 ** -precision) * (10 ** -precision)
+        sent = time.time()
+        try:
+            # Try to execute the order
+            order = orders.place(gateway.create_order, gateway.get_order, symbol=symbol, side=side,
+                                 type=ORDER_TYPE_MARKET, quantity=quantizer.text(quantity),
+                                 newOrderRespType=ORDER_RESP_TYPE_FULL, newClientOrderId=orders.client_order_id())
 
-                    # Try executing the order again
-                    order = client.create_order(symbol=symbol, side=side, type=ORDER_TYPE_MARKET, quantity=quantity)
+        # Output the error
+        except BinanceAPIException as e:
+            send_report(str(e) + "During Spot Sell Order")
 
-                # Output the error
-                except BinanceAPIException as e:
-                    send_report(str(e) + "During Spot Order Sell")
+        jobs.stage("spot order", order)
 
-            # Error from first attempt
-            else:
-                send_report(str(e) + "During Spot Sell Order")
+        # Work out what the order did from its fills
+        if order:
+            book_fill(order, symbol, market, sent)
 
     # If buying
     elif side == "BUY":
-        # Calculate how much of the asset can you buy with the base currency
-        price = float(client.get_margin_price_index(symbol=symbol)['price'])
-        quantity = base / price * equity
-
-        # Round the numbers to required decimal places
-        if precision >= 0:
-            quantity = round(quantity, precision)
-
-        # Or round up the integer
-        elif precision < 0:
-            quantity = quantity // (10 ** -precision) * (10 ** -precision)
+        # Calculate how much of the asset can you buy with the base currency, at the gathered price if given
+        if price is None:
+            price = prices.get_price(client, symbol, side)
+
+        # Round the quantity to the filters of the pair
+        quantity = market_quantity(symbol, side, base / price * equity, price)
+        if quantity is None:
+            jobs.stage("spot order", False)
+            return False
 
-        # Try executing the order again
+        # Try executing the order
+        sent = time.time()
         try:
-            order = client.create_order(symbol=symbol, side=side, type=ORDER_TYPE_MARKET, quantity=quantity)
+            order = orders.place(gateway.create_order, gateway.get_order, symbol=symbol, side=side,
+                                 type=ORDER_TYPE_MARKET, quantity=quantizer.text(quantity),
+                                 newOrderRespType=ORDER_RESP_TYPE_FULL, newClientOrderId=orders.client_order_id())
 
         # Exit if an error occurs
         except BinanceAPIException as e:
+            jobs.stage("spot order", str(e))
             send_report(str(e) + "During Spot Order Buy")
             return False
 
+        jobs.stage("spot order", order)
+
+        # Work out what the order did from its fills
+        book_fill(order, symbol, market, sent)
+
         # If stop-loss is enabled, run the stop-limit order function
         if stop:
-            stop_order = set_stop_limit(side, order, symbol, precision, stop, stop_diff, step, market)
+            stop_order = set_stop_limit(side, order, symbol, stop, stop_diff, market)
 
     # Output
     return order
 
 
 # Margin Order
-def margin_order(side, quantity, symbol, precision, step, market, order_type=ORDER_TYPE_MARKET,
-                 stop=config.STOP_LOSS, stop_diff=config.STOP_LIMIT_DIFFERENCE, loan=0.0):
+# With the MARGIN_BUY side effect the exchange borrows what's missing for the order, with AUTO_REPAY it repays
+# up to the repay amount of debt from what the order receives
+@metrics.timed("margin order")
+def margin_order(side, quantity, symbol, market, order_type=ORDER_TYPE_MARKET,
+                 stop=config.STOP_LOSS, stop_diff=config.STOP_LIMIT_DIFFERENCE, loan=0.0,
+                 side_effect=SIDE_EFFECT_TYPE_NO_SIDE_EFFECT, repay=0.0):
     order = False
 
-    # Round the numbers to required decimal places
-    if precision >= 0:
-        quantity = round(quantity, precision)
-
-    # Or round up the integer
-    elif precision < 0:
-        quantity = quantity // (10 ** -precision) * (10 ** -precision)
+    # Round the quantity to the filters of the pair
+    quantity = market_quantity(symbol, side, quantity)
+    if quantity is None:
+        jobs.stage("margin order", False)
+        return False
 
     try:
         # Execute the order
-        order = client.create_margin_order(symbol=symbol, side=side, type=order_type, quantity=quantity)
+        sent = time.time()
+        order = orders.place(client.create_margin_order, accounts.method("get_margin_order"),
+                             symbol=symbol, side=side, type=order_type, quantity=quantizer.text(quantity),
+                             isIsolated=market == "ISOLATED", sideEffectType=side_effect,
+                             newOrderRespType=ORDER_RESP_TYPE_FULL, newClientOrderId=orders.client_order_id())
 
     # Exit if an error occurs
     except BinanceAPIException as e:
+        jobs.stage("margin order", str(e))
+
+        # The exchange wouldn't borrow or repay along with the order, the caller sends it without the side effect
+        if side_effect != SIDE_EFFECT_TYPE_NO_SIDE_EFFECT and e.code in config.MARGIN_SIDE_EFFECT_REFUSED:
+            raise SideEffectRefused(str(e))
+
         send_report(str(e) + "During Margin Order")
         return False
 
+    jobs.stage("margin order", order)
+
+    # Work out what the order did from its fills
+    fill = book_fill(order, symbol, market, sent)
+
+    # Book the loans the exchange took or repaid along with the order
+    if side_effect == SIDE_EFFECT_TYPE_MARGIN_BUY and float(order.get('marginBuyBorrowAmount', 0)) > 0:
+        ledger.add_loan(wallet_key(market, symbol), order['marginBuyBorrowAsset'], float(order['marginBuyBorrowAmount']))
+    elif side_effect == SIDE_EFFECT_TYPE_AUTO_REPAY and repay > 0:
+        rules = exchange_info.get_rules(client, symbol)
+        asset = rules.base_asset if side == "BUY" else rules.quote_asset
+        ledger.add_loan(wallet_key(market, symbol), asset, -min(repay, fills.received(fill)))
+
     # If stop-loss is enabled, run the stop-limit order function
     if stop:
-        stop_order = set_stop_limit(side, order, symbol, precision, stop, stop_diff, step, market, loan)
+        stop_order = set_stop_limit(side, order, symbol, stop, stop_diff, market, loan)
 
     return order
 
 
+# Gather what a signal needs before it trades, with the calls made at the same time
+# Cancelling the open orders frees the funds of the last stop-loss, so the wallet is read after everything is done
+# Only buying is sized at the gathered price, selling sells the asset held, and shorts price it after repaying
+def gather_pretrade(rules, side, market, asset_name, base_name):
+    symbol = rules.symbol
+    calls = {
+        "cancel orders": (cancel_orders, (symbol, market)),
+        "balances": (ledger.ensure, (client, wallet_key(market, symbol))),
+    }
+    if side == "BUY":
+        calls["price"] = (prices.get_price, (client, symbol, side))
+    results, timings = pretrade.gather(calls)
+
+    # Spot
+    if market == "SPOT":
+        wallet = {"asset": ledger.spot_asset(client, asset_name), "base": ledger.spot_asset(client, base_name)}
+
+    # Cross
+    elif market == "CROSS":
+        wallet = {"asset": ledger.cross_asset(client, asset_name), "base": ledger.cross_asset(client, base_name)}
+
+    # Isolated
+    else:
+        pair = ledger.isolated_pair(client, symbol)
+        wallet = {"asset": pair['base'], "base": pair['quote'], "margin_ratio": pair['margin_ratio']}
+
+    return pretrade.Snapshot(rules, results['cancel orders'], wallet, results.get('price'), timings)
+
+
+# Trade an amount of an asset along a conversion route, leg by leg
+# Returns the amount of the final asset received, or False if a leg fails
+def convert(route, amount, market):
+    for leg in route:
+
+        # Spot market
+        if market == "SPOT":
+            if leg.side == "SELL":
+                order = spot_order(leg.side, amount, 0, leg.symbol, 1, market, stop=0)
+            else:
+                order = spot_order(leg.side, 0, amount, leg.symbol, 1, market, stop=0)
+
+        # Margin market, buying is done in the asset amount, so it has to be converted from the base currency
+        else:
+            quantity = amount
+            if leg.side == "BUY":
+                quantity = amount / prices.get_price(client, leg.symbol, leg.side)
+            order = margin_order(leg.side, quantity, leg.symbol, market, stop=0)
+
+        # Failed leg
+        if not order:
+            send_report("Failed converting " + leg.from_asset + " to " + leg.to_asset + " During Change Pairs")
+            return False
+
+        # Selling gives the base currency, buying gives the asset, after commission
+        amount = fills.received(order['fill'])
+
+    return amount
+
+
+# Find the cheapest route from the asset of the last trade to the one the current trade needs, or None
+def route_of(side, symbol, base, new_symbol, new_base, market):
+
+    # Get the trading rules of the last pair, this also loads the asset graph
+    exchange_info.get_rules(client, symbol)
+
+    # Long trades are entered with the base currency, short trades by selling the asset
+    if side == "BUY":
+        target = new_base
+    else:
+        target = new_symbol[:-len(new_base)]
+
+    return asset_graph.find_route(symbol[:-len(base)], target, margin=market != "SPOT")
+
+
 # If possible, exit the last trade, sell all the assets, and add them to the current trade
+@metrics.timed("change pairs")
+@governor.protective
 def change_pairs(side, symbol, base, new_symbol, new_base, market):
 
     asset_name = symbol[:-len(base)]
 
-    new_asset_name = new_symbol[:-len(new_base)]
+    # Get the trading rules of the last pair
+    rules = exchange_info.get_rules(client, symbol)
 
-    if market == "SPOT":
+    # Find the cheapest route from the last asset to the one the current trade needs
+    route = route_of(side, symbol, base, new_symbol, new_base, market)
 
-        # Get all user Spot wallet assets
-        assets = client.get_account()['balances']
+    # No way to convert the assets
+    if route is None:
+        return False
 
-        # Check all open Spot orders
-        orders = client.get_open_orders(symbol=symbol)
+    if market == "SPOT":
 
         # Cancel all orders
-        # That is done to get rid of the last stop-loss
         # Don't place limit orders on the same currency pair with a bot active, orders will get canceled!
-        for order in orders:
+        cancel_orders(symbol, market)
 
-            # Cancel all orders 1 by 1
-            try:
-                result = client.cancel_order(symbol=symbol, orderId=order['orderId'])
+        # Check how much of the last asset is available in the Spot wallet
+        asset_quantity = ledger.spot_asset(client, asset_name)['free']
 
-            # Error
-            except BinanceAPIException as e:
-                send_report(str(e) + "During Change Pairs Spot")
-
-        # Check how much of both currencies are available in the Spot wallet
-        for asset in assets:
-            if asset['asset'] == asset_name:
-                asset_quantity = float(asset['free'])
-            if asset['asset'] == base:
-                base_quantity = float(asset['free'])
-            if asset['asset'] == new_asset_name:
-                new_asset_quantity = float(asset['free'])
-            if asset['asset'] == new_base:
-                new_base_quantity = float(asset['free'])
-
-        if asset_name == new_asset_name:
-            side = "BUY"
-        elif base == new_base:
-            side = "SELL"
-        else:
-            try:
-                symbol = asset_name + new_base
-                symbol_info = client.get_symbol_info(symbol)
-                side = "SELL"
-            except BinanceAPIException:
-                try:
-                    symbol = new_asset_name + base
-                    symbol_info = client.get_symbol_info(symbol)
-                    side = "BUY"
-                except BinanceAPIException:
-                    try:
-                        symbol = base + new_base
-                        symbol_info = client.get_symbol_info(symbol)
-                        side = "SELL"
-                    except BinanceAPIException:
-                        try:
-                            symbol = asset_name + new_asset_name
-                            symbol_info = client.get_symbol_info(symbol)
-                            side = "SELL"
-                        except BinanceAPIException:
-                            try:
-                                symbol = new_base + base
-                                symbol_info = client.get_symbol_info(symbol)
-                                side = "SELL"
-                                asset_quantity = new_base_quantity
-                            except BinanceAPIException:
-                                try:
-                                    symbol = new_asset_name + asset_name
-                                    symbol_info = client.get_symbol_info(symbol)
-                                    side = "SELL"
-                                    asset_quantity = new_asset_quantity
-                                except BinanceAPIException:
-                                    return False
-
-        # Get information about the pair
-        symbol_info = client.get_symbol_info(symbol)
-
-        # Check the minimum precision
-
-        precision = 0
-        for rule in symbol_info['filters']:
-            if rule['filterType'] == "LOT_SIZE":
-                min_quantity = rule["minQty"]
-
-                # Check the maximum precision
-                max_quantity = rule["maxQty"]
-
-                # Calculate the precision from minimum quantity
-                i = min_quantity
-
-                # Precision will be positive, if it allows floating numbers
-                if i < 0:
-                    while i < 0:
-                        i *= 10
-                        precision += 1
-
-                # Precision will be negative, if it requires rounding up integers
-                elif i > 0:
-                    while i > 0:
-                        i //= 10
-                        precision += -1
-
-            # Run the Spot market order function
-            order = spot_order(side, asset_quantity, base_quantity, symbol, precision, 1, min_quantity, market)
+        # Convert the last asset
+        return convert(route, asset_quantity, market)
 
-            # Successful trade
-            if order:
-                return order
     else:
-        assets = client.get_margin_account()['userAssets']
-
-        # Check for open orders
-        orders = client.get_open_margin_orders(symbol=symbol)
-
         # Cancel all orders
-        for order in orders:
-            try:
-                result = client.cancel_margin_order(symbol=symbol, orderId=order['orderId'])
-
-            # Error
-            except BinanceAPIException as e:
-                send_report(str(e) + "During ")
+        cancel_orders(symbol, market)
 
         # Check information about assets
-        for asset in assets:
-
-            if asset['asset'] == asset_name:
-                # Borrowed
-                asset_loan_amount = float(asset['borrowed'])
-                # Free
-                asset_amount = float(asset['free'])
-            if asset['asset'] == base:
-                # Borrowed
-                base_loan_amount = float(asset['borrowed'])
-                # Free
-                base_amount = float(asset['free'])
-            if asset['asset'] == new_asset_name:
-                # Free
-                new_asset_amount = float(asset['free'])
-            if asset['asset'] == new_base:
-                # Free
-                new_base_amount = float(asset['free'])
-
-            # Get information about the pair
-            symbol_info = client.get_symbol_info(symbol)
-
-            # Check the minimum precision
-            precision = 0
-            for rule in symbol_info['filters']:
-                if rule['filterType'] == "LOT_SIZE":
-                    min_quantity = rule["minQty"]
-
-                    # Check the maximum precision
-                    max_quantity = rule["maxQty"]
-
-                    # Calculate the precision from minimum quantity
-                    i = min_quantity
-
-                    # Precision will be positive, if it allows floating numbers
-                    if i < 0:
-                        while i < 0:
-                            i *= 10
-                            precision += 1
-
-                    # Precision will be negative, if it requires rounding up integers
-                    elif i > 0:
-                        while i > 0:
-                            i //= 10
-                            precision += -1
-
-                # Check the minimum base currency amount requirements
-                if rule['filterType'] == "MIN_NOTIONAL":
-                    min_base_order = rule["minNotional"]
-
-            if asset_loan_amount > 0:
-                if asset_amount >= asset_loan_amount:
-                    transaction = repay_loan(asset_name, asset_loan_amount, symbol)
-                else:
-                    # Get asset price
-                    price = float(client.get_margin_price_index(symbol=symbol)['price'])
-                    if asset_loan_amount * price > min_base_order:
-                        order_response = margin_order("BUY", asset_loan_amount, base_amount, symbol, precision,
-                                                      min_quantity, market, stop=0)
-                        transaction = repay_loan(asset_name, asset_loan_amount, symbol)
-                        asset_amount -= asset_loan_amount
-
-            if base_loan_amount > 0:
-                if base_amount >= base_loan_amount:
-                    transaction = repay_loan(base, base_loan_amount, symbol)
-                else:
-                    # Get asset price
-                    price = float(client.get_margin_price_index(symbol=symbol)['price'])
-                    if min_base_order < base_loan_amount < asset_amount * price:
-                        order_response = margin_order("SELL", asset_loan_amount, base_amount, symbol, precision,
-                                                      min_quantity, market, stop=0)
-                        transaction = repay_loan(base, base_loan_amount, symbol)
-                        base_amount -= base_loan_amount
-
-            if asset_name == new_asset_name:
-                side = "BUY"
-            elif base == new_base:
-                side = "SELL"
+        asset = ledger.cross_asset(client, asset_name)
+        asset_loan_amount = asset['borrowed']
+        asset_amount = asset['free']
+        asset = ledger.cross_asset(client, base)
+        base_loan_amount = asset['borrowed']
+        base_amount = asset['free']
+
+        if asset_loan_amount > 0:
+            if asset_amount >= asset_loan_amount:
+                transaction = repay_loan(asset_name, asset_loan_amount, symbol, False)
+                asset_amount -= asset_loan_amount
             else:
-                try:
-                    symbol = asset_name + new_base
-                    symbol_info = client.get_symbol_info(symbol)
-                    side = "SELL"
-                except BinanceAPIException:
-                    try:
-                        symbol = new_asset_name + base
-                        symbol_info = client.get_symbol_info(symbol)
-                        side = "BUY"
-                    except BinanceAPIException:
-                        try:
-                            symbol = base + new_base
-                            symbol_info = client.get_symbol_info(symbol)
-                            side = "SELL"
-                        except BinanceAPIException:
-                            try:
-                                symbol = asset_name + new_asset_name
-                                symbol_info = client.get_symbol_info(symbol)
-                                side = "SELL"
-                            except BinanceAPIException:
-                                try:
-                                    symbol = new_base + base
-                                    symbol_info = client.get_symbol_info(symbol)
-                                    side = "SELL"
-                                    asset_amount = new_base_amount
-                                except BinanceAPIException:
-                                    try:
-                                        symbol = new_asset_name + asset_name
-                                        symbol_info = client.get_symbol_info(symbol)
-                                        side = "SELL"
-                                        asset_amount = new_asset_amount
-                                    except BinanceAPIException:
-                                        return False
-
-            # Get information about the pair
-            symbol_info = client.get_symbol_info(symbol)
-
-            # Check the minimum precision
-            precision = 0
-            for rule in symbol_info['filters']:
-                if rule['filterType'] == "LOT_SIZE":
-                    min_quantity = rule["minQty"]
-
-                    # Check the maximum precision
-                    max_quantity = rule["maxQty"]
-
-                    # Calculate the precision from minimum quantity
-                    i = min_quantity
-
-                    # Precision will be positive, if it allows floating numbers
-                    if i < 0:
-                        while i < 0:
-                            i *= 10
-                            precision += 1
-
-                    # Precision will be negative, if it requires rounding up integers
-                    elif i > 0:
-                        while i > 0:
-                            i //= 10
-                            precision += -1
-
-            order_response = margin_order(side, asset_amount, base_amount, symbol, precision,
-                                          min_quantity, market, stop=0)
-
-            return order_response
-
-
-# Writes a python list into a txt file
-def list_to_file(str_list):
-
-    # Open file
-    f = open("last.txt", "w")
-
-    # Write each word in a new line
-    for text in str_list:
-        f.write(text + "\n")
-
-    # Close the file
-    f.close()
-
-
-# Check if the last recorded trade used a different currency pair.
-def compare_last_pair(side, symbol, base, market):
-    try:
-        # Open the txt file
-        f = open("last.txt", "r")
+                # Get asset price
+                price = prices.get_price(client, symbol, "BUY")
+                if asset_loan_amount * price > rules.min_notional:
+                    order_response = margin_order("BUY", asset_loan_amount, symbol, market, stop=0)
+                    transaction = repay_loan(asset_name, asset_loan_amount, symbol, False)
+
+        if base_loan_amount > 0:
+            if base_amount >= base_loan_amount:
+                transaction = repay_loan(base, base_loan_amount, symbol, False)
+            else:
+                # Get asset price
+                price = prices.get_price(client, symbol, "SELL")
+                if rules.min_notional < base_loan_amount < asset_amount * price:
+                    order_response = margin_order("SELL", base_loan_amount / price, symbol, market, stop=0)
+                    transaction = repay_loan(base, base_loan_amount, symbol, False)
+                    asset_amount -= base_loan_amount / price
+
+        # Convert what's left of the last asset
+        return convert(route, asset_amount, market)
 
-        # Read the Pair
-        last_symbol = f.read(0)
 
-        # Read the base currency
-        last_base = f.read(1)
+# Check if the last recorded trade of the strategy used a different currency pair.
+def compare_last_pair(side, symbol, base, market, strategy):
 
-        # Read the market type
-        last_market = f.read(2)
+    # Get the last trade on the same market, if it used a different pair and is still open
+    last = last_open_pair(strategy, symbol, market)
 
-        # Close the file
-        f.close()
+    # No previous records, skip this part
+    if last is None:
+        return
 
-        # Check if last trade used a different currency pair, and if it's the same market as the current trade
-        if last_symbol != symbol and last_market == market and last_market != "ISOLATED":
+    # Run the pair changing function, to add the funds from the last trade to the current trade
+    change_pairs(side, last['symbol'], last['base'], symbol, base, market)
 
-            # Run the pair changing function, to add the funds from the last trade to the current trade
-            change_pairs(side, last_symbol, last_base, symbol, base, market)
 
-    # If a file with previous records doesn't exist, skip this part
-    except FileNotFoundError:
-        pass
+# Get the last trade of a strategy on a market, if it used a different pair and is still open, else None
+# Isolated pairs keep their funds to themselves, so they are never changed
+def last_open_pair(strategy, symbol, market):
+    last = positions.last(strategy, market)
+    if last is None or last['symbol'] == symbol or not last['open'] or market == "ISOLATED":
+        return None
+    return last
 
 
 # *********************************************************************************************
@@ -574,26 +608,242 @@ def ping():
     return "Pinged!"
 
 
+# Address for Prometheus to collect the latency and call metrics
+@app.route('/metrics', methods=['GET'])
+def metrics_page():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+# Address for checking the remaining exchange rate limits
+@app.route('/rate-limits', methods=['GET'])
+def rate_limits():
+    return governor.headroom()
+
+
+# Address for checking if the HTTP connections are reused
+@app.route('/pools', methods=['GET'])
+def pool_stats():
+    return transport.stats()
+
+
+# Address for checking the latency and health of the exchange hosts
+@app.route('/endpoints', methods=['GET'])
+def endpoint_stats():
+    return endpoints.stats()
+
+
+# Address for checking the queue depth and wait times of the execution lanes
+@app.route('/lanes', methods=['GET'])
+def lane_stats():
+    return lanes.stats()
+
+
+# Address for checking the duplicate and superseded signals that were dropped
+@app.route('/signals', methods=['GET'])
+def signal_stats():
+    return ingest.stats()
+
+
+# Address for checking the status of a queued signal
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+
+    # Unknown or forgotten job
+    if job is None:
+        return {
+            "code": "error",
+            "message": "job not found"
+        }, 404
+
+    return job
+
+
 # Address for receiving webhooks
 @app.route('/webhook', methods=['POST'])
 def webhook():
 
-    # *********************************************************************************************
-    # MAIN ROUTE
-    # *********************************************************************************************
-    # READING RECEIVED DATA
-    # ---------------------------------------------------------------------------------------------
-
     # Change JSON object from webhook to a python dictionary
     data = json.loads(request.data)
 
     # Check if safety key is matching
-    if data['passphrase'] != config.WEBHOOK_PASSPHRASE:
+    if data.get('passphrase') != config.WEBHOOK_PASSPHRASE:
         return {
             "code": "error",
             "message": "Access Denied!"
         }
 
+    # Check if the signal has everything needed to trade
+    try:
+        data['strategy']['order_action'].upper()
+        data['strategy']['market'].upper()
+        symbol = data['ticker']
+        data['base_currency']
+    except (KeyError, TypeError, AttributeError):
+        return {
+            "code": "error",
+            "message": "invalid signal"
+        }, 400
+
+    # Drop the signal if it was already received
+    ticket = ingest.admit(data)
+    if ticket is None:
+        return {
+            "code": "duplicate",
+            "message": "signal already received"
+        }
+
+    # Execute the signal right away
+    if not config.ASYNC_EXECUTION:
+        return execute_in_lanes(data, ticket)
+
+    # Or queue it, and answer before the trade is done
+    job = jobs.submit(symbol, execute_in_lanes, data, ticket)
+
+    # Too many signals waiting
+    if job is None:
+        send_report("Signal queue is full, dropped a signal for " + symbol)
+
+        return {
+            "code": "error",
+            "message": "queue full"
+        }, 503
+
+    return {
+        "code": "queued",
+        "job": job['id']
+    }, 202
+
+
+# *********************************************************************************************
+# SIGNAL EXECUTION
+# *********************************************************************************************
+
+
+# Execute a signal on every account, unless a newer signal for the pair superseded it
+def execute_in_lanes(data, ticket):
+    market = data['strategy']['market'].upper()
+    side = data['strategy']['order_action'].upper()
+
+    # Everything recorded while executing is labeled with the market and side of the signal
+    with metrics.signal(market=market, side=side):
+        start = time.perf_counter()
+        result = {"code": "error"}
+        try:
+            # Wait for the coalescing window of the pair, only the latest signal in it is executed
+            superseded = not ingest.settle(ticket, data)
+            metrics.observe("stage_seconds", time.perf_counter() - start, stage="coalesce",
+                            outcome="failure" if superseded else "success")
+            if superseded:
+                result = {
+                    "code": "superseded",
+                    "message": "a newer signal for the pair came in"
+                }
+                return result
+
+            result = execute_on_accounts(data, ticket['key'])
+            return result
+        finally:
+            metrics.observe("signal_seconds", time.perf_counter() - start, outcome=result['code'])
+
+
+# Execute a signal on every account at the same time, and collect the results per account
+# With a single account it's executed right away, and its result is returned as it is
+def execute_on_accounts(data, key):
+    names = accounts.names()
+    if len(names) == 1:
+        return execute_on_account(names[0], data, key)
+
+    # The account threads record into the same job, with the same labels
+    job = getattr(jobs.current, "job", None)
+    labels = getattr(metrics.current, "labels", {})
+
+    futures = {name: account_pool.submit(execute_in_account_thread, name, data, key, job, labels) for name in names}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+
+        # Keep the other accounts going, and keep the error on the account
+        except Exception as e:
+            results[name] = {"code": "error", "message": str(e)}
+
+    # Success only if every account succeeded
+    succeeded = sum(1 for result in results.values() if result['code'] == "success")
+    if succeeded == len(results):
+        code = "success"
+    elif succeeded:
+        code = "partial"
+    else:
+        code = "error"
+
+    return {
+        "code": code,
+        "accounts": results
+    }
+
+
+# Execute a signal for an account in a thread of the account pool
+def execute_in_account_thread(name, data, key, job, labels):
+    jobs.current.job = job
+    try:
+        with metrics.signal(**labels):
+            return execute_on_account(name, data, key)
+    finally:
+        jobs.current.job = None
+
+
+# Execute a signal for an account while holding its lanes, with the equity scaled for the account
+# Its orders get client order ids from the idempotency key of the signal, so they can be looked up if they time out
+# Signals for different pairs run in parallel, but signals sharing a pair or Cross margin loans never interleave
+def execute_on_account(name, data, key):
+    with accounts.use(name), orders.signal(key):
+        data = accounts.scale(data)
+        keys = lanes_of(name, data)
+
+        # The last trade may change while waiting, then the lanes it needs now are taken as well
+        start = time.perf_counter()
+        while True:
+            with lanes.hold(keys):
+                needed = lanes_of(name, data)
+                if set(needed) <= set(keys):
+                    metrics.observe("stage_seconds", time.perf_counter() - start, stage="lane wait",
+                                    outcome="success")
+                    return execute(data)
+            keys = sorted(set(keys) | set(needed))
+
+
+# Get the lanes a signal holds while it trades on an account, the pair of the signal,
+# and with overwrite the pair of the last trade it exits and the pairs its assets are converted on
+# Only the pairs of the signal and the last trade borrow or repay, the conversions never do
+def lanes_of(name, data):
+    symbol = data['ticker']
+    base = data['base_currency']
+    side = data['strategy']['order_action'].upper()
+    market = data['strategy']['market'].upper()
+
+    pairs = [symbol]
+    borrowing = [(symbol, base)]
+    if bool(data['strategy'].get('overwrite', False)):
+        last = last_open_pair(str(data['strategy'].get('name', "default")), symbol, market)
+        if last is not None:
+            pairs.append(last['symbol'])
+            borrowing.append((last['symbol'], last['base']))
+            route = route_of(side, last['symbol'], last['base'], symbol, base, market)
+            pairs.extend(leg.symbol for leg in route or [])
+
+    return lanes.signal_lanes(name, market, pairs, borrowing)
+
+
+# Execute a trade signal
+def execute(data):
+
+    # *********************************************************************************************
+    # MAIN ROUTE
+    # *********************************************************************************************
+    # READING RECEIVED DATA
+    # ---------------------------------------------------------------------------------------------
+
     # Change order type into UPPERCASE
     side = data['strategy']['order_action'].upper()
 
@@ -643,6 +893,14 @@ def webhook():
     except KeyError:
         equity = 1
 
+    # Get the strategy name, the last trade is remembered per strategy
+    try:
+        strategy = str(data['strategy']['name'])
+
+    # If no name given, all signals share the same last trade
+    except KeyError:
+        strategy = "default"
+
     # Check if overwriting previous order is enabled
     try:
         overwrite = bool(data['strategy']['overwrite'])
@@ -657,38 +915,23 @@ def webhook():
         # It's for different pairs, if the last trade used the same pair,
         # it will always close the trade, when changing from short to long
         # Function checks if the last pair is different, but in the same market for easy converting
-        compare_last_pair(side, symbol, base_name, market)
-
-    # Get information about the pair
-    symbol_info = client.get_symbol_info(symbol)
+        compare_last_pair(side, symbol, base_name, market, strategy)
 
-    # Check the minimum precision
-    precision = 0
-    for rule in symbol_info['filters']:
-        if rule['filterType'] == "LOT_SIZE":
-            min_quantity = rule["minQty"]
+    # Get the trading rules of the pair from the cached exchange info
+    rules = exchange_info.get_rules(client, symbol)
 
-            # Check the maximum precision
-            max_quantity = rule["maxQty"]
+    # Unknown pair
+    if rules is None:
+        print("unknown pair!")
+        send_report("Unknown pair " + symbol)
 
-            # Calculate the precision from minimum quantity
-            i = min_quantity
-
-            # Precision will be positive, if it allows floating numbers
-            if i < 0:
-                while i < 0:
-                    i *= 10
-                    precision += 1
-
-            # Precision will be negative, if it requires rounding up integers
-            elif i > 0:
-                while i > 0:
-                    i //= 10
-                    precision += -1
+        return {
+            "code": "error",
+            "message": "unknown pair"
+        }
 
-        # Check the minimum base currency amount requirements
-        if rule['filterType'] == "MIN_NOTIONAL":
-            min_base_order = rule["minNotional"]
+    # Start streaming the price of the pair, so it's ready by the time the order is sized
+    prices.subscribe(symbol)
 
     # ---------------------------------------------------------------------------------------------
     # SPOT TRADING
@@ -697,40 +940,24 @@ def webhook():
     # For SPOT market
     if market == "SPOT":
 
-        # Get all user Spot wallet assets
-        assets = client.get_account()['balances']
-
-        # Check all open Spot orders
-        orders = client.get_open_orders(symbol=symbol)
-
-        # Cancel all orders
+        # Cancel all orders, while the wallet and price are fetched
         # That is done to get rid of the last stop-loss
         # Don't place limit orders on the same currency pair with a bot active, orders will get canceled!
-        for order in orders:
-
-            # Cancel all orders 1 by 1
-            try:
-                result = client.cancel_order(symbol=symbol, orderId=order['orderId'])
-
-            # Error
-            except BinanceAPIException as e:
-                send_report(str(e) + "During Spot Stop Loss Cancel")
+        snapshot = gather_pretrade(rules, side, market, asset_name, base_name)
 
         # Check how much of both currencies are available in the Spot wallet
-        for asset in assets:
-            if asset['asset'] == asset_name:
-                quantity = float(asset['free'])
-            if asset['asset'] == base_name:
-                base = float(asset['free'])
+        quantity = snapshot.wallet['asset']['free']
+        base = snapshot.wallet['base']['free']
 
-        # Run the Spot market order function
-        order = spot_order(side, quantity, base, symbol, precision, equity, min_quantity, market, stop, stop_diff)
+        # Run the Spot market order function, selling exits a position, so it goes before new entries
+        with governor.protect(side == "SELL"):
+            order = spot_order(side, quantity, base, symbol, equity, market, stop, stop_diff, snapshot.price)
 
         # Successful trade
         if order:
 
-            # Write the pair and market to the last trade txt file
-            list_to_file([symbol, base_name, market])
+            # Record the pair and market as the last trade of the strategy
+            positions.record(strategy, symbol, base_name, market, side)
 
             return {
                 "code": "success",
@@ -752,7 +979,7 @@ def webhook():
     # ---------------------------------------------------------------------------------------------
 
     # If Margin is chosen, but the pair doesn't allow margin trading, quit
-    elif not symbol_info["isMarginTradingAllowed"]:
+    elif not rules.margin_allowed:
         # Can't trade margin
         print("margin unavailable!")
         send_report("Error")
@@ -762,27 +989,8 @@ def webhook():
             "message": "margin unavailable for this pair"
         }
 
-    # Check all user Margin assets
-
-    # Isolated
-    if isolated:
-        assets = client.get_isolated_margin_account()['assets']
-
-    # Cross
-    else:
-        assets = client.get_margin_account()['userAssets']
-
-    # Check for open orders
-    orders = client.get_open_margin_orders(symbol=symbol, isIsolated=isolated)
-
-    # Cancel all orders
-    for order in orders:
-        try:
-            result = client.cancel_margin_order(symbol=symbol, orderId=order['orderId'], isIsolated=isolated)
-
-        # Error
-        except BinanceAPIException as e:
-            send_report(str(e) + "During Margin Stop Limit Cancel")
+    # Cancel all orders, while the wallet and price are fetched
+    snapshot = gather_pretrade(rules, side, market, asset_name, base_name)
 
     # ---------------------------------------------------------------------------------------------
     # MARGIN LONG
@@ -794,47 +1002,65 @@ def webhook():
     if side == "BUY":
 
         # Check information about assets
-        for asset in assets:
-
-            # Isolated
-            if isolated:
-                # Pair
-                if asset['symbol'] == symbol:
-                    # Borrowed
-                    loan_amount = float(asset['baseAsset']['borrowed'])
-                    # Base currency amount
-                    base = float(asset['quoteAsset']['free'])
-                    # Margin ratio
-                    margin_ratio = float(asset['marginRatio'])
-                    break
-
-            # Cross
-            else:
-                if asset['asset'] == asset_name:
-                    # Borrowed
-                    loan_amount = float(asset['borrowed'])
-                if asset['asset'] == base_name:
-                    # Base currency amount
-                    base = float(asset['free'])
-                # Cross always has max leverage x3
-                margin_ratio = 3
+
+        # Borrowed
+        loan_amount = snapshot.wallet['asset']['borrowed']
+        # Base currency amount
+        base = snapshot.wallet['base']['free']
+
+        # Isolated margin ratio
+        if isolated:
+            margin_ratio = snapshot.wallet['margin_ratio']
+
+        # Cross always has max leverage x3
+        else:
+            margin_ratio = 3
 
         # Get asset price
-        price = float(client.get_margin_price_index(symbol=symbol)['price'])
+        price = snapshot.price
 
         # Calculate the amount you can buy
         quantity = base * equity / price
 
-        # Execute market buy order, to exit previous short trade
+        # Check if leverage is smaller than available ratio
+        # If not, set leverage to max
+        if leverage > margin_ratio:
+            leverage = margin_ratio
+
+        # With side effects, the exchange repays the debt from what's bought, or if there's no debt,
+        # borrows the leverage along with the order, so the whole long is one order
+        order_response = None
+        auto_repaid = False
+        leveraged = False
+        try:
+            if config.MARGIN_SIDE_EFFECTS and loan_amount > 0:
+                with governor.protect():
+                    order_response = margin_order(side, quantity, symbol, market,
+                                                  stop=stop, stop_diff=stop_diff, loan=loan_amount,
+                                                  side_effect=SIDE_EFFECT_TYPE_AUTO_REPAY, repay=loan_amount)
+                auto_repaid = bool(order_response)
+            elif config.MARGIN_SIDE_EFFECTS and leverage > 0:
+                order_response = margin_order(side, quantity * (1 + leverage), symbol, market, stop=stop,
+                                              stop_diff=stop_diff, side_effect=SIDE_EFFECT_TYPE_MARGIN_BUY)
+                leveraged = bool(order_response)
+
+        # The exchange refused the side effect, nothing was placed
+        except SideEffectRefused:
+            order_response = None
+
+        # Else, or if the exchange refused the side effect, execute market buy order, to exit previous short trade
         # And Start a long without leverage
-        order_response = margin_order(side, quantity, symbol, precision, min_quantity, market,
-                                      stop=stop, stop_diff=stop_diff, loan=loan_amount, isIsolated=isolated)
+        # A failed order isn't sent again, it may have been placed
+        if order_response is None:
+            with governor.protect(loan_amount > 0):
+                order_response = margin_order(side, quantity, symbol, market,
+                                              stop=stop, stop_diff=stop_diff, loan=loan_amount)
 
         # If order successful
         if order_response:
 
-            # Repay the debt, if any
-            if loan_amount > 0:
+            # Repay the debt, if any, and if the order didn't already
+            if loan_amount > 0 and not auto_repaid:
                 if not repay_loan(asset_name, loan_amount, symbol, isolated):
 
                     # Failed to repay
@@ -850,26 +1076,35 @@ def webhook():
             # LONG WITH LEVERAGE
             # .............................................................................................
 
-            # If Leverage is enabled
-            if leverage > 0:
-
-                # Check if leverage is smaller than available ratio
-                # If not, set leverage to max
-                if leverage > margin_ratio:
-                    leverage = margin_ratio
+            # If Leverage is enabled, and the order didn't already take it
+            if leverage > 0 and not leveraged:
 
-                # Calculate the remaining base currency amount after repaying the debt
-                base = quantity - loan_amount
+                # Calculate the value of the position left after repaying the debt, from the fills
+                fill = order_response['fill']
+                base = (fill.base_delta - loan_amount) * fill.avg_price
 
                 # Calculate the leverage amount
-                loan = base * equity * leverage
+                loan = base * leverage
 
-                # Get the leverage
-                take_loan(base_name, loan, symbol, isolated)
+                # Enter a Long trade with the leverage borrowed along with the order
+                order_response = None
+                if config.MARGIN_SIDE_EFFECTS:
+                    try:
+                        order_response = margin_order(side, loan / fill.avg_price, symbol, market,
+                                                      stop=stop, stop_diff=stop_diff,
+                                                      side_effect=SIDE_EFFECT_TYPE_MARGIN_BUY)
+
+                    # The exchange refused to lend, nothing was placed
+                    except SideEffectRefused:
+                        order_response = None
 
-                # Enter a Long trade with the leveraged currency
-                order_response = margin_order(side, loan, symbol, precision, min_quantity, market,
-                                              stop=stop, stop_diff=stop_diff, loan=0, isIsolated=isolated)
+                # Else, or if the exchange refused to lend, get the leverage first
+                if order_response is None:
+                    take_loan(base_name, loan, symbol, isolated)
+
+                    # Enter a Long trade with the leveraged currency
+                    order_response = margin_order(side, loan / fill.avg_price, symbol, market,
+                                                  stop=stop, stop_diff=stop_diff, loan=0)
 
                 # Error
                 if not order_response:
@@ -884,8 +1119,8 @@ def webhook():
 
             # Successful trade
 
-            # Add the pair and market type to the last trade txt file
-            list_to_file([symbol, base_name, market])
+            # Record the pair and market as the last trade of the strategy
+            positions.record(strategy, symbol, base_name, market, side)
 
             return {
                 "code": "success",
@@ -912,28 +1147,43 @@ def webhook():
     elif side == "SELL":
 
         # Check information about assets
-        for asset in assets:
-
-            # Isolated
-            if isolated:
-                # Pair
-                if asset['symbol'] == symbol:
-                    # Available amount
-                    amount = float(asset['baseAsset']['free'])
-                    # Margin ratio
-                    margin_ratio = float(asset['marginRatio'])-1
-                    break
-
-            # Cross
-            else:
-                if asset['asset'] == asset_name:
-                    # Available amount
-                    amount = float(asset['free'])
-                    break
-                margin_ratio = 3
 
-        # Execute a market sell order, to close the previous long position
-        order_response = margin_order(side, amount, symbol, precision, min_quantity, market)
+        # Available amount
+        amount = snapshot.wallet['asset']['free']
+        # Base currency before the sell
+        quote = snapshot.wallet['base']
+
+        # Isolated margin ratio
+        if isolated:
+            margin_ratio = snapshot.wallet['margin_ratio']-1
+
+        # Cross
+        else:
+            margin_ratio = 3
+
+        # Borrowed amount
+        loan_amount = quote['borrowed']
+
+        # With side effects, the exchange repays the debt from what's sold
+        order_response = None
+        auto_repaid = False
+        if config.MARGIN_SIDE_EFFECTS and loan_amount > 0:
+            try:
+                with governor.protect():
+                    order_response = margin_order(side, amount, symbol, market,
+                                                  side_effect=SIDE_EFFECT_TYPE_AUTO_REPAY, repay=loan_amount)
+                auto_repaid = bool(order_response)
+
+            # The exchange refused to repay, nothing was placed
+            except SideEffectRefused:
+                order_response = None
+
+        # Else, or if the exchange refused the side effect, execute a market sell order,
+        # to close the previous long position
+        # A failed order isn't sent again, it may have been placed
+        if order_response is None:
+            with governor.protect():
+                order_response = margin_order(side, amount, symbol, market)
 
         # Failed order
         if not order_response:
@@ -948,29 +1198,14 @@ def webhook():
         # REPAYING THE LEVERAGE
         # .............................................................................................
 
-        # Check how much base currency was gained in the trade
-        for asset in assets:
+        # Available amount, with the base currency gained in the trade taken from the fills
+        base = quote['free'] + order_response['fill'].quote_delta
 
-            # Isolated
-            if isolated:
-                if asset['symbol'] == symbol:
-                    # Available amount
-                    base = float(asset['quoteAsset']['free'])
-                    # Borrowed amount
-                    loan_amount = float(asset['quoteAsset']['borrowed'])
-                    break
-
-            # Cross
-            else:
-                if asset['asset'] == base_name:
-                    # Available amount
-                    base = float(asset['free'])
-                    # Borrowed amount
-                    loan_amount = float(asset['borrowed'])
-                    break
-
-        base =- loan_amount
-        repay = repay_loan(base_name, loan_amount, symbol, isolated)
+        # Repay the debt, if any, and if the order didn't already
+        if loan_amount > 0:
+            base -= loan_amount
+            if not auto_repaid:
+                repay = repay_loan(base_name, loan_amount, symbol, isolated)
 
         # .............................................................................................
         # LOANING LEVERAGE
@@ -986,38 +1221,53 @@ def webhook():
                 leverage = margin_ratio-1
 
         # Get asset price
-        price = float(client.get_margin_price_index(symbol=symbol)['price'])
+        price = prices.get_price(client, symbol, side)
 
         # Calculate how much of the asset will you short
         # On the left side the standard short, on the right side, with extra leverage, if any
         amount = (base * equity + base * equity * leverage) / price
 
-        # Take a loan for the same amount as sold
-        transfer = take_loan(asset_name, amount, symbol, isolated)
+        # With side effects, the exchange borrows the asset along with the short, in a single order
+        order_response = None
+        if config.MARGIN_SIDE_EFFECTS:
+            try:
+                order_response = margin_order(side, amount, symbol, market, stop=stop,
+                                              stop_diff=stop_diff, side_effect=SIDE_EFFECT_TYPE_MARGIN_BUY)
 
-        # Loan failed
-        if not transfer:
-            print("loan failed!")
-            send_report(str(e) + "During Margin Stop Limit")
+            # The exchange refused to lend, nothing was placed
+            except SideEffectRefused:
+                order_response = None
 
-            return {
-                "code": "error",
-                "message": "loan failed"
-            }
+        # Else, or if the exchange refused the side effect, borrow first and sell after
+        # A failed order isn't sent again, it may have been placed
+        if order_response is None:
 
-        # .............................................................................................
-        # SHORTING THE MARKET
-        # .............................................................................................
+            # Take a loan for the same amount as sold
+            transfer = take_loan(asset_name, amount, symbol, isolated)
+
+            # Loan failed
+            if not transfer:
+                print("loan failed!")
+                send_report("Loan failed During Margin Short " + symbol)
+
+                return {
+                    "code": "error",
+                    "message": "loan failed"
+                }
 
-        # Sell the loan to short the market
-        # Later it will be bought and repaid for a lower price
-        order_response = margin_order(side, amount, symbol, precision,
-                                      min_quantity, market, stop=stop, stop_diff=stop_diff)
+            # .............................................................................................
+            # SHORTING THE MARKET
+            # .............................................................................................
+
+            # Sell the loan to short the market
+            # Later it will be bought and repaid for a lower price
+            order_response = margin_order(side, amount, symbol, market, stop=stop, stop_diff=stop_diff)
 
         # Successful trade
         if order_response:
 
-            list_to_file([symbol, base_name, market])
+            # Record the pair and market as the last trade of the strategy
+            positions.record(strategy, symbol, base_name, market, side)
 
             print("success")
 
@@ -1029,7 +1279,7 @@ def webhook():
         else:
             # Error :(
             print("order failed!")
-            send_report(str(e) + "During Margin Stop Limit")
+            send_report("Order failed During Margin Short " + symbol)
 
             return {
                 "code": "error",
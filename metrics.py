@@ -0,0 +1,143 @@
+import threading, time, functools
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histograms and counters by name, then by a sorted tuple of labels
+histograms = {}
+counters = {}
+gauges = {}
+lock = threading.Lock()
+
+# Labels of the signal the current thread is executing, like the market and side
+current = threading.local()
+
+HELP = {
+    "signal_seconds": "Time to execute a whole signal",
+    "stage_seconds": "Time spent in every stage of a signal",
+    "stage_errors_total": "Failed stages",
+    "exchange_call_seconds": "Time of every HTTP call to the exchange or Discord",
+    "exchange_calls_total": "HTTP calls to the exchange or Discord per endpoint",
+    "rate_limit_used": "Used part of every exchange rate limit, as last reported by the exchange",
+    "rate_limit_headroom": "Remaining part of every exchange rate limit",
+    "rate_limit_wait_seconds": "Time requests waited for rate limit headroom",
+    "signals_dropped_total": "Signals dropped as duplicates or superseded by a newer signal for the pair",
+    "order_timeouts_total": "Orders and loans that timed out and were looked up",
+    "order_unsent_total": "Orders sent again because no connection could be made to send them",
+    "order_lookup_hedges_total": "Lookups sent again because the first one was slow",
+    "endpoint_rtt_seconds": "Smoothed round trip time of the pings to every exchange host",
+    "endpoint_healthy": "Exchange hosts calls can be sent to",
+    "endpoint_failovers_total": "Calls moved to another exchange host because a host couldn't answer",
+}
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Merge the signal labels of the current thread with the given ones
+def labels_of(labels):
+    merged = dict(getattr(current, "labels", {}))
+    merged.update(labels)
+    return tuple(sorted(merged.items()))
+
+
+# Record a time in a histogram
+def observe(name, seconds, **labels):
+    key = labels_of(labels)
+    with lock:
+        series = histograms.setdefault(name, {})
+        if key not in series:
+            series[key] = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+        histogram = series[key]
+        histogram['buckets'][bisect_left(BUCKETS, seconds)] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+# Add to a counter
+def count(name, amount=1, **labels):
+    key = labels_of(labels)
+    with lock:
+        series = counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+# Set a gauge to a value
+def gauge(name, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with lock:
+        gauges.setdefault(name, {})[key] = value
+
+
+# Set the market and side labels for everything the current thread records
+@contextmanager
+def signal(**labels):
+    previous = getattr(current, "labels", {})
+    current.labels = labels
+    try:
+        yield
+    finally:
+        current.labels = previous
+
+
+# Time a stage of a signal, the outcome is "failure" if it returns False, "error" if it raises, and "success"
+# otherwise, an empty list or None is a successful answer too
+def timed(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = function(*args, **kwargs)
+                outcome = "failure" if result is False else "success"
+                return result
+            finally:
+                observe("stage_seconds", time.perf_counter() - start, stage=stage, outcome=outcome)
+                if outcome != "success":
+                    count("stage_errors_total", stage=stage)
+        return wrapper
+    return decorator
+
+
+# Format labels the Prometheus way
+def format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(name + '="' + str(value).replace('"', '\\"') + '"' for name, value in items) + "}"
+
+
+# Render every metric in the Prometheus text format
+def render():
+    lines = []
+    with lock:
+        for name, series in sorted(histograms.items()):
+            lines.append("# HELP " + name + " " + HELP.get(name, name))
+            lines.append("# TYPE " + name + " histogram")
+            for key, histogram in sorted(series.items()):
+                total = 0
+                for bound, amount in zip(BUCKETS + (float("inf"),), histogram['buckets']):
+                    total += amount
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(name + "_bucket" + format_labels(key, [("le", le)]) + " " + str(total))
+                lines.append(name + "_sum" + format_labels(key) + " " + repr(histogram['sum']))
+                lines.append(name + "_count" + format_labels(key) + " " + str(histogram['count']))
+
+        for name, series in sorted(counters.items()):
+            lines.append("# HELP " + name + " " + HELP.get(name, name))
+            lines.append("# TYPE " + name + " counter")
+            for key, value in sorted(series.items()):
+                lines.append(name + format_labels(key) + " " + str(value))
+
+        for name, series in sorted(gauges.items()):
+            lines.append("# HELP " + name + " " + HELP.get(name, name))
+            lines.append("# TYPE " + name + " gauge")
+            for key, value in sorted(series.items()):
+                lines.append(name + format_labels(key) + " " + str(value))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,489 @@
+import json, threading, time, struct, base64, hashlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the Binance REST and WebSocket order APIs, and the streams, for the benchmarks
+# It answers every endpoint the bot uses with fixed data, records the calls,
+# and waits a configurable time per endpoint to simulate the network
+
+# Approximate request weight of every endpoint, the rest count as 1
+WEIGHTS = {
+    "GET /api/v3/exchangeInfo": 20,
+    "GET /api/v3/account": 20,
+    "GET /api/v3/openOrders": 6,
+    "DELETE /api/v3/openOrders": 1,
+    "POST /api/v3/order": 1,
+    "GET /api/v3/order": 4,
+    "GET /sapi/v1/margin/account": 10,
+    "GET /sapi/v1/margin/isolated/account": 10,
+    "GET /sapi/v1/margin/openOrders": 10,
+    "DELETE /sapi/v1/margin/openOrders": 1,
+    "POST /sapi/v1/margin/order": 6,
+    "GET /sapi/v1/margin/order": 10,
+    "POST /sapi/v1/margin/loan": 3000,
+    "POST /sapi/v1/margin/repay": 3000,
+    "GET /sapi/v1/margin/loan": 10,
+    "GET /sapi/v1/margin/repay": 10,
+    "GET /sapi/v1/margin/priceIndex": 10,
+    "WS order.status": 4,
+}
+
+# Pairs known to the stand-in, as (symbol, base asset, quote asset, price, step size, tick size)
+PAIRS = [
+    ("BTCUSDT", "BTC", "USDT", 30000.0, "0.00001000", "0.01000000"),
+    ("ETHUSDT", "ETH", "USDT", 2000.0, "0.00010000", "0.01000000"),
+    ("ETHBTC", "ETH", "BTC", 0.066, "0.00010000", "0.00000100"),
+    ("BNBUSDT", "BNB", "USDT", 300.0, "0.00100000", "0.10000000"),
+]
+
+BALANCES = {"USDT": 10000.0, "BTC": 0.5, "ETH": 5.0, "BNB": 20.0}
+
+# Seconds between the book tickers pushed for every subscribed pair
+BOOK_TICKER_INTERVAL = 0.5
+
+
+# *********************************************************************************************
+# RESPONSES
+# *********************************************************************************************
+
+
+def exchange_info(params):
+    symbols = []
+    for symbol, base, quote, price, step, tick in PAIRS:
+        symbols.append({"symbol": symbol, "status": "TRADING", "baseAsset": base, "quoteAsset": quote,
+                        "isMarginTradingAllowed": True,
+                        "filters": [{"filterType": "PRICE_FILTER", "minPrice": tick, "maxPrice": "1000000.00000000",
+                                     "tickSize": tick},
+                                    {"filterType": "LOT_SIZE", "minQty": step, "maxQty": "9000.00000000",
+                                     "stepSize": step},
+                                    {"filterType": "NOTIONAL", "minNotional": "5.00000000",
+                                     "applyMinToMarket": True, "maxNotional": "9000000.00000000",
+                                     "applyMaxToMarket": False, "avgPriceMins": 5}]})
+    return {"timezone": "UTC", "serverTime": int(time.time() * 1000), "rateLimits": [], "symbols": symbols}
+
+
+def balance(asset):
+    return {"asset": asset, "free": "%.8f" % BALANCES[asset], "locked": "0.00000000",
+            "borrowed": "0.00000000", "interest": "0.00000000", "netAsset": "%.8f" % BALANCES[asset]}
+
+
+def account(params):
+    return {"balances": [{"asset": asset, "free": "%.8f" % amount, "locked": "0.00000000"}
+                         for asset, amount in BALANCES.items()]}
+
+
+def margin_account(params):
+    return {"marginLevel": "999", "userAssets": [balance(asset) for asset in BALANCES]}
+
+
+def isolated_account(params):
+    symbols = [pair[0] for pair in PAIRS]
+    if "symbols" in params:
+        symbols = params["symbols"][0].split(",")
+    assets = []
+    for symbol, base, quote, price, step, tick in PAIRS:
+        if symbol in symbols:
+            assets.append({"symbol": symbol, "baseAsset": balance(base), "quoteAsset": balance(quote),
+                           "marginRatio": "5", "isolatedCreated": True})
+    return {"assets": assets}
+
+
+def price_of(symbol):
+    for pair in PAIRS:
+        if pair[0] == symbol:
+            return pair[3]
+    return 1.0
+
+
+def price_index(params):
+    symbol = params["symbol"][0]
+    return {"calcTime": int(time.time() * 1000), "price": "%.8f" % price_of(symbol), "symbol": symbol}
+
+
+# Every order is filled right away at the pair price, with a 0.1% commission in the received asset
+order_id = [0]
+
+# Orders by client order id, and loans and repays, for the lookups
+placed = {}
+transactions = {"POST /sapi/v1/margin/loan": [], "POST /sapi/v1/margin/repay": []}
+
+
+def order(params):
+    symbol = params["symbol"][0]
+    price = price_of(symbol)
+    quantity = float(params.get("quantity", ["0"])[0])
+    order_id[0] += 1
+
+    # Stop-limit orders rest on the book
+    if params.get("type", ["MARKET"])[0] != "MARKET":
+        return remember({"symbol": symbol, "orderId": order_id[0], "clientOrderId": params.get("newClientOrderId", [""])[0],
+                "transactTime": int(time.time() * 1000), "price": params.get("price", ["0"])[0],
+                "origQty": "%.8f" % quantity, "executedQty": "0.00000000", "cummulativeQuoteQty": "0.00000000",
+                "status": "NEW", "type": params["type"][0], "side": params["side"][0], "fills": []})
+
+    commission_asset = symbol[:3] if params["side"][0] == "BUY" else symbol[3:]
+    commission = quantity * 0.001 if params["side"][0] == "BUY" else quantity * price * 0.001
+    response = {"symbol": symbol, "orderId": order_id[0], "clientOrderId": params.get("newClientOrderId", [""])[0],
+                "transactTime": int(time.time() * 1000), "price": "0.00000000", "origQty": "%.8f" % quantity,
+                "executedQty": "%.8f" % quantity, "cummulativeQuoteQty": "%.8f" % (quantity * price),
+                "status": "FILLED", "type": "MARKET", "side": params["side"][0],
+                "fills": [{"price": "%.8f" % price, "qty": "%.8f" % quantity, "commission": "%.8f" % commission,
+                           "commissionAsset": commission_asset, "tradeId": order_id[0]}]}
+
+    # Margin orders that borrow what's missing borrow all of it, the stand-in keeps no balances
+    if params.get("sideEffectType", [""])[0] == "MARGIN_BUY":
+        if params["side"][0] == "BUY":
+            response.update({"marginBuyBorrowAsset": symbol[3:], "marginBuyBorrowAmount": "%.8f" % (quantity * price)})
+        else:
+            response.update({"marginBuyBorrowAsset": symbol[:3], "marginBuyBorrowAmount": "%.8f" % quantity})
+    return remember(response)
+
+
+# Keep an order for the lookups, which answer without the fills, like the real API
+def remember(response):
+    stored = dict(response, time=response["transactTime"])
+    stored.pop("fills")
+    placed[response["clientOrderId"]] = stored
+    return response
+
+
+# Look up an order by its client order id
+def get_order(params):
+    found = placed.get(params.get("origClientOrderId", [""])[0])
+    if found is None:
+        return Error(-2013, "Order does not exist.")
+    return found
+
+
+def listen_key(params):
+    return {"listenKey": "benchmark"}
+
+
+# Book ticker of a pair, with the pair price as both the best bid and ask
+def book_ticker(symbol):
+    price = "%.8f" % price_of(symbol)
+    return {"u": int(time.time() * 1000), "s": symbol, "b": price, "B": "1.00000000", "a": price, "A": "1.00000000"}
+
+
+# User data event with the balances of the assets of a filled order
+def account_position(symbol):
+    assets = [asset for pair in PAIRS if pair[0] == symbol for asset in pair[1:3]]
+    now = int(time.time() * 1000)
+    return {"e": "outboundAccountPosition", "E": now, "u": now,
+            "B": [{"a": asset, "f": "%.8f" % BALANCES[asset], "l": "0.00000000"} for asset in assets]}
+
+
+# Errors are answered with a 400 and the error code
+class Error(dict):
+
+    def __init__(self, code, message):
+        super().__init__(code=code, msg=message)
+
+
+def transaction(endpoint):
+    def answer(params):
+        tran_id = int(time.time() * 1000000)
+        transactions[endpoint].append({"txId": tran_id, "asset": params["asset"][0], "principal": params["amount"][0],
+                                       "timestamp": int(time.time() * 1000), "status": "CONFIRMED"})
+        return {"tranId": tran_id}
+    return answer
+
+
+# Loan or repay records since a time
+def records(endpoint):
+    def answer(params):
+        since = int(params.get("startTime", ["0"])[0])
+        rows = [row for row in transactions[endpoint]
+                if row["asset"] == params["asset"][0] and row["timestamp"] >= since]
+        return {"rows": rows, "total": len(rows)}
+    return answer
+
+
+RESPONSES = {
+    "GET /api/v3/ping": lambda params: {},
+    "GET /api/v3/time": lambda params: {"serverTime": int(time.time() * 1000)},
+    "GET /api/v3/exchangeInfo": exchange_info,
+    "GET /api/v3/account": account,
+    "GET /api/v3/openOrders": lambda params: [],
+    "DELETE /api/v3/openOrders": lambda params: [],
+    "POST /api/v3/order": order,
+    "GET /api/v3/order": get_order,
+    "POST /api/v3/userDataStream": listen_key,
+    "PUT /api/v3/userDataStream": lambda params: {},
+    "GET /sapi/v1/margin/account": margin_account,
+    "GET /sapi/v1/margin/isolated/account": isolated_account,
+    "GET /sapi/v1/margin/openOrders": lambda params: [],
+    "DELETE /sapi/v1/margin/openOrders": lambda params: [],
+    "POST /sapi/v1/margin/order": order,
+    "GET /sapi/v1/margin/order": get_order,
+    "POST /sapi/v1/margin/loan": transaction("POST /sapi/v1/margin/loan"),
+    "POST /sapi/v1/margin/repay": transaction("POST /sapi/v1/margin/repay"),
+    "GET /sapi/v1/margin/loan": records("POST /sapi/v1/margin/loan"),
+    "GET /sapi/v1/margin/repay": records("POST /sapi/v1/margin/repay"),
+    "GET /sapi/v1/margin/priceIndex": price_index,
+    "POST /sapi/v1/userDataStream": listen_key,
+    "POST /sapi/v1/userDataStream/isolated": listen_key,
+}
+
+
+# Endpoints placing orders, every filled order is reported on the user data streams
+ORDER_ENDPOINTS = ("POST /api/v3/order", "POST /sapi/v1/margin/order")
+
+# Methods of the WebSocket API, and the REST endpoint with the same answer
+WS_METHODS = {
+    "order.place": "POST /api/v3/order",
+    "order.status": "GET /api/v3/order",
+    "order.cancel": "DELETE /api/v3/order",
+    "openOrders.cancelAll": "DELETE /api/v3/openOrders",
+}
+
+
+# *********************************************************************************************
+# SERVER
+# *********************************************************************************************
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    # Keep-alive, like the real API
+    protocol_version = "HTTP/1.1"
+
+    # The headers and body are written separately, without this every answer waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle_any(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            params.update(parse_qs(self.rfile.read(length).decode()))
+
+        # A host that is down drops the call without answering
+        if self.server.down:
+            self.close_connection = True
+            return
+
+        # The WebSocket API, and the streams, the user data streams are at /ws/<listen key>
+        if url.path.startswith("/ws") and self.headers.get("Upgrade", "").lower() == "websocket":
+            if url.path == "/ws-api/v3":
+                self.serve_websocket()
+            else:
+                self.serve_stream(url.path)
+            self.close_connection = True
+            return
+
+        endpoint = self.command + " " + url.path
+        self.server.record(endpoint)
+
+        # The call is handled before the simulated network and matching time, so a client that gives up
+        # waiting still leaves the order placed
+        response = RESPONSES.get(endpoint, lambda params: {})(params)
+        if endpoint in ORDER_ENDPOINTS and response.get("status") == "FILLED":
+            self.server.push_account(response["symbol"])
+        delay = self.server.latency.get(endpoint, self.server.default_latency)
+        if delay:
+            time.sleep(delay)
+
+        body = json.dumps(response).encode()
+        self.send_response(400 if isinstance(response, Error) else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(self.server.used_weight()))
+        self.end_headers()
+
+        # The client stopped waiting, like an order that timed out
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    # Accept a WebSocket connection
+    def upgrade(self):
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] +
+                                                "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest())
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.wfile.flush()
+
+    # Answer the WebSocket API, every request in its own thread, so requests are pipelined like on the real API
+    def serve_websocket(self):
+        self.upgrade()
+
+        send_lock = threading.Lock()
+        while not self.server.down:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            opcode, payload = frame
+
+            if opcode == 8:
+                with send_lock:
+                    self.write_frame(8, payload[:2])
+                return
+            if opcode == 9:
+                with send_lock:
+                    self.write_frame(10, payload)
+            elif opcode == 1:
+                threading.Thread(target=self.answer_websocket, args=(json.loads(payload), send_lock),
+                                 daemon=True).start()
+
+    def answer_websocket(self, message, send_lock):
+        method = message.get("method")
+        endpoint = "WS " + method
+        self.server.record(endpoint)
+
+        params = {name: [str(value)] for name, value in message.get("params", {}).items()}
+        rest = WS_METHODS.get(method)
+        response = RESPONSES.get(rest, lambda params: {})(params)
+        if rest in ORDER_ENDPOINTS and response.get("status") == "FILLED":
+            self.server.push_account(response["symbol"])
+        delay = self.server.latency.get(endpoint, self.server.latency.get(rest, self.server.default_latency))
+        if delay:
+            time.sleep(delay)
+
+        answer = {"id": message.get("id"), "status": 200, "result": response,
+                  "rateLimits": [{"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1,
+                                  "limit": 6000, "count": self.server.used_weight()}]}
+        if isinstance(response, Error):
+            answer = {"id": message.get("id"), "status": 400, "error": dict(response)}
+        try:
+            with send_lock:
+                self.write_frame(1, json.dumps(answer).encode())
+        except OSError:
+            pass
+
+    # Serve a stream, the book tickers of the subscribed pairs on /ws, or the user data events on /ws/<listen key>
+    def serve_stream(self, path):
+        self.upgrade()
+
+        stream = {"handler": self, "lock": threading.Lock(), "user_data": path != "/ws", "symbols": set()}
+        with self.server.lock:
+            self.server.streams.append(stream)
+        if not stream['user_data']:
+            threading.Thread(target=self.push_book_tickers, args=(stream,), daemon=True).start()
+
+        try:
+            while not self.server.down:
+                frame = self.read_frame()
+                if frame is None:
+                    return
+                opcode, payload = frame
+
+                if opcode == 8:
+                    with stream['lock']:
+                        self.write_frame(8, payload[:2])
+                    return
+                if opcode == 9:
+                    with stream['lock']:
+                        self.write_frame(10, payload)
+
+                # Subscriptions to book tickers, answered like the real streams
+                elif opcode == 1:
+                    message = json.loads(payload)
+                    if message.get("method") == "SUBSCRIBE":
+                        stream['symbols'].update(name.split("@")[0].upper() for name in message.get("params", []))
+                    with stream['lock']:
+                        self.write_frame(1, json.dumps({"result": None, "id": message.get("id")}).encode())
+        except OSError:
+            pass
+        finally:
+            with self.server.lock:
+                self.server.streams.remove(stream)
+
+    # Push the book tickers of the subscribed pairs now and then, while the stream is open
+    def push_book_tickers(self, stream):
+        while stream in self.server.streams:
+            for symbol in list(stream['symbols']):
+                if not self.server.push(stream, book_ticker(symbol)):
+                    return
+            time.sleep(BOOK_TICKER_INTERVAL)
+
+    # Read a frame from the client, returns (opcode, payload), or None if the connection closed
+    def read_frame(self):
+        try:
+            head = self.rfile.read(2)
+            if len(head) < 2:
+                return None
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self.rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self.rfile.read(8))[0]
+            mask = self.rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(self.rfile.read(length)))
+            return opcode, payload
+        except (OSError, struct.error):
+            return None
+
+    # Write an unmasked frame to the client
+    def write_frame(self, opcode, payload):
+        if len(payload) < 126:
+            head = struct.pack("!BB", 0x80 | opcode, len(payload))
+        elif len(payload) < 65536:
+            head = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+        else:
+            head = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+        self.wfile.write(head + payload)
+        self.wfile.flush()
+
+    do_GET = handle_any
+    do_POST = handle_any
+    do_PUT = handle_any
+    do_DELETE = handle_any
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockBinance(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    # Stand-ins for other hosts of the same exchange share the calls, and the weight, of the first one
+    def __init__(self, port=0, latency=None, default_latency=0.0, shared=None):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.latency = latency or {}
+        self.default_latency = default_latency
+        self.calls = shared.calls if shared is not None else []
+        self.lock = shared.lock if shared is not None else threading.Lock()
+        self.streams = shared.streams if shared is not None else []
+        self.down = False
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self.server_address[1])
+
+    # Record a call and when it happened
+    def record(self, endpoint):
+        with self.lock:
+            self.calls.append((time.time(), endpoint))
+
+    # Send an event on an open stream, returns False if it closed
+    def push(self, stream, event):
+        try:
+            with stream['lock']:
+                stream['handler'].write_frame(1, json.dumps(event).encode())
+            return True
+        except OSError:
+            return False
+
+    # Report the balances after a filled order on every user data stream
+    def push_account(self, symbol):
+        with self.lock:
+            streams = [stream for stream in self.streams if stream['user_data']]
+        for stream in streams:
+            self.push(stream, account_position(symbol))
+
+    # Weight used in the last minute
+    def used_weight(self):
+        since = time.time() - 60
+        with self.lock:
+            return sum(WEIGHTS.get(endpoint, 1) for at, endpoint in self.calls if at >= since)
+
+    # Start answering in a background thread
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
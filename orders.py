@@ -0,0 +1,181 @@
+import threading, time, hashlib, uuid, config, requests, accounts, governor, metrics, jobs, transport
+from binance.exceptions import BinanceAPIException
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+# The signal the current thread places orders for, and how many orders it placed so far
+current = threading.local()
+
+# Threads for looking up orders that timed out
+lookup_pool = ThreadPoolExecutor(max_workers=config.ORDER_LOOKUP_WORKERS, thread_name_prefix="order lookup")
+
+# Returned by a lookup when the exchange doesn't have the order
+NOT_FOUND = object()
+
+
+# Raised when it's not known if an order or loan went through, it's reported like an error from the exchange
+class UnknownOutcome(BinanceAPIException):
+
+    def __init__(self, message):
+        Exception.__init__(self, message)
+        self.code = 0
+        self.message = message
+        self.status_code = None
+        self.response = None
+        self.request = None
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Place the orders of a block of code for a signal, from its idempotency key
+@contextmanager
+def signal(key):
+    previous = (getattr(current, "digest", None), getattr(current, "sequence", 0))
+    current.digest = hashlib.sha256(key.encode()).hexdigest()[:20]
+    current.sequence = 0
+    try:
+        yield
+    finally:
+        current.digest, current.sequence = previous
+
+
+# Make a client order id, the tag at the start marks orders placed by the bot
+# Orders of a signal get the same id every time it's executed, from the signal and the order of the calls,
+# so the orders of a signal can be found by the part after the tag
+def client_order_id(kind="o"):
+    digest = getattr(current, "digest", None)
+    if digest is None:
+        return config.ORDER_TAG + uuid.uuid4().hex[:36 - len(config.ORDER_TAG)]
+    current.sequence += 1
+    return config.ORDER_TAG + digest + "-" + kind + str(current.sequence)
+
+
+# Send a call with a short deadline, and send it again if the first answer is slow, the first answer wins
+# The call returns NOT_FOUND if what it looks for isn't there
+# Returns the answer, or None if there was none before the deadline
+def lookup(find, deadline=None):
+    if deadline is None:
+        deadline = config.ORDER_LOOKUP_DEADLINE
+
+    # The lookups go out for the same account and with the same priority as the order
+    account = accounts.name()
+    priority = getattr(governor.current, "priority", governor.ENTRY)
+
+    def attempt(timeout):
+        with accounts.use(account), governor.protect(priority == governor.PROTECTIVE):
+            return find(requests_params={"timeout": timeout})
+
+    end = time.monotonic() + deadline
+    futures = set()
+    sent = 0
+    hedge_at = 0
+    while True:
+        now = time.monotonic()
+        if now >= end:
+            return None
+
+        # Send another lookup if the ones out are slow, or all failed
+        if sent < config.ORDER_LOOKUP_HEDGES and (now >= hedge_at or not futures):
+            futures.add(lookup_pool.submit(attempt, end - now))
+            sent += 1
+            hedge_at = now + config.ORDER_LOOKUP_HEDGE_DELAY
+            if sent > 1:
+                metrics.count("order_lookup_hedges_total")
+        elif not futures:
+            return None
+
+        until = end if sent >= config.ORDER_LOOKUP_HEDGES else min(end, hedge_at)
+        done, futures = wait(futures, timeout=max(until - now, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+
+
+# Look up an order by its client order id, returns the order, NOT_FOUND, or None if there was no answer in time
+# Ids come back when a signal repeats after the duplicate window, so an order from before that is another order
+def find_order(find, client_id, sent, **params):
+    oldest = (sent - config.INGEST_DEDUPE_TTL) * 1000
+
+    def get(**extra):
+        try:
+            order = find(origClientOrderId=client_id, **params, **extra)
+        except BinanceAPIException as e:
+            # The order doesn't exist
+            if e.code == -2013:
+                return NOT_FOUND
+            raise
+        if order.get('time', oldest) < oldest:
+            return NOT_FOUND
+        return order
+    return lookup(get)
+
+
+# Place an order, and when it times out, look it up by its client order id instead of guessing
+# Only an order that surely never left is sent again, a lookup that doesn't find an order proves nothing,
+# the exchange may still be working on it, and a filled order doesn't keep its client order id from being used again
+def place(create, find, **params):
+    client_id = params['newClientOrderId']
+    lookup_params = {name: params[name] for name in ("symbol", "isIsolated") if name in params}
+
+    for attempt in range(config.ORDER_RETRIES + 1):
+        sent = time.time()
+        try:
+            return create(requests_params={"timeout": config.ORDER_TIMEOUT}, **params)
+
+        # No answer, the order may or may not be placed
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = e
+
+        # No connection could be made, the exchange never got the order
+        if transport.unsent(error):
+            metrics.count("order_unsent_total")
+            continue
+
+        metrics.count("order_timeouts_total")
+        found = find_order(find, client_id, sent, **lookup_params)
+        jobs.stage("order lookup", {"client_order_id": client_id,
+                                    "found": None if found is None else found is not NOT_FOUND})
+
+        # It was placed, the order as it is now stands in for the answer
+        if found is not None and found is not NOT_FOUND:
+            return found
+
+        # Not found, or not known in time, sending it again could place it twice
+        raise UnknownOutcome("Order " + client_id + " timed out and wasn't found (" + str(error) + ") ")
+
+    raise UnknownOutcome("Order " + client_id + " couldn't be sent " + str(config.ORDER_RETRIES + 1) +
+                         " times, it was never placed (" + str(error) + ") ")
+
+
+# Take or repay a loan, and when it times out, look for it in the records of the account
+# Loans have no client id, so the record has to match the asset and amount, and a missing one isn't retried,
+# as the records can lag behind
+def transact(create, records, **params):
+    since = int(time.time() * 1000) - 1000
+    try:
+        return create(requests_params={"timeout": config.ORDER_TIMEOUT}, **params)
+
+    # No answer, the loan may or may not be taken or repaid
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        error = e
+
+    metrics.count("order_timeouts_total")
+    query = {"asset": params['asset'], "startTime": since}
+    if params.get('isIsolated'):
+        query['isolatedSymbol'] = params['symbol']
+
+    def get(**extra):
+        for row in records(**query, **extra).get('rows', []):
+            if abs(float(row.get('principal', row.get('amount', 0))) - float(params['amount'])) < 1e-12:
+                return {"tranId": row.get('txId', row.get('tranId'))}
+        return NOT_FOUND
+
+    found = lookup(get)
+    jobs.stage("loan lookup", {"asset": params['asset'], "found": None if found is None else found is not NOT_FOUND})
+    if found is None or found is NOT_FOUND:
+        raise UnknownOutcome("Margin transaction of " + str(params['amount']) + " " + params['asset'] +
+                             " timed out and wasn't found (" + str(error) + ") ")
+    return found
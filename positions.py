@@ -0,0 +1,109 @@
+import sqlite3, threading, time, config, accounts
+
+# One connection per thread, SQLite takes care of locking between threads and gunicorn workers
+local = threading.local()
+
+# When the claimed signal ids were last pruned
+pruned = 0
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Get the connection of the current thread, creating the table on first use
+def connect():
+    connection = getattr(local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(config.POSITIONS_DB, timeout=5, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+
+        # Write-ahead log, so readers never wait for a writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        # Databases from before accounts keep their trades, as trades of the first account
+        # Checked again after locking, another worker may have migrated it in the meantime
+        if "account" not in columns_of(connection):
+            connection.execute("BEGIN IMMEDIATE")
+            columns = columns_of(connection)
+            if columns and "account" not in columns:
+                connection.execute("ALTER TABLE positions RENAME TO positions_old")
+                create(connection)
+                connection.execute("INSERT INTO positions SELECT ?, strategy, market, symbol, base, side, open, "
+                                   "updated FROM positions_old", (config.ACCOUNTS[0]['name'],))
+                connection.execute("DROP TABLE positions_old")
+            connection.execute("COMMIT")
+
+        create(connection)
+        local.connection = connection
+    return connection
+
+
+# Get the columns of the table, none if it doesn't exist yet
+def columns_of(connection):
+    return [row['name'] for row in connection.execute("PRAGMA table_info(positions)")]
+
+
+# Create the table, every account has its own last trade per strategy and market
+def create(connection):
+    connection.execute("CREATE TABLE IF NOT EXISTS positions ("
+                       "account TEXT NOT NULL, "
+                       "strategy TEXT NOT NULL, "
+                       "market TEXT NOT NULL, "
+                       "symbol TEXT NOT NULL, "
+                       "base TEXT NOT NULL, "
+                       "side TEXT NOT NULL, "
+                       "open INTEGER NOT NULL, "
+                       "updated REAL NOT NULL, "
+                       "PRIMARY KEY (account, strategy, market))")
+    connection.execute("DROP INDEX IF EXISTS positions_symbol")
+    connection.execute("CREATE INDEX IF NOT EXISTS positions_account_symbol ON positions (account, symbol, market)")
+
+    # Ids of the signals received lately, shared by the gunicorn workers
+    connection.execute("CREATE TABLE IF NOT EXISTS signals (key TEXT PRIMARY KEY, received REAL NOT NULL)")
+
+
+# Record the last trade of a strategy on a market, replacing the previous one in a single transaction
+# Trades are recorded for the account the current thread trades for
+def record(strategy, symbol, base, market, side):
+    # Selling on Spot closes the position, everything else leaves one open
+    is_open = not (market == "SPOT" and side == "SELL")
+
+    connect().execute("INSERT INTO positions (account, strategy, market, symbol, base, side, open, updated) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                      "ON CONFLICT (account, strategy, market) DO UPDATE SET "
+                      "symbol = excluded.symbol, base = excluded.base, side = excluded.side, "
+                      "open = excluded.open, updated = excluded.updated",
+                      (accounts.name(), strategy, market, symbol, base, side, int(is_open), time.time()))
+
+
+# Get the last trade of a strategy on a market, or None
+def last(strategy, market):
+    return connect().execute("SELECT * FROM positions WHERE account = ? AND strategy = ? AND market = ?",
+                             (accounts.name(), strategy, market)).fetchone()
+
+
+# Get the open positions on a pair
+def find(symbol, market):
+    return connect().execute("SELECT * FROM positions WHERE account = ? AND symbol = ? AND market = ? AND open = 1",
+                             (accounts.name(), symbol, market)).fetchall()
+
+
+# Claim the id of a received signal, in a single statement, so only one worker or thread ever gets it
+# Returns False if it was claimed less than ttl seconds ago
+def claim(key, ttl):
+    global pruned
+    now = time.time()
+    connection = connect()
+
+    # Forget the old ids now and then
+    if pruned < now - ttl:
+        pruned = now
+        connection.execute("DELETE FROM signals WHERE received < ?", (now - ttl,))
+
+    cursor = connection.execute("INSERT INTO signals (key, received) VALUES (?, ?) "
+                                "ON CONFLICT (key) DO UPDATE SET received = excluded.received "
+                                "WHERE signals.received < ?", (key, now, now - ttl))
+    return cursor.rowcount == 1
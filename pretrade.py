@@ -0,0 +1,61 @@
+import time, config, metrics, jobs, governor, accounts
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# What a signal needs to know before it trades, gathered at the same time
+# The wallet has the "asset" and "base" currency records, and for Isolated margin the "margin_ratio"
+# The price is None when selling, it is only gathered for buying
+# Timings are the seconds every call took, the slowest one is the critical path
+Snapshot = namedtuple("Snapshot", ["rules", "cancelled", "wallet", "price", "timings"])
+
+# Threads for the pre-trade calls of every signal
+pool = ThreadPoolExecutor(max_workers=config.PRETRADE_WORKERS, thread_name_prefix="pretrade")
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Run a call in a pool thread for the account, job, labels and priority of the signal, and time it
+def timed_call(context, name, function, args):
+    account, job, labels, priority = context
+    previous = getattr(jobs.current, "job", None)
+    jobs.current.job = job
+    try:
+        with accounts.use(account), metrics.signal(**labels), governor.protect(priority == governor.PROTECTIVE):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = function(*args)
+                outcome = "success"
+                return result, time.perf_counter() - start
+            finally:
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="pretrade " + name,
+                                outcome=outcome)
+    finally:
+        jobs.current.job = previous
+
+
+# Run independent calls at the same time, as {name: (function, args)}
+# Returns their results and timings by name, errors are raised like the calls were made one by one
+# The simulator answers right away, so its calls are made one by one, a thread would cost more than the call
+def gather(calls):
+    context = (accounts.name(),
+               getattr(jobs.current, "job", None),
+               getattr(metrics.current, "labels", {}),
+               getattr(governor.current, "priority", governor.ENTRY))
+
+    results = {}
+    timings = {}
+    if config.EXCHANGE == "simulator":
+        for name, (function, args) in calls.items():
+            results[name], timings[name] = timed_call(context, name, function, args)
+    else:
+        futures = {name: pool.submit(timed_call, context, name, function, args)
+                   for name, (function, args) in calls.items()}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+
+    jobs.stage("pretrade", timings)
+    return results, timings
@@ -0,0 +1,121 @@
+import threading, time, config, metrics, shared_cache
+from stream import Stream
+
+# Latest best bid and ask of every subscribed pair, as (bid, ask, time received)
+# With several workers only the leading one streams, and publishes the prices in the shared cache
+books = {}
+subscribed = set()
+claimed = set()
+lock = threading.Lock()
+stream = None
+request_id = 0
+follower = None
+
+# Seconds between checks for pairs other workers asked prices for
+CLAIM_INTERVAL = 0.5
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Store a book ticker update
+def received(message):
+
+    # Subscription confirmations have no pair
+    if 's' not in message:
+        return
+
+    books[message['s']] = (float(message['b']), float(message['a']), time.time())
+    shared_cache.write_price(message['s'], *books[message['s']])
+
+
+# Ask the stream for the book ticker of some pairs
+def send_subscribe(connection, symbols):
+    global request_id
+
+    if not symbols:
+        return
+    request_id += 1
+    connection.send({"method": "SUBSCRIBE",
+                     "params": [symbol.lower() + "@bookTicker" for symbol in symbols],
+                     "id": request_id})
+
+
+# Resubscribe to every pair after connecting or reconnecting
+def opened(connection):
+    send_subscribe(connection, sorted(subscribed))
+
+
+# Stream the pairs other workers asked prices for, while this worker leads
+def follow_claims():
+    while True:
+        time.sleep(CLAIM_INTERVAL)
+        if shared_cache.leader:
+            for symbol in shared_cache.claimed_prices():
+                subscribe(symbol)
+
+
+# Start streaming the prices of a pair, the stream is opened on the first subscription
+# A worker following the shared cache asks the leader to stream it instead
+# The simulator has no streams, prices are read from it directly
+def subscribe(symbol):
+    global stream, follower
+
+    if config.EXCHANGE == "simulator":
+        return
+
+    if follower is None:
+        with lock:
+            if follower is None:
+                follower = threading.Thread(target=follow_claims, name="price claims", daemon=True)
+                follower.start()
+
+    if shared_cache.following():
+        if symbol not in claimed:
+            shared_cache.claim_price(symbol)
+            claimed.add(symbol)
+        return
+
+    with lock:
+        if symbol in subscribed:
+            return
+        subscribed.add(symbol)
+
+        if stream is None:
+            stream = Stream(config.STREAM_URL.rstrip("/"), received, on_open=opened, name="book ticker").start()
+            return
+
+    send_subscribe(stream, [symbol])
+
+
+# Get the streamed price of a pair, or None if it's missing or too old
+# Buying is priced at the best ask, selling at the best bid, and anything else at the middle
+def latest(symbol, side=None):
+    if shared_cache.following():
+        book = shared_cache.read_price(symbol)
+    else:
+        book = books.get(symbol)
+    if book is None or time.time() - book[2] > config.PRICE_MAX_AGE:
+        return None
+
+    bid, ask, received_at = book
+    if side == "BUY":
+        return ask
+    if side == "SELL":
+        return bid
+    return (bid + ask) / 2
+
+
+# Get the price of a pair, from the stream if it's fresh enough, else over REST
+@metrics.timed("price")
+def get_price(client, symbol, side=None):
+    subscribe(symbol)
+
+    price = latest(symbol, side)
+    if price is not None:
+        return price
+
+    # The stream is lagging, or hasn't delivered yet
+    return float(client.get_margin_price_index(symbol=symbol)['price'])
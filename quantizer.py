@@ -0,0 +1,161 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+
+# Quantity and price filters of a single pair, compiled to Decimals once when the exchange info is loaded
+# Market orders have their own quantity rules, limit orders use the LOT_SIZE ones
+# percent_price holds the (down, up) multipliers of the allowed price band per side, around the average price
+Quantizer = namedtuple("Quantizer", ["step_size", "min_quantity", "max_quantity",
+                                     "market_step_size", "market_min_quantity", "market_max_quantity",
+                                     "tick_size", "min_price", "max_price",
+                                     "min_notional", "max_notional", "min_notional_market", "max_notional_market",
+                                     "percent_price"])
+
+ZERO = Decimal(0)
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Turn a number into an exact Decimal, floats go through their shortest text form, so 0.1 stays 0.1
+def to_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+# Format a Decimal the way the exchange expects it, without an exponent
+def text(value):
+    return format(value.normalize(), "f")
+
+
+# Snap a value to a multiple of a step, rounding down unless told otherwise
+def snap(value, step, rounding=ROUND_DOWN):
+    if step <= 0:
+        return value
+    return (value / step).to_integral_value(rounding=rounding) * step
+
+
+# Compile the filters of a pair from the exchange info
+def build(filters):
+    values = {"step_size": ZERO, "min_quantity": ZERO, "max_quantity": ZERO,
+              "market_step_size": ZERO, "market_min_quantity": ZERO, "market_max_quantity": ZERO,
+              "tick_size": ZERO, "min_price": ZERO, "max_price": ZERO,
+              "min_notional": ZERO, "max_notional": ZERO, "min_notional_market": True, "max_notional_market": False,
+              "percent_price": {}}
+
+    for rule in filters:
+
+        # Quantity rules of every order
+        if rule['filterType'] == "LOT_SIZE":
+            values['step_size'] = to_decimal(rule['stepSize']).normalize()
+            values['min_quantity'] = to_decimal(rule['minQty'])
+            values['max_quantity'] = to_decimal(rule['maxQty'])
+
+        # Quantity rules of market orders, a zero step means the LOT_SIZE step applies
+        elif rule['filterType'] == "MARKET_LOT_SIZE":
+            values['market_step_size'] = to_decimal(rule['stepSize']).normalize()
+            values['market_min_quantity'] = to_decimal(rule['minQty'])
+            values['market_max_quantity'] = to_decimal(rule['maxQty'])
+
+        # Price rules
+        elif rule['filterType'] == "PRICE_FILTER":
+            values['tick_size'] = to_decimal(rule['tickSize']).normalize()
+            values['min_price'] = to_decimal(rule['minPrice'])
+            values['max_price'] = to_decimal(rule['maxPrice'])
+
+        # Minimum base currency amount of an order, older pairs
+        elif rule['filterType'] == "MIN_NOTIONAL":
+            values['min_notional'] = to_decimal(rule['minNotional'])
+            values['min_notional_market'] = bool(rule.get('applyToMarket', True))
+
+        # Minimum and maximum base currency amount of an order, newer pairs
+        elif rule['filterType'] == "NOTIONAL":
+            values['min_notional'] = to_decimal(rule['minNotional'])
+            values['max_notional'] = to_decimal(rule.get('maxNotional', 0))
+            values['min_notional_market'] = bool(rule.get('applyMinToMarket', True))
+            values['max_notional_market'] = bool(rule.get('applyMaxToMarket', False))
+
+        # Price band around the average price, the same for both sides
+        elif rule['filterType'] == "PERCENT_PRICE":
+            band = (to_decimal(rule['multiplierDown']), to_decimal(rule['multiplierUp']))
+            values['percent_price'] = {"BUY": band, "SELL": band}
+
+        # Price band around the average price, per side
+        elif rule['filterType'] == "PERCENT_PRICE_BY_SIDE":
+            values['percent_price'] = {"BUY": (to_decimal(rule['bidMultiplierDown']),
+                                               to_decimal(rule['bidMultiplierUp'])),
+                                       "SELL": (to_decimal(rule['askMultiplierDown']),
+                                                to_decimal(rule['askMultiplierUp']))}
+
+    return Quantizer(**values)
+
+
+# Get the step, minimum and maximum quantity of a market or limit order
+def quantity_rules(quantizer, market=True):
+    step, minimum, maximum = quantizer.step_size, quantizer.min_quantity, quantizer.max_quantity
+    if market:
+        if quantizer.market_step_size > 0:
+            step = quantizer.market_step_size
+        minimum = max(minimum, quantizer.market_min_quantity)
+        if quantizer.market_max_quantity > 0:
+            maximum = min(maximum, quantizer.market_max_quantity) if maximum > 0 else quantizer.market_max_quantity
+    return step, minimum, maximum
+
+
+# Round a quantity down to the step, and down to the maximum if it's over it
+def quantity(quantizer, amount, market=True):
+    step, minimum, maximum = quantity_rules(quantizer, market)
+    amount = to_decimal(amount)
+    if maximum > 0 and amount > maximum:
+        amount = maximum
+    return snap(amount, step)
+
+
+# Snap a price to the tick size, keeping it inside the percent price band around a reference price, if given
+# Stop-limit prices round away from the market, so they don't trigger right away
+def price(quantizer, value, side, reference=None, rounding=ROUND_DOWN):
+    value = to_decimal(value)
+
+    # Keep it inside the band, on the allowed side of the edge
+    band = quantizer.percent_price.get(side)
+    if band is not None and reference is not None:
+        reference = to_decimal(reference)
+        low, high = reference * band[0], reference * band[1]
+        if value < low:
+            value, rounding = low, ROUND_UP
+        elif value > high:
+            value, rounding = high, ROUND_DOWN
+
+    value = snap(value, quantizer.tick_size, rounding)
+    if quantizer.min_price > 0 and value < quantizer.min_price:
+        value = quantizer.min_price
+    if quantizer.max_price > 0 and value > quantizer.max_price:
+        value = quantizer.max_price
+    return value
+
+
+# Check an order against the filters, returns the failed filter like the exchange names it, or None
+# Market orders are checked against the price they are expected to fill at, if it's known
+def check(quantizer, amount, order_price=None, market=True):
+    step, minimum, maximum = quantity_rules(quantizer, market)
+    if amount <= 0 or amount < minimum or (maximum > 0 and amount > maximum) or snap(amount, step) != amount:
+        return "Filter failure: " + ("MARKET_LOT_SIZE" if market and quantizer.market_step_size > 0 else "LOT_SIZE")
+
+    if order_price is None:
+        return None
+    order_price = to_decimal(order_price)
+
+    if not market:
+        if snap(order_price, quantizer.tick_size) != order_price or order_price < quantizer.min_price or \
+                (quantizer.max_price > 0 and order_price > quantizer.max_price):
+            return "Filter failure: PRICE_FILTER"
+
+    notional = amount * order_price
+    if (not market or quantizer.min_notional_market) and notional < quantizer.min_notional:
+        return "Filter failure: NOTIONAL"
+    if (not market or quantizer.max_notional_market) and 0 < quantizer.max_notional < notional:
+        return "Filter failure: NOTIONAL"
+
+    return None
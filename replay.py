@@ -0,0 +1,141 @@
+import argparse, io, json, os, sys, tempfile, time
+import config, simulator
+from concurrent.futures import ThreadPoolExecutor
+
+# Replay of recorded webhook signals through the /webhook address, against the simulated exchange of simulator.py
+# Usage: python replay.py signals.jsonl --prices prices.jsonl --threads 8
+# Every line of the files is a JSON object, webhook payloads, or price moves like {"symbol", "price"}
+# Lines with a "time" are put in order by it, lines without one keep the time of the line before them
+# Every price move waits for the signals before it, so signals always trade at the prices they were recorded with,
+# with one thread the same files always give the same fills
+
+
+# Read a file of signals and price moves, as (time, kind, payload)
+def read(path):
+    events = []
+    at = 0.0
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            payload = json.loads(line)
+            at = float(payload.get('time', at))
+
+            # A price move
+            if "price" in payload and "strategy" not in payload:
+                events.append((at, "price", payload))
+                continue
+
+            # Recorded signals may have no id, and repeat in seconds here what was hours apart, so they get one from
+            # their line, and the duplicate check only drops signals that were really sent twice
+            payload.setdefault(config.INGEST_ID_FIELD, os.path.basename(path) + ":" + str(number))
+            payload.setdefault('passphrase', config.WEBHOOK_PASSPHRASE)
+            events.append((at, "signal", payload))
+    return events
+
+
+# Point the bot at the simulator, this has to happen before main is imported
+def setup():
+    config.EXCHANGE = "simulator"
+    config.POSITIONS_DB = os.path.join(tempfile.mkdtemp(), "positions.db")
+    config.REPORT = False
+    config.ASYNC_EXECUTION = False
+
+    # Signals are replayed as fast as they go, coalescing would drop most of them
+    config.COALESCE_WINDOW = 0
+
+    import main
+    return main
+
+
+# Send a payload to the /webhook address of the app, as a bare WSGI call, returns the code of the answer
+# A test client or a server would take longer than the signal itself
+def post(app, payload):
+    body = json.dumps(payload).encode()
+    environ = {"REQUEST_METHOD": "POST", "PATH_INFO": "/webhook", "SERVER_NAME": "replay", "SERVER_PORT": "80",
+               "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(body),
+               "wsgi.errors": sys.stderr, "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(body))}
+    status = []
+    answer = b"".join(app(environ, lambda code, headers, exc_info=None: status.append(code)))
+    try:
+        return json.loads(answer).get("code", status[0])
+    except ValueError:
+        return status[0]
+
+
+# Send the signals and move the prices in order, returns the code of every signal
+def replay(main, events, threads=1):
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="replay")
+    codes = {}
+
+    def send(payload):
+        return post(main.app, payload)
+
+    waiting = []
+    for at, kind, payload in events:
+        if kind == "price":
+            for future in waiting:
+                code = future.result()
+                codes[code] = codes.get(code, 0) + 1
+            waiting = []
+            simulator.move(payload['symbol'], payload['price'])
+        elif threads == 1:
+            code = send(payload)
+            codes[code] = codes.get(code, 0) + 1
+        else:
+            waiting.append(pool.submit(send, payload))
+
+    for future in waiting:
+        code = future.result()
+        codes[code] = codes.get(code, 0) + 1
+    pool.shutdown()
+    return codes
+
+
+def main_replay():
+    parser = argparse.ArgumentParser(description="Replay recorded webhook signals against the simulated exchange")
+    parser.add_argument("signals", nargs="+", help="JSONL files of webhook payloads and price moves")
+    parser.add_argument("--prices", action="append", default=[], help="JSONL file of price moves")
+    parser.add_argument("--threads", type=int, default=1, help="signals sent at the same time between price moves")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    events = []
+    for path in args.signals + args.prices:
+        events.extend(read(path))
+
+    # Sorted by time, events at the same time keep the order of the files
+    events.sort(key=lambda event: event[0])
+
+    main = setup()
+
+    start = time.perf_counter()
+    codes = replay(main, events, args.threads)
+    elapsed = time.perf_counter() - start
+
+    signals = sum(codes.values())
+    summary = {"signals": signals,
+               "price_moves": len(events) - signals,
+               "seconds": round(elapsed, 3),
+               "signals_per_second": round(signals / elapsed, 1) if elapsed else None,
+               "codes": codes,
+               "calls": dict(sorted(simulator.calls.items())),
+               "accounts": {name: simulator.summary(name) for name in main.accounts.names()}}
+
+    print("%d signals and %d price moves in %.3f s, %.1f signals/s" % (signals, summary['price_moves'], elapsed,
+                                                                     summary['signals_per_second'] or 0))
+    for code, count in sorted(codes.items()):
+        print("    %-20s %7d" % (code, count))
+    for name, wallets in summary['accounts'].items():
+        for key, wallet in wallets.items():
+            print("    %-10s %-10s value %14.2f %s  debts %12.2f  open orders %d" % (
+                name, key, wallet['value'], config.SIMULATOR_VALUATION_ASSET, wallet['debts'], wallet['open_orders']))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_replay()
@@ -0,0 +1,134 @@
+import threading, queue, time, json, os, config, transport
+
+# Reports waiting to be sent, the trading functions never wait for Discord
+reports = queue.Queue(maxsize=config.REPORT_QUEUE_SIZE)
+worker = None
+lock = threading.Lock()
+
+# Discord refuses messages longer than this
+MESSAGE_LIMIT = 2000
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Queue a report, it will be sent together with the other reports of the same time window
+def report(message):
+    start()
+    try:
+        reports.put_nowait(message)
+
+    # The queue is full, keep the report on disk, or drop it
+    except queue.Full:
+        spill(message)
+
+
+# Save a report that didn't fit in the queue, it will be sent once the queue is empty
+def spill(message):
+    if not config.REPORT_SPILL_FILE:
+        return
+    with lock:
+        with open(config.REPORT_SPILL_FILE, "a") as f:
+            f.write(json.dumps(message) + "\n")
+
+
+# Read and remove the saved reports
+def unspill():
+    if not config.REPORT_SPILL_FILE:
+        return []
+    with lock:
+        try:
+            with open(config.REPORT_SPILL_FILE, "r") as f:
+                messages = [json.loads(line) for line in f if line.strip()]
+            os.remove(config.REPORT_SPILL_FILE)
+            return messages
+        except FileNotFoundError:
+            return []
+
+
+# Merge a batch of reports into Discord messages, repeated reports are sent once with a count
+def merge(batch):
+    counts = {}
+    for message in batch:
+        counts[message] = counts.get(message, 0) + 1
+
+    lines = []
+    for message, count in counts.items():
+        if count > 1:
+            message += " (x" + str(count) + ")"
+        lines.append(message)
+
+    # Split into messages Discord accepts
+    messages = []
+    content = "@everyone"
+    for line in lines:
+        line = line[:MESSAGE_LIMIT - len("@everyone\n")]
+        if len(content) + 1 + len(line) > MESSAGE_LIMIT:
+            messages.append(content)
+            content = "@everyone"
+        content += "\n" + line
+    messages.append(content)
+    return messages
+
+
+# Send a message to the Discord group, waiting out rate limits
+def post(content):
+    for attempt in range(config.REPORT_RETRIES):
+        try:
+            response = transport.post(config.DISCORD_LINK,
+                                      data={"content": content},
+                                      headers=config.DISCORD_HEADER)
+        except Exception as e:
+            print("report failed: " + str(e))
+            time.sleep(1)
+            continue
+
+        # Rate limited, Discord says how long to wait
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json()['retry_after'])
+            except (ValueError, KeyError):
+                retry_after = float(response.headers.get('Retry-After', 1))
+            time.sleep(retry_after)
+            continue
+
+        return True
+
+    print("report dropped: " + content)
+    return False
+
+
+# Collect reports for a time window, and send them as one message
+def run():
+    while True:
+        batch = [reports.get()]
+        deadline = time.time() + config.REPORT_WINDOW
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(reports.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Send the saved reports as well, once there's room again
+        if reports.empty():
+            batch += unspill()
+
+        for content in merge(batch):
+            post(content)
+
+
+# Start the background sender once
+def start():
+    global worker
+
+    if worker is not None:
+        return
+    with lock:
+        if worker is None:
+            worker = threading.Thread(target=run, name="reporter", daemon=True)
+            worker.start()
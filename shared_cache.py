@@ -0,0 +1,345 @@
+import os, mmap, struct, pickle, threading, time, config
+
+# Locking files between processes needs fcntl, without it every worker keeps its own caches
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# A memory mapped file shared by the gunicorn workers, one worker leads and keeps it up to date,
+# the others only read from it, without locks
+#
+# Layout: a header, the pair rules, and at the end a table of price slots
+# Every record has a version, it's odd while it's being written, readers retry if it changed under them
+HEADER = struct.Struct("<8sII")
+MAGIC = b"MBOTSHM1"
+HEADER_SIZE = 64
+
+# Rules: version, load time, count and length of the records, then a sorted index of (symbol, offset, length)
+RULES = struct.Struct("<QdII")
+INDEX = struct.Struct("<24sII")
+
+# Price slots: symbol, version, bid, ask and the time the price was received
+PRICE = struct.Struct("<24sQddd")
+VERSION = struct.Struct("<Q")
+
+# Returned when the rules aren't in the cache, or are too old to use
+MISSING = object()
+
+segment = None
+lock_file = None
+opened_by = None
+leader = False
+watcher = None
+
+# Where every pair is in the price table, and the rules read lately with their version
+price_slots = {}
+rules_read = {}
+
+lock = threading.Lock()
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Open the shared file, once per process, forked workers open their own
+# Only for Binance, so the pairs and prices of the simulator are never shared with workers trading for real
+def open_segment():
+    global segment, lock_file, opened_by, leader, watcher
+
+    if not config.SHARED_CACHE or config.EXCHANGE != "binance" or fcntl is None:
+        return None
+    if segment is not None and opened_by == os.getpid():
+        return segment
+
+    with lock:
+        if segment is not None and opened_by == os.getpid():
+            return segment
+
+        size = config.SHARED_CACHE_SIZE
+        fd = os.open(config.SHARED_CACHE_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        mapped = mmap.mmap(fd, size)
+        os.close(fd)
+
+        lock_file = open(config.SHARED_CACHE_FILE + ".lock", "a")
+        opened_by = os.getpid()
+        leader = False
+        price_slots.clear()
+        rules_read.clear()
+        segment = mapped
+
+        try_lead()
+        watcher = threading.Thread(target=watch, name="shared cache", daemon=True)
+        watcher.start()
+
+    return segment
+
+
+# Try to become the leading worker, the lock is released when the leader exits
+def try_lead():
+    global leader
+
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+
+    # A file from another layout, or a new one, is cleared
+    magic, price_count, unused = HEADER.unpack_from(segment, 0)
+    if magic != MAGIC or price_count != config.SHARED_PRICE_SLOTS:
+        segment[:] = bytes(len(segment))
+        HEADER.pack_into(segment, 0, MAGIC, config.SHARED_PRICE_SLOTS, 0)
+
+    # Finish the writes a previous leader left half done, so readers don't wait for them forever
+    for offset in [HEADER_SIZE] + [prices_offset() + PRICE.size * slot + 24
+                                   for slot in range(config.SHARED_PRICE_SLOTS)]:
+        version = VERSION.unpack_from(segment, offset)[0]
+        if version % 2:
+            VERSION.pack_into(segment, offset, version + 1)
+
+    leader = True
+    return True
+
+
+# Take over when the leading worker goes away
+def watch():
+    while opened_by == os.getpid() and not leader:
+        time.sleep(config.SHARED_CACHE_LEAD_RETRY)
+        try_lead()
+
+
+# Check if this worker reads the caches from another worker, once the leader set the file up
+def following():
+    if open_segment() is None or leader:
+        return False
+    magic, price_count, unused = HEADER.unpack_from(segment, 0)
+    return magic == MAGIC and price_count == config.SHARED_PRICE_SLOTS
+
+
+# Read a record consistently, retrying while it's written
+def read_versioned(offset, read):
+    while True:
+        before = VERSION.unpack_from(segment, offset)[0]
+        if before % 2:
+            time.sleep(0)
+            continue
+        result = read()
+        if VERSION.unpack_from(segment, offset)[0] == before:
+            return result, before
+
+
+# Write a record, readers see the old or the new version, never a mix
+def write_versioned(offset, write):
+    version = VERSION.unpack_from(segment, offset)[0]
+    VERSION.pack_into(segment, offset, version + 1)
+    write()
+    VERSION.pack_into(segment, offset, version + 2)
+
+
+# Get the start of the price table
+def prices_offset():
+    return len(segment) - config.SHARED_PRICE_SLOTS * PRICE.size
+
+
+# Turn a symbol into its fixed width form
+def symbol_bytes(symbol):
+    return symbol.encode().ljust(24, b"\0")
+
+
+# ---------------------------------------------------------------------------------------------
+# PAIR RULES
+# ---------------------------------------------------------------------------------------------
+
+
+# Publish the rules of every pair, only the leader does this
+def publish_rules(table, loaded_at):
+    if open_segment() is None or not leader:
+        return
+
+    symbols = sorted(table)
+    records = [pickle.dumps(table[symbol], protocol=pickle.HIGHEST_PROTOCOL) for symbol in symbols]
+    index_size = INDEX.size * len(symbols)
+    length = index_size + sum(len(record) for record in records)
+
+    # Doesn't fit, the workers keep their own rules
+    if HEADER_SIZE + RULES.size + length > prices_offset():
+        print("shared cache too small for the pair rules, " + str(length) + " bytes needed")
+        return
+
+    def write():
+        start = HEADER_SIZE + RULES.size
+        offset = index_size
+        for i, (symbol, record) in enumerate(zip(symbols, records)):
+            INDEX.pack_into(segment, start + INDEX.size * i, symbol_bytes(symbol), offset, len(record))
+            segment[start + offset:start + offset + len(record)] = record
+            offset += len(record)
+        version = VERSION.unpack_from(segment, HEADER_SIZE)[0]
+        RULES.pack_into(segment, HEADER_SIZE, version, loaded_at, len(symbols), length)
+
+    write_versioned(HEADER_SIZE, write)
+
+
+# Get the version of the published rules, or None if they are missing or too old
+def rules_version():
+    def read():
+        return RULES.unpack_from(segment, HEADER_SIZE)
+
+    (version, loaded_at, count, length), version = read_versioned(HEADER_SIZE, read)
+    if count == 0 or time.time() - loaded_at > config.EXCHANGE_INFO_TTL * 2:
+        return None
+    return version
+
+
+# Find a pair in the index with a binary search, returns the offset and length of its record, or None
+def find_rules(symbol, count):
+    start = HEADER_SIZE + RULES.size
+    wanted = symbol_bytes(symbol)
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        name, offset, length = INDEX.unpack_from(segment, start + INDEX.size * middle)
+        if name == wanted:
+            return start + offset, length
+        if name < wanted:
+            low = middle + 1
+        else:
+            high = middle
+    return None
+
+
+# Get the rules of a pair, None if the pair doesn't exist, or MISSING if the cache has no usable rules
+def get_rules(symbol):
+    version = rules_version()
+    if version is None:
+        return MISSING
+
+    # Read lately, and not republished since
+    cached = rules_read.get(symbol)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    def read():
+        count = RULES.unpack_from(segment, HEADER_SIZE)[2]
+        found = find_rules(symbol, count)
+        if found is None:
+            return None
+        offset, length = found
+        return bytes(segment[offset:offset + length])
+
+    record, version = read_versioned(HEADER_SIZE, read)
+    rules = pickle.loads(record) if record is not None else None
+    rules_read[symbol] = (version, rules)
+    return rules
+
+
+# Get the rules of every pair, as (symbol, rules) pairs
+def all_rules():
+    def read():
+        count = RULES.unpack_from(segment, HEADER_SIZE)[2]
+        start = HEADER_SIZE + RULES.size
+        records = []
+        for i in range(count):
+            name, offset, length = INDEX.unpack_from(segment, start + INDEX.size * i)
+            records.append((name.rstrip(b"\0").decode(), bytes(segment[start + offset:start + offset + length])))
+        return records
+
+    records, version = read_versioned(HEADER_SIZE, read)
+    return [(symbol, pickle.loads(record)) for symbol, record in records]
+
+
+# ---------------------------------------------------------------------------------------------
+# PRICES
+# ---------------------------------------------------------------------------------------------
+
+
+# Get the symbol in a price slot, or None if it's free
+def slot_symbol(slot):
+    name = segment[prices_offset() + PRICE.size * slot:prices_offset() + PRICE.size * slot + 24]
+    name = bytes(name).rstrip(b"\0")
+    return name.decode() if name else None
+
+
+# Find the price slot of a pair, claiming a free one if asked to, returns None if there's none
+# Claims are locked between workers, reads aren't
+def find_slot(symbol, claim=False):
+    if symbol in price_slots:
+        return price_slots[symbol]
+
+    for slot in range(config.SHARED_PRICE_SLOTS):
+        name = slot_symbol(slot)
+        if name == symbol:
+            price_slots[symbol] = slot
+            return slot
+        if name is None:
+            break
+
+    if not claim:
+        return None
+
+    with open(config.SHARED_CACHE_FILE + ".claims", "a") as claims:
+        fcntl.flock(claims, fcntl.LOCK_EX)
+        for slot in range(config.SHARED_PRICE_SLOTS):
+            name = slot_symbol(slot)
+            if name == symbol or name is None:
+                if name is None:
+                    offset = prices_offset() + PRICE.size * slot
+                    segment[offset:offset + 24] = symbol_bytes(symbol)
+                price_slots[symbol] = slot
+                return slot
+
+    print("shared cache has no free price slots for " + symbol)
+    return None
+
+
+# Ask the leader to stream the price of a pair
+def claim_price(symbol):
+    if following():
+        find_slot(symbol, claim=True)
+
+
+# Get every pair any worker asked a price for
+def claimed_prices():
+    if open_segment() is None:
+        return []
+    symbols = []
+    for slot in range(config.SHARED_PRICE_SLOTS):
+        name = slot_symbol(slot)
+        if name is None:
+            break
+        symbols.append(name)
+    return symbols
+
+
+# Publish the price of a pair, only the leader does this
+def write_price(symbol, bid, ask, received_at):
+    if open_segment() is None or not leader:
+        return
+    slot = find_slot(symbol, claim=True)
+    if slot is None:
+        return
+
+    offset = prices_offset() + PRICE.size * slot
+
+    def write():
+        version = VERSION.unpack_from(segment, offset + 24)[0]
+        PRICE.pack_into(segment, offset, symbol_bytes(symbol), version, bid, ask, received_at)
+
+    write_versioned(offset + 24, write)
+
+
+# Get the price of a pair as (bid, ask, time received), or None if no worker published one
+def read_price(symbol):
+    slot = find_slot(symbol)
+    if slot is None:
+        return None
+
+    offset = prices_offset() + PRICE.size * slot
+    (name, version, bid, ask, received_at), version = read_versioned(offset + 24,
+                                                                     lambda: PRICE.unpack_from(segment, offset))
+    if received_at == 0:
+        return None
+    return bid, ask, received_at
@@ -0,0 +1,577 @@
+import threading, time, itertools, json, config, quantizer
+from binance.exceptions import BinanceAPIException
+
+# In-memory stand-in for the exchange, for paper trading and replays without touching Binance
+# It keeps the balances and loans of every account, fills Market orders at the current price of the pair,
+# and keeps Stop-Limit orders until a price moved with move() triggers and crosses them
+# Orders are checked against the pair filters and the balances like the exchange does, and refused with its errors
+# Everything happens under one lock in the order of the calls, so the same calls and prices give the same fills
+
+# Pairs by symbol, as {"symbol", "base", "quote", "price", "info", "quantizer"}
+pairs = {}
+
+# Wallets by (account, key), the key is "SPOT", "CROSS" or an Isolated pair
+# Every asset is a {"free", "locked", "borrowed"} dictionary of floats
+wallets = {}
+
+# Orders by (account, key, symbol), by order id, open orders have the funds they hold under "held"
+# The open ones are also kept by themselves, and the last order of every client order id, so nothing is searched
+orders = {}
+resting = {}
+client_ids = {}
+
+# Loans and repays by (account, "loan" or "repay"), for the lookups
+records = {}
+
+# Calls by method, for the replay summary
+calls = {}
+
+order_ids = itertools.count(1)
+trade_ids = itertools.count(1)
+transaction_ids = itertools.count(1)
+
+lock = threading.RLock()
+
+# Amounts this close to each other are the same, the bot and the stand-in add up the same floats differently
+EPSILON = 1e-9
+
+
+# Raised for everything the exchange refuses, with the code and message of the exchange
+class SimulatedError(BinanceAPIException):
+
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+        self.status_code = 400
+        self.response = None
+        self.request = None
+
+    def __str__(self):
+        return "APIError(code=%d): %s" % (self.code, self.message)
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Set up the configured pairs, once
+def load():
+    with lock:
+        if pairs:
+            return
+        for symbol, base, quote, price, step, tick in config.SIMULATOR_PAIRS:
+            info = {"symbol": symbol, "status": "TRADING", "baseAsset": base, "quoteAsset": quote,
+                    "isMarginTradingAllowed": True,
+                    "filters": [{"filterType": "PRICE_FILTER", "minPrice": tick, "maxPrice": "1000000.00000000",
+                                 "tickSize": tick},
+                                {"filterType": "LOT_SIZE", "minQty": step, "maxQty": "9000000.00000000",
+                                 "stepSize": step},
+                                {"filterType": "NOTIONAL", "minNotional": "5.00000000",
+                                 "applyMinToMarket": True, "maxNotional": "9000000.00000000",
+                                 "applyMaxToMarket": False, "avgPriceMins": 5}]}
+            pairs[symbol] = {"symbol": symbol, "base": base, "quote": quote, "price": float(price),
+                             "info": info, "quantizer": quantizer.build(info['filters'])}
+
+
+# Forget every balance, order and loan, and go back to the configured prices
+def reset():
+    global order_ids, trade_ids, transaction_ids
+
+    with lock:
+        pairs.clear()
+        wallets.clear()
+        orders.clear()
+        resting.clear()
+        client_ids.clear()
+        records.clear()
+        calls.clear()
+        order_ids = itertools.count(1)
+        trade_ids = itertools.count(1)
+        transaction_ids = itertools.count(1)
+        load()
+
+
+# Get a pair, refused like the exchange does if it doesn't exist
+def pair_of(symbol):
+    load()
+    if symbol not in pairs:
+        raise SimulatedError(-1121, "Invalid symbol.")
+    return pairs[symbol]
+
+
+# Get a wallet of an account, made with the configured balances on first use
+# Isolated wallets only hold the two assets of their pair
+def wallet_of(account, key):
+    wallet = wallets.get((account, key))
+    if wallet is None:
+        assets = config.SIMULATOR_BALANCES
+        if key not in ("SPOT", "CROSS"):
+            pair = pair_of(key)
+            assets = {asset: config.SIMULATOR_BALANCES.get(asset, 0.0) for asset in (pair['base'], pair['quote'])}
+        wallet = wallets[(account, key)] = {asset: {"free": float(amount), "locked": 0.0, "borrowed": 0.0}
+                                            for asset, amount in assets.items()}
+    return wallet
+
+
+# Get the record of an asset in a wallet, Isolated wallets have no other assets
+def asset_of(wallet, key, asset):
+    if asset not in wallet:
+        if key not in ("SPOT", "CROSS"):
+            raise SimulatedError(-3027, "Not a valid margin asset.")
+        wallet[asset] = {"free": 0.0, "locked": 0.0, "borrowed": 0.0}
+    return wallet[asset]
+
+
+# Get the wallet key of a call, from the market and its isIsolated parameter
+def key_of(margin, params):
+    if not margin:
+        return "SPOT"
+    if str(params.get('isIsolated', False)).upper() == "TRUE":
+        return params['symbol']
+    return "CROSS"
+
+
+# Get the value of an asset in the valuation asset, from a pair with it, or 0 if there's none
+def value_of(asset):
+    target = config.SIMULATOR_VALUATION_ASSET
+    if asset == target:
+        return 1.0
+    if asset + target in pairs:
+        return pairs[asset + target]['price']
+    if target + asset in pairs:
+        return 1 / pairs[target + asset]['price']
+    return 0.0
+
+
+# Get the assets and debts of a wallet in the valuation asset
+def totals(wallet):
+    assets = sum((record['free'] + record['locked']) * value_of(asset) for asset, record in wallet.items())
+    debts = sum(record['borrowed'] * value_of(asset) for asset, record in wallet.items())
+    return assets, debts
+
+
+# Borrow an amount into a wallet, refused if the assets would be less than the minimum margin level of the debts
+def borrow(wallet, key, asset, amount):
+    record = asset_of(wallet, key, asset)
+    assets, debts = totals(wallet)
+    added = amount * value_of(asset)
+    if debts + added > 0 and (assets + added) / (debts + added) < config.SIMULATOR_MIN_MARGIN_LEVEL:
+        raise SimulatedError(-3006, "Your borrow amount has exceed maximum borrow amount.")
+    record['free'] += amount
+    record['borrowed'] += amount
+
+
+# Repay up to an amount of the debt of an asset from its free balance, returns the amount repaid
+def repay(wallet, key, asset, amount):
+    record = asset_of(wallet, key, asset)
+    amount = min(amount, record['borrowed'])
+    if amount > record['free'] + EPSILON:
+        raise SimulatedError(-3041, "Balance is not enough")
+    amount = min(amount, record['free'])
+    record['free'] -= amount
+    record['borrowed'] = max(record['borrowed'] - amount, 0.0)
+    return amount
+
+
+# Get the amount of a loan or repay, refused like the exchange does unless it's positive
+def amount_of(params):
+    amount = float(params['amount'])
+    if not amount > 0:
+        raise SimulatedError(-1100, "Illegal characters found in parameter 'amount'; "
+                                    "legal range is '^([0-9]{1,20})(\\.[0-9]{1,20})?$'.")
+    return amount
+
+
+# Book a loan or repay for the lookups
+def transaction(account, kind, asset, amount, key):
+    transaction_id = next(transaction_ids)
+    row = {"txId": transaction_id, "asset": asset, "principal": "%.8f" % amount, "amount": "%.8f" % amount,
+           "timestamp": int(time.time() * 1000), "status": "CONFIRMED"}
+    if key != "CROSS":
+        row['isolatedSymbol'] = key
+    records.setdefault((account, kind), []).append(row)
+    return {"tranId": transaction_id}
+
+
+# Move funds of an order between free and locked
+def hold(wallet, key, asset, amount):
+    record = asset_of(wallet, key, asset)
+    record['free'] -= amount
+    record['locked'] += amount
+
+
+# Give back funds held by an order
+def release(wallet, key, asset, amount):
+    record = asset_of(wallet, key, asset)
+    record['locked'] = max(record['locked'] - amount, 0.0)
+    record['free'] += amount
+
+
+# Fill an order at a price, the commission is taken from the asset received
+def execute(wallet, key, pair, order, price):
+    quantity = float(order['origQty'])
+    quote_quantity = quantity * price
+    base = asset_of(wallet, key, pair['base'])
+    quote = asset_of(wallet, key, pair['quote'])
+
+    # Funds held by a resting order are spent from locked
+    held = order.pop('held', None)
+    if held is not None:
+        asset, amount = held
+        release(wallet, key, asset, amount)
+
+    if order['side'] == "BUY":
+        commission, commission_asset = quantity * config.SIMULATOR_COMMISSION, pair['base']
+        quote['free'] -= quote_quantity
+        base['free'] += quantity - commission
+    else:
+        commission, commission_asset = quote_quantity * config.SIMULATOR_COMMISSION, pair['quote']
+        base['free'] -= quantity
+        quote['free'] += quote_quantity - commission
+
+    order.update({"executedQty": "%.8f" % quantity, "cummulativeQuoteQty": "%.8f" % quote_quantity,
+                  "status": "FILLED", "updateTime": int(time.time() * 1000)})
+    return [{"price": "%.8f" % price, "qty": "%.8f" % quantity, "commission": "%.8f" % commission,
+             "commissionAsset": commission_asset, "tradeId": next(trade_ids)}]
+
+
+# Check that a wallet has the free funds for an order, borrowing what's missing with the MARGIN_BUY side effect
+# Returns the borrowed asset and amount, or None
+def fund(wallet, key, asset, amount, side_effect):
+    record = asset_of(wallet, key, asset)
+    missing = amount - record['free']
+    if missing <= EPSILON:
+        return None
+    if side_effect == "MARGIN_BUY" and key != "SPOT":
+        try:
+            borrow(wallet, key, asset, missing)
+        except SimulatedError:
+            raise SimulatedError(-2010, "Account has insufficient balance for requested action.")
+        return asset, missing
+    raise SimulatedError(-2010, "Account has insufficient balance for requested action.")
+
+
+# Place an order for an account, Market orders fill right away, Stop-Limit orders rest until triggered
+def place(account, margin, params):
+    pair = pair_of(params['symbol'])
+    key = key_of(margin, params)
+    wallet = wallet_of(account, key)
+    book_key = (account, key, pair['symbol'])
+    order_type = params['type']
+    side = params['side']
+    quantity = quantizer.to_decimal(params['quantity'])
+    client_id = params.get('newClientOrderId') or "sim" + str(next(order_ids))
+    now = int(time.time() * 1000)
+
+    existing = client_ids.get(book_key, {}).get(client_id)
+    if existing is not None and existing['status'] == "NEW":
+        raise SimulatedError(-2010, "Duplicate order sent.")
+
+    order = {"symbol": pair['symbol'], "orderId": next(order_ids), "clientOrderId": client_id,
+             "transactTime": now, "time": now, "updateTime": now, "price": "0.00000000",
+             "origQty": quantizer.text(quantity), "executedQty": "0.00000000",
+             "cummulativeQuoteQty": "0.00000000", "status": "NEW", "timeInForce": "GTC",
+             "type": order_type, "side": side, "stopPrice": "0.00000000"}
+    if margin:
+        order['isIsolated'] = key != "CROSS"
+
+    # Filled right away at the current price
+    if order_type == "MARKET":
+        failure = quantizer.check(pair['quantizer'], quantity, pair['price'])
+        if failure:
+            raise SimulatedError(-1013, failure)
+
+        side_effect = params.get('sideEffectType')
+        if side == "BUY":
+            borrowed = fund(wallet, key, pair['quote'], float(quantity) * pair['price'], side_effect)
+        else:
+            borrowed = fund(wallet, key, pair['base'], float(quantity), side_effect)
+        order['fills'] = execute(wallet, key, pair, order, pair['price'])
+        if borrowed is not None:
+            order.update({"marginBuyBorrowAsset": borrowed[0], "marginBuyBorrowAmount": "%.8f" % borrowed[1]})
+
+        # Repay the debt of the received asset with what the order received
+        if side_effect == "AUTO_REPAY":
+            received = pair['base'] if side == "BUY" else pair['quote']
+            record = asset_of(wallet, key, received)
+            repay(wallet, key, received, min(record['borrowed'], record['free']))
+
+    # Rests until the price reaches the stop price, then until it crosses the limit price
+    elif order_type == "STOP_LOSS_LIMIT":
+        price = quantizer.to_decimal(params['price'])
+        stop_price = quantizer.to_decimal(params['stopPrice'])
+        failure = quantizer.check(pair['quantizer'], quantity, price, market=False)
+        if failure:
+            raise SimulatedError(-1013, failure)
+        if (side == "SELL" and float(stop_price) >= pair['price']) or \
+                (side == "BUY" and float(stop_price) <= pair['price']):
+            raise SimulatedError(-2010, "Stop price would trigger immediately.")
+
+        if side == "BUY":
+            held = (pair['quote'], float(quantity * price))
+        else:
+            held = (pair['base'], float(quantity))
+        fund(wallet, key, held[0], held[1], None)
+        hold(wallet, key, held[0], held[1])
+        order.update({"price": quantizer.text(price), "stopPrice": quantizer.text(stop_price),
+                      "held": held, "triggered": False, "fills": []})
+
+    else:
+        raise SimulatedError(-1116, "Invalid orderType.")
+
+    orders.setdefault(book_key, {})[order['orderId']] = order
+    client_ids.setdefault(book_key, {})[client_id] = order
+    if order['status'] == "NEW":
+        resting.setdefault(book_key, {})[order['orderId']] = order
+    return public(order)
+
+
+# Get an order as the exchange shows it, without what the stand-in keeps on it
+# Lookups answer without the fills, like the exchange
+def public(order, hidden=("held", "triggered")):
+    return {name: value for name, value in order.items() if name not in hidden}
+
+
+# Find an order of an account by its order id or client order id
+def find(account, margin, params):
+    book_key = (account, key_of(margin, params), pair_of(params['symbol'])['symbol'])
+    if params.get('orderId') is not None:
+        return orders.get(book_key, {}).get(int(params['orderId']))
+    return client_ids.get(book_key, {}).get(params.get('origClientOrderId'))
+
+
+# Cancel a resting order, giving back the funds it holds
+def cancel(account, key, order):
+    held = order.pop('held', None)
+    if held is not None:
+        release(wallet_of(account, key), key, held[0], held[1])
+    order.update({"status": "CANCELED", "updateTime": int(time.time() * 1000)})
+    resting[(account, key, order['symbol'])].pop(order['orderId'], None)
+    return public(order)
+
+
+# Move the price of a pair, triggering and filling the Stop-Limit orders it reaches
+# Sell stops trigger at or below their stop price and fill once the price is at or above their limit price,
+# buy stops the other way around
+def move(symbol, price):
+    with lock:
+        pair = pair_of(symbol)
+        pair['price'] = float(price)
+
+        for (account, key, book_symbol), book in resting.items():
+            if book_symbol != symbol:
+                continue
+            for order in list(book.values()):
+                stop_price, limit_price = float(order['stopPrice']), float(order['price'])
+                selling = order['side'] == "SELL"
+                if not order['triggered']:
+                    order['triggered'] = pair['price'] <= stop_price if selling else pair['price'] >= stop_price
+                if order['triggered'] and (pair['price'] >= limit_price if selling else pair['price'] <= limit_price):
+                    order['fills'] = execute(wallet_of(account, key), key, pair, order, limit_price)
+                    del book[order['orderId']]
+
+
+# Get the open orders of a pair
+def open_orders(account, key, symbol):
+    return list(resting.get((account, key, pair_of(symbol)['symbol']), {}).values())
+
+
+# Get an asset as the exchange shows it
+def balance(asset, record):
+    return {"asset": asset, "free": "%.8f" % record['free'], "locked": "%.8f" % record['locked'],
+            "borrowed": "%.8f" % record['borrowed'], "interest": "0.00000000",
+            "netAsset": "%.8f" % (record['free'] + record['locked'] - record['borrowed'])}
+
+
+# Get the value, debts and open orders of every wallet of an account, for the replay summary
+def summary(account):
+    with lock:
+        result = {}
+        for (owner, key), wallet in sorted(wallets.items()):
+            if owner != account:
+                continue
+            assets, debts = totals(wallet)
+            result[key] = {"value": round(assets - debts, 8),
+                           "debts": round(debts, 8),
+                           "open_orders": sum(len(book) for (owner_of, book_key, symbol), book in resting.items()
+                                              if owner_of == account and book_key == key),
+                           "assets": {asset: {name: round(amount, 8) for name, amount in record.items()}
+                                      for asset, record in wallet.items() if any(record.values())}}
+        return result
+
+
+# The client of a simulated account, with the calls of the python-binance client the bot makes
+# Every call takes the lock, so threads trading at the same time see the wallets one call after another
+class Client:
+
+    API_KEY = "simulator"
+    API_SECRET = "simulator"
+
+    def __init__(self, account):
+        self.account = account
+        self.session = None
+        self.timestamp_offset = 0
+        load()
+
+    # Count a call and drop the request parameters of the REST client
+    def call(self, method, params):
+        params.pop('requests_params', None)
+        with lock:
+            calls[method] = calls.get(method, 0) + 1
+        return params
+
+    def ping(self):
+        return {}
+
+    def get_server_time(self):
+        return {"serverTime": int(time.time() * 1000)}
+
+    def get_exchange_info(self, **params):
+        with lock:
+            self.call("get_exchange_info", params)
+            return {"timezone": "UTC", "serverTime": int(time.time() * 1000), "rateLimits": [],
+                    "symbols": [json.loads(json.dumps(pair['info'])) for pair in pairs.values()]}
+
+    def get_margin_price_index(self, **params):
+        with lock:
+            params = self.call("get_margin_price_index", params)
+            pair = pair_of(params['symbol'])
+            return {"calcTime": int(time.time() * 1000), "price": "%.8f" % pair['price'], "symbol": pair['symbol']}
+
+    # Wallets
+    def get_account(self, **params):
+        with lock:
+            self.call("get_account", params)
+            wallet = wallet_of(self.account, "SPOT")
+            return {"balances": [{"asset": asset, "free": "%.8f" % record['free'], "locked": "%.8f" % record['locked']}
+                                 for asset, record in wallet.items()]}
+
+    def get_margin_account(self, **params):
+        with lock:
+            self.call("get_margin_account", params)
+            wallet = wallet_of(self.account, "CROSS")
+            assets, debts = totals(wallet)
+            return {"marginLevel": "%.8f" % (assets / debts if debts else 999),
+                    "userAssets": [balance(asset, record) for asset, record in wallet.items()]}
+
+    def get_isolated_margin_account(self, **params):
+        with lock:
+            params = self.call("get_isolated_margin_account", params)
+            result = []
+            for symbol in params['symbols'].split(","):
+                pair = pair_of(symbol)
+                wallet = wallet_of(self.account, symbol)
+                result.append({"symbol": symbol, "isolatedCreated": True,
+                               "marginRatio": str(config.SIMULATOR_ISOLATED_MARGIN_RATIO),
+                               "baseAsset": balance(pair['base'], asset_of(wallet, symbol, pair['base'])),
+                               "quoteAsset": balance(pair['quote'], asset_of(wallet, symbol, pair['quote']))})
+            return {"assets": result}
+
+    # Orders
+    def create_order(self, **params):
+        with lock:
+            return place(self.account, False, self.call("create_order", params))
+
+    def create_margin_order(self, **params):
+        with lock:
+            return place(self.account, True, self.call("create_margin_order", params))
+
+    def get_order(self, **params):
+        return self.get(False, self.call("get_order", params))
+
+    def get_margin_order(self, **params):
+        return self.get(True, self.call("get_margin_order", params))
+
+    def get(self, margin, params):
+        with lock:
+            order = find(self.account, margin, params)
+            if order is None:
+                raise SimulatedError(-2013, "Order does not exist.")
+            return public(order, ("held", "triggered", "fills"))
+
+    def get_open_orders(self, **params):
+        with lock:
+            params = self.call("get_open_orders", params)
+            return [public(order) for order in open_orders(self.account, "SPOT", params['symbol'])]
+
+    def get_open_margin_orders(self, **params):
+        with lock:
+            params = self.call("get_open_margin_orders", params)
+            return [public(order) for order in open_orders(self.account, key_of(True, params), params['symbol'])]
+
+    def cancel_order(self, **params):
+        return self.cancel(False, self.call("cancel_order", params))
+
+    def cancel_margin_order(self, **params):
+        return self.cancel(True, self.call("cancel_margin_order", params))
+
+    def cancel(self, margin, params):
+        with lock:
+            order = find(self.account, margin, params)
+            if order is None or order['status'] != "NEW":
+                raise SimulatedError(-2011, "Unknown order sent.")
+            return cancel(self.account, key_of(margin, params), order)
+
+    def cancel_all_open_orders(self, **params):
+        return self.cancel_all(False, self.call("cancel_all_open_orders", params))
+
+    def cancel_all_open_margin_orders(self, **params):
+        return self.cancel_all(True, self.call("cancel_all_open_margin_orders", params))
+
+    def cancel_all(self, margin, params):
+        with lock:
+            key = key_of(margin, params)
+            resting = open_orders(self.account, key, params['symbol'])
+            if not resting:
+                raise SimulatedError(-2011, "Unknown order sent.")
+            return [cancel(self.account, key, order) for order in resting]
+
+    # Loans
+    def create_margin_loan(self, **params):
+        with lock:
+            params = self.call("create_margin_loan", params)
+            key = key_of(True, params)
+            amount = amount_of(params)
+            borrow(wallet_of(self.account, key), key, params['asset'], amount)
+            return transaction(self.account, "loan", params['asset'], amount, key)
+
+    def repay_margin_loan(self, **params):
+        with lock:
+            params = self.call("repay_margin_loan", params)
+            key = key_of(True, params)
+            amount = repay(wallet_of(self.account, key), key, params['asset'], amount_of(params))
+            return transaction(self.account, "repay", params['asset'], amount, key)
+
+    def get_margin_loan_details(self, **params):
+        return self.details("loan", self.call("get_margin_loan_details", params))
+
+    def get_margin_repay_details(self, **params):
+        return self.details("repay", self.call("get_margin_repay_details", params))
+
+    def details(self, kind, params):
+        with lock:
+            rows = [row for row in records.get((self.account, kind), [])
+                    if row['asset'] == params['asset'] and row['timestamp'] >= params.get('startTime', 0) and
+                    row.get('isolatedSymbol') == params.get('isolatedSymbol')]
+            return {"rows": list(reversed(rows)), "total": len(rows)}
+
+    # The stand-in has no streams, listen keys are accepted and never used
+    def stream_get_listen_key(self):
+        return "simulator"
+
+    def margin_stream_get_listen_key(self):
+        return "simulator"
+
+    def isolated_margin_stream_get_listen_key(self, symbol):
+        return "simulator"
+
+    def stream_keepalive(self, listen_key):
+        return {}
+
+    def margin_stream_keepalive(self, listen_key):
+        return {}
+
+    def isolated_margin_stream_keepalive(self, symbol, listen_key):
+        return {}
@@ -0,0 +1,83 @@
+import threading, time, json
+import websocket
+
+# Seconds to wait before reconnecting a dropped stream, doubled after every failed attempt up to the most,
+# and back to the first once a connection opens
+RECONNECT_DELAY = 1
+RECONNECT_DELAY_MAX = 60
+
+
+# A websocket connection kept open in a background thread, reconnecting whenever it drops
+class Stream:
+
+    def __init__(self, url, on_message, on_open=None, name="stream", on_close=None):
+        self.url = url
+        self.on_message = on_message
+        self.on_open = on_open
+        self.on_close = on_close
+        self.name = name
+        self.connected = False
+        self.closed = False
+        self.app = None
+        self.delay = RECONNECT_DELAY
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    # Start the background thread
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Send a JSON message, returns False if the stream isn't connected
+    def send(self, message):
+        if not self.connected:
+            return False
+        try:
+            self.app.send(json.dumps(message))
+            return True
+        except websocket.WebSocketException:
+            return False
+
+    # Close the connection for good
+    def close(self):
+        self.closed = True
+        if self.app is not None:
+            self.app.close()
+
+    # Connect, and keep reconnecting until closed
+    def run(self):
+        while not self.closed:
+            self.app = websocket.WebSocketApp(self.url,
+                                              on_open=self.opened,
+                                              on_message=self.received,
+                                              on_close=self.dropped,
+                                              on_error=self.failed)
+            self.app.run_forever(ping_interval=60, ping_timeout=10)
+            self.connected = False
+            if not self.closed:
+                time.sleep(self.delay)
+                self.delay = min(self.delay * 2, RECONNECT_DELAY_MAX)
+
+    def opened(self, app):
+        self.connected = True
+        self.delay = RECONNECT_DELAY
+        if self.on_open is not None:
+            self.on_open(self)
+
+    def received(self, app, message):
+        try:
+            self.on_message(json.loads(message))
+
+        # A bad message should never kill the connection
+        except Exception as e:
+            print(self.name + " message failed: " + str(e))
+
+    def dropped(self, app, status_code=None, message=None):
+        self.connected = False
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def failed(self, app, error):
+        self.connected = False
+        print(self.name + " error: " + str(error))
+        if self.on_close is not None:
+            self.on_close(self)
@@ -0,0 +1,45 @@
+import os, sys, threading, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config, accounts
+
+
+# Client answering with itself, so a call shows which copy made it
+class Client:
+
+    def whoami(self):
+        return self
+
+
+class MethodTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = config.ACCOUNTS[0]['name']
+        accounts.accounts.clear()
+        accounts.accounts[self.name] = {"name": self.name, "client": Client(), "equity_scale": 1.0}
+
+    def tearDown(self):
+        accounts.accounts.clear()
+
+    # A call handed to other threads is made with the copy of every thread calling it
+    def test_calls_use_the_copy_of_the_calling_thread(self):
+        whoami = accounts.method("whoami")
+        callers = {}
+
+        def call(caller):
+            callers[caller] = whoami()
+
+        threads = [threading.Thread(target=call, args=(caller,)) for caller in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsNot(callers[0], callers[1])
+        self.assertIsNot(whoami(), callers[0])
+        self.assertIs(whoami(), accounts.client())
+
+
+if __name__ == "__main__":
+    unittest.main()
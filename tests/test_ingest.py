@@ -0,0 +1,47 @@
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config, ingest
+
+
+# Make a signal without an id, so it's never checked for duplicates
+def signal(action):
+    return {"ticker": "BTCUSDT", "base_currency": "USDT",
+            "strategy": {"order_action": action, "market": "spot", "name": "test"}}
+
+
+class CoalesceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.window = config.COALESCE_WINDOW
+        ingest.windows.clear()
+
+    def tearDown(self):
+        config.COALESCE_WINDOW = self.window
+        ingest.windows.clear()
+
+    # Without a window, a signal admitted before an older one settles never supersedes it
+    def test_overlapping_signals_without_window_all_execute(self):
+        config.COALESCE_WINDOW = 0
+        buy, sell = signal("buy"), signal("sell")
+        first = ingest.admit(buy)
+        second = ingest.admit(sell)
+
+        self.assertTrue(ingest.settle(first, buy))
+        self.assertTrue(ingest.settle(second, sell))
+        self.assertEqual(ingest.windows, {})
+
+    # With a window, only the latest signal in it is executed
+    def test_overlapping_signals_in_window_keep_the_latest(self):
+        config.COALESCE_WINDOW = 0.05
+        buy, sell = signal("buy"), signal("sell")
+        first = ingest.admit(buy)
+        second = ingest.admit(sell)
+
+        self.assertFalse(ingest.settle(first, buy))
+        self.assertTrue(ingest.settle(second, sell))
+
+
+if __name__ == "__main__":
+    unittest.main()
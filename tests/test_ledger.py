@@ -0,0 +1,62 @@
+import os, sys, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ledger
+
+
+# Client answering the Spot wallet with the balances it's given, the first answer after a delay
+class SlowClient:
+
+    def __init__(self, answers, delay):
+        self.answers = list(answers)
+        self.delay = delay
+        self.calls = 0
+
+    def get_account(self):
+        self.calls += 1
+        free, locked = self.answers.pop(0)
+        if self.calls == 1:
+            time.sleep(self.delay)
+        return {"balances": [{"asset": "BTC", "free": str(free), "locked": str(locked)}]}
+
+
+class LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        for state in (ledger.balances, ledger.isolated, ledger.synced_at, ledger.updated_at):
+            state.clear()
+
+    tearDown = setUp
+
+    # A load sent before the orders were cancelled never overwrites one sent after
+    def test_older_load_is_dropped(self):
+        client = SlowClient([(0, 1), (1, 0)], delay=0.2)
+        slow = threading.Thread(target=ledger.load, args=(client, "SPOT"))
+        slow.start()
+        time.sleep(0.05)
+        ledger.load(client, "SPOT")
+        slow.join()
+
+        self.assertEqual(ledger.balances[ledger.wallet_of("SPOT")]['BTC']['free'], 1.0)
+        self.assertEqual(ledger.balances[ledger.wallet_of("SPOT")]['BTC']['locked'], 0.0)
+
+    # A load sent before a stream event never overwrites it
+    def test_load_older_than_stream_event_is_dropped(self):
+        client = SlowClient([(1, 0), (0, 1)], delay=0)
+        ledger.load(client, "SPOT")
+
+        client.calls = 0
+        client.delay = 0.2
+        slow = threading.Thread(target=ledger.load, args=(client, "SPOT"))
+        slow.start()
+        time.sleep(0.05)
+        ledger.apply(ledger.wallet_of("SPOT"), {"e": "outboundAccountPosition",
+                                                "B": [{"a": "BTC", "f": "1.0", "l": "0.0"}]})
+        slow.join()
+
+        self.assertEqual(ledger.balances[ledger.wallet_of("SPOT")]['BTC']['free'], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
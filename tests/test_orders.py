@@ -0,0 +1,56 @@
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from binance.exceptions import BinanceAPIException
+import orders
+
+
+# Exchange stand-in, create raises the given errors in turn and then answers, find answers with the given order
+class Exchange:
+
+    def __init__(self, errors, found=None):
+        self.errors = list(errors)
+        self.found = found
+        self.created = 0
+
+    def create(self, **params):
+        self.created += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"clientOrderId": params['newClientOrderId'], "status": "FILLED"}
+
+    def find(self, **params):
+        if self.found is None:
+            raise BinanceAPIException(None, 400, '{"code": -2013, "msg": "Order does not exist."}')
+        return self.found
+
+
+class PlaceTest(unittest.TestCase):
+
+    def place(self, exchange):
+        return orders.place(exchange.create, exchange.find, symbol="BTCUSDT", newClientOrderId="mbot-test")
+
+    # An order the exchange may have got is never sent again, even if the lookup doesn't find it
+    def test_timed_out_order_not_found_is_not_sent_again(self):
+        exchange = Exchange([requests.exceptions.ReadTimeout("read timed out")])
+        with self.assertRaises(orders.UnknownOutcome):
+            self.place(exchange)
+        self.assertEqual(exchange.created, 1)
+
+    # A timed out order that was placed stands in for the answer
+    def test_timed_out_order_found_is_returned(self):
+        exchange = Exchange([requests.exceptions.ReadTimeout("read timed out")], found={"status": "FILLED"})
+        self.assertEqual(self.place(exchange), {"status": "FILLED"})
+        self.assertEqual(exchange.created, 1)
+
+    # An order that couldn't be sent at all is sent again
+    def test_unsent_order_is_sent_again(self):
+        exchange = Exchange([requests.exceptions.ConnectTimeout("connect timed out")])
+        self.assertEqual(self.place(exchange)['status'], "FILLED")
+        self.assertEqual(exchange.created, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os, sys, unittest
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quantizer
+
+
+# Make the filters of a pair, with a LOT_SIZE step of 0.001 and a tick size of 0.01, and some more filters
+def filters(*more):
+    return [{"filterType": "LOT_SIZE", "minQty": "0.001", "maxQty": "9000", "stepSize": "0.00100000"},
+            {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000", "tickSize": "0.01000000"}] + \
+        list(more)
+
+
+class QuantityTest(unittest.TestCase):
+
+    # A zero MARKET_LOT_SIZE step means market orders use the LOT_SIZE step, with the market maximum
+    def test_market_lot_size_with_zero_step(self):
+        rules = quantizer.build(filters({"filterType": "MARKET_LOT_SIZE", "minQty": "0", "maxQty": "100",
+                                         "stepSize": "0.00000000"}))
+
+        self.assertEqual(quantizer.quantity(rules, 1.23456), Decimal("1.234"))
+        self.assertEqual(quantizer.quantity(rules, 500), Decimal("100"))
+        self.assertEqual(quantizer.quantity(rules, 500, market=False), Decimal("500"))
+
+        self.assertIsNone(quantizer.check(rules, Decimal("1.234")))
+        self.assertEqual(quantizer.check(rules, Decimal("1.2345")), "Filter failure: LOT_SIZE")
+        self.assertEqual(quantizer.check(rules, Decimal("101")), "Filter failure: LOT_SIZE")
+
+    # A MARKET_LOT_SIZE step of its own is used for market orders, and named when it fails
+    def test_market_lot_size_with_step(self):
+        rules = quantizer.build(filters({"filterType": "MARKET_LOT_SIZE", "minQty": "0", "maxQty": "100",
+                                         "stepSize": "0.10000000"}))
+
+        self.assertEqual(quantizer.quantity(rules, 1.23456), Decimal("1.2"))
+        self.assertEqual(quantizer.quantity(rules, 1.23456, market=False), Decimal("1.234"))
+        self.assertEqual(quantizer.check(rules, Decimal("1.25")), "Filter failure: MARKET_LOT_SIZE")
+
+
+class PriceTest(unittest.TestCase):
+
+    # Stop-losses of longs are sells rounded down, stop-losses of shorts are buys rounded up, away from the market
+    def test_stop_prices_snap_away_from_the_market(self):
+        rules = quantizer.build(filters())
+
+        self.assertEqual(quantizer.price(rules, 100.019, "SELL", rounding=ROUND_DOWN), Decimal("100.01"))
+        self.assertEqual(quantizer.price(rules, 100.011, "BUY", rounding=ROUND_UP), Decimal("100.02"))
+        self.assertEqual(quantizer.price(rules, 100.01, "BUY", rounding=ROUND_UP), Decimal("100.01"))
+
+    # Prices outside the band of their side are clamped to its edge, and snapped to stay inside it
+    def test_prices_clamp_to_the_band_of_their_side(self):
+        rules = quantizer.build(filters({"filterType": "PERCENT_PRICE_BY_SIDE", "avgPriceMins": 5,
+                                         "bidMultiplierUp": "1.1", "bidMultiplierDown": "0.9",
+                                         "askMultiplierUp": "1.2", "askMultiplierDown": "0.8"}))
+
+        # The sell band is 80.0024 to 120.0036
+        self.assertEqual(quantizer.price(rules, 70, "SELL", 100.003), Decimal("80.01"))
+        self.assertEqual(quantizer.price(rules, 130, "SELL", 100.003), Decimal("120.00"))
+
+        # The buy band is 90.0027 to 110.0033, rounding up at the top edge would leave it
+        self.assertEqual(quantizer.price(rules, 120, "BUY", 100.003, ROUND_UP), Decimal("110.00"))
+        self.assertEqual(quantizer.price(rules, 85, "BUY", 100.003), Decimal("90.01"))
+
+        # Inside the band nothing is clamped
+        self.assertEqual(quantizer.price(rules, 115.555, "SELL", 100.003), Decimal("115.55"))
+
+
+class CheckTest(unittest.TestCase):
+
+    # A minimum notional that doesn't apply to market orders only stops limit orders
+    def test_notional_not_applied_to_market_orders(self):
+        rules = quantizer.build(filters({"filterType": "NOTIONAL", "minNotional": "10", "maxNotional": "50",
+                                         "applyMinToMarket": False, "applyMaxToMarket": False,
+                                         "avgPriceMins": 5}))
+
+        self.assertIsNone(quantizer.check(rules, Decimal("0.001"), 100))
+        self.assertEqual(quantizer.check(rules, Decimal("0.001"), 100, market=False), "Filter failure: NOTIONAL")
+
+        self.assertIsNone(quantizer.check(rules, Decimal("1"), 100))
+        self.assertEqual(quantizer.check(rules, Decimal("1"), 100, market=False), "Filter failure: NOTIONAL")
+
+        self.assertIsNone(quantizer.check(rules, Decimal("0.2"), 100, market=False))
+
+    # A minimum notional applied to market orders stops them too
+    def test_notional_applied_to_market_orders(self):
+        rules = quantizer.build(filters({"filterType": "NOTIONAL", "minNotional": "10", "applyMinToMarket": True}))
+
+        self.assertEqual(quantizer.check(rules, Decimal("0.001"), 100), "Filter failure: NOTIONAL")
+        self.assertIsNone(quantizer.check(rules, Decimal("0.001")))
+
+
+if __name__ == "__main__":
+    unittest.main()
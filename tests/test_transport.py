@@ -0,0 +1,56 @@
+import os, sys, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import HTTPAdapter
+import config, accounts, transport
+
+
+# Answer every call with an empty JSON object, and remember the timeout the adapter was given
+def answer(timeouts):
+    def send(adapter, request, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"{}"
+        response.url = request.url
+        response.request = request
+        return response
+    return send
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hosts = config.API_HOSTS
+        config.API_HOSTS = []
+        accounts.accounts.clear()
+
+    def tearDown(self):
+        config.API_HOSTS = self.hosts
+        accounts.accounts.clear()
+
+    # The exchange client sends every call with a timeout of its own, it has to be the configured one
+    def test_exchange_calls_use_configured_timeout(self):
+        timeouts = []
+        with mock.patch.object(HTTPAdapter, "send", answer(timeouts)):
+            accounts.load(config.ACCOUNTS[0]['name'])
+            accounts.accounts[config.ACCOUNTS[0]['name']]['client'].get_server_time()
+
+        self.assertEqual(len(timeouts), 2)
+        for timeout in timeouts:
+            self.assertEqual(timeout, (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT))
+
+    # Calls sent without a timeout get the configured one from the adapter
+    def test_calls_without_timeout_use_configured_timeout(self):
+        timeouts = []
+        with mock.patch.object(HTTPAdapter, "send", answer(timeouts)):
+            transport.session.get("https://discord.com/api/v9/channels")
+
+        self.assertEqual(timeouts, [(config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)])
+
+
+if __name__ == "__main__":
+    unittest.main()
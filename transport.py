@@ -0,0 +1,164 @@
+import threading, time, config, requests, metrics, governor, endpoints
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# HTTP/2 is only used for the reports, and only if httpx is installed with HTTP/2 support
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+lock = threading.Lock()
+
+# Discord doesn't count against the exchange rate limits
+discord_host = requests.utils.urlparse(config.DISCORD_LINK).netloc
+
+# Requests sent per host
+sent = {}
+
+
+# Connection pool adapter with default timeouts and request counting
+class PooledAdapter(HTTPAdapter):
+
+    def send(self, request, timeout=None, **kwargs):
+        # Never wait forever on the exchange or Discord, the exchange clients pass their own from accounts.load
+        if timeout is None:
+            timeout = (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+
+        # Calls to the exchange go to the fastest healthy host
+        url = requests.utils.urlparse(request.url)
+        if url.netloc != discord_host and endpoints.managed(url):
+            return self.send_routed(request, timeout, **kwargs)
+        return self.send_once(request, timeout, **kwargs)
+
+    # Send a call to the preferred host, and to the next one right away if the host couldn't answer
+    # Only reads and cancels, and calls that surely never reached the host, are sent again,
+    # so an order or loan is never placed twice
+    def send_routed(self, request, timeout, **kwargs):
+        endpoints.start()
+        tried = []
+        netloc = endpoints.choose()
+        while True:
+            request.url = endpoints.reroute(request.url, netloc)
+            tried.append(netloc)
+            try:
+                response = self.send_once(request, timeout, **kwargs)
+
+            # The host can't be reached, or didn't answer
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                replacement = endpoints.fail_over(netloc, tried)
+                if replacement is None or not (request.method != "POST" or unsent(e)):
+                    raise
+                netloc = replacement
+                continue
+
+            # The host is overloaded
+            if response.status_code >= 500 and request.method != "POST":
+                replacement = endpoints.fail_over(netloc, tried)
+                if replacement is not None:
+                    netloc = replacement
+                    continue
+
+            endpoints.record(netloc, response.status_code < 500)
+            return response
+
+    # Send a call to the host in its address
+    def send_once(self, request, timeout, **kwargs):
+        url = requests.utils.urlparse(request.url)
+        with lock:
+            sent[url.netloc] = sent.get(url.netloc, 0) + 1
+
+        endpoint = request.method + " " + url.path
+        exchange = url.netloc != discord_host
+
+        # Wait for rate limit headroom on the exchange
+        if exchange:
+            governor.acquire(endpoint)
+
+        metrics.count("exchange_calls_total", endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, timeout=timeout, **kwargs)
+        finally:
+            metrics.observe("exchange_call_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+        # Track the rate limits from the response
+        if exchange:
+            governor.update(response.status_code, response.headers)
+
+        return response
+
+
+# Check if a call failed before it was sent, because no connection could be made
+def unsent(error):
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+# A single adapter, so every session shares the same per-host connection pools
+adapter = PooledAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS,
+                        pool_maxsize=config.HTTP_POOL_SIZE,
+                        pool_block=False)
+
+# Session for everything that isn't the Binance client
+session = requests.Session()
+
+http2_client = None
+
+
+# *********************************************************************************************
+# FUNCTIONS
+# *********************************************************************************************
+
+
+# Route a session through the shared connection pools
+def mount(target):
+    target.mount("https://", adapter)
+    target.mount("http://", adapter)
+    return target
+
+
+# Send a POST request, over HTTP/2 if it's enabled and available
+def post(url, **kwargs):
+    global http2_client
+
+    if config.HTTP2 and httpx is not None:
+        if http2_client is None:
+            try:
+                http2_client = httpx.Client(http2=True,
+                                            timeout=httpx.Timeout(config.HTTP_READ_TIMEOUT,
+                                                                  connect=config.HTTP_CONNECT_TIMEOUT),
+                                            limits=httpx.Limits(max_keepalive_connections=config.HTTP_POOL_SIZE))
+
+            # The h2 package is missing
+            except ImportError:
+                config.HTTP2 = False
+                return session.post(url, **kwargs)
+
+        host = requests.utils.urlparse(url).netloc
+        with lock:
+            sent[host] = sent.get(host, 0) + 1
+        return http2_client.post(url, **kwargs)
+
+    return session.post(url, **kwargs)
+
+
+# Connections opened and requests sent per host, more requests than connections means they are reused
+def stats():
+    result = {}
+    pools = adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools[key]
+        result[pool.host] = {"connections_opened": pool.num_connections,
+                             "requests": pool.num_requests,
+                             "idle": pool.pool.qsize() if pool.pool is not None else 0}
+
+    for host, count in list(sent.items()):
+        result.setdefault(host.split(":")[0], {})['sent'] = count
+
+    return result
+
+
+mount(session)